@@ -1,11 +1,17 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
 import os
+import re
 import subprocess
+import threading
 import json
 import time
 import shutil
 import zipfile
 import hashlib
+import struct
+import sys
+import zlib
 
 try:
     import requests
@@ -18,22 +24,147 @@ except ImportError:
     import tqdm
 
 
+# Electron SDK 镜像，可用 --mirror 替换
+MIRRORS = [
+    "https://npmmirror.com/mirrors/electron/{version}/electron-v{version}-{system}-{arch}.zip",
+    "https://ghproxy.cn/https://github.com/electron/electron/releases/download/v{version}/electron-v{version}-{system}-{arch}.zip",
+    "https://github.com/electron/electron/releases/download/v{version}/electron-v{version}-{system}-{arch}.zip",
+]
+SHASUMS_URL = "https://cdn.npmmirror.com/binaries/electron/{version}/SHASUMS256.txt"
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# 已经压缩过的格式，打包时直接存储
+STORED_EXTS = {
+    ".mp3", ".mp4", ".ogg", ".webm", ".jpg", ".jpeg", ".png", ".gif", ".webp",
+    ".woff", ".woff2", ".zip", ".gz", ".br", ".7z",
+}  # fmt: skip
+ZIP_CACHE = ".cache/zip"  # 压缩后的条目，按内容的 SHA-256 存放
+ZIP_LEVEL = 6  # 与 zipfile 默认的压缩级别一致
+ENTRY_HEADER = struct.Struct(">IQ")  # 缓存文件头: CRC32, 原始大小
+# 直接写入缓存中的压缩数据要用到 ZipFile 的内部属性 fp、filelist、NameToInfo、start_dir，
+# 只在验证过的 CPython 3.8 - 3.13 上这样做，其他版本退回 ZipFile.write 重新压缩
+ZIP_RAW_VERSIONS = ((3, 8), (3, 13))
+_zip_used = set()  # 本次构建中用到的缓存文件，见 prune_zip_cache
+
+
+def compress_entry(src, dst, level=ZIP_LEVEL, chunk_size=1024 * 1024):
+    """
+    把 src 压缩为 zip 使用的原始 deflate 数据，连同 CRC 和原始大小写入缓存文件 dst
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    crc = size = 0
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    with open(src, "rb") as f, open(tmp, "wb") as out:
+        out.write(ENTRY_HEADER.pack(0, 0))
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            out.write(compressor.compress(chunk))
+        out.write(compressor.flush())
+        out.seek(0)
+        out.write(ENTRY_HEADER.pack(crc, size))
+    os.replace(tmp, dst)
+
+
+def pack(src_dir, output, workers=None):
+    """
+    把 src_dir 打包为 zip
+
+    已压缩的格式直接存储；其余文件先按 SHA-256 查找 ZIP_CACHE，未命中的在进程池中压缩，
+    最后按顺序把压缩好的数据写入 zip，内容未变的文件在下次构建时不再压缩；
+    不在 ZIP_RAW_VERSIONS 范围内的 Python 上不使用缓存，由 ZipFile.write 压缩
+    """
+    files = []
+    for root, dirs, names in os.walk(src_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append((path, os.path.relpath(path, src_dir)))
+    deflate = [
+        path
+        for path, _ in files
+        if os.path.splitext(path)[1].lower() not in STORED_EXTS
+    ]
+    with ThreadPoolExecutor() as pool:
+        digests = dict(zip(deflate, pool.map(sha256_file, deflate)))
+
+    def cache_path(digest):
+        return os.path.join(ZIP_CACHE, digest[:2], f"{digest}.{ZIP_LEVEL}")
+
+    raw = ZIP_RAW_VERSIONS[0] <= sys.version_info[:2] <= ZIP_RAW_VERSIONS[1]
+    missing = {}
+    if raw:
+        for path, digest in digests.items():
+            _zip_used.add(cache_path(digest))
+            if not os.path.exists(cache_path(digest)):
+                missing.setdefault(digest, path)
+    if missing:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(compress_entry, path, cache_path(digest))
+                for digest, path in missing.items()
+            ]
+            for future in futures:
+                future.result()
+
+    with zipfile.ZipFile(output + ".tmp", "w") as zip_ref:
+        for path, arcname in files:
+            if path not in digests:
+                zip_ref.write(path, arcname, zipfile.ZIP_STORED)
+                continue
+            if not raw:
+                zip_ref.write(path, arcname, zipfile.ZIP_DEFLATED, ZIP_LEVEL)
+                continue
+            # zipfile 没有写入已压缩数据的接口，按 ZipFile.write 的方式直接写入本地文件头和数据
+            zinfo = zipfile.ZipInfo.from_file(path, arcname)
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            with open(cache_path(digests[path]), "rb") as f:
+                zinfo.CRC, zinfo.file_size = ENTRY_HEADER.unpack(
+                    f.read(ENTRY_HEADER.size)
+                )
+                zinfo.compress_size = (
+                    os.fstat(f.fileno()).st_size - ENTRY_HEADER.size
+                )
+                zinfo.header_offset = zip_ref.fp.tell()
+                zip_ref.fp.write(zinfo.FileHeader())
+                shutil.copyfileobj(f, zip_ref.fp, 1024 * 1024)
+            zip_ref.filelist.append(zinfo)
+            zip_ref.NameToInfo[zinfo.filename] = zinfo
+            zip_ref.start_dir = zip_ref.fp.tell()
+    os.replace(output + ".tmp", output)
+
+
+def prune_zip_cache():
+    """
+    删除 ZIP_CACHE 中本次构建没有用到的条目，在所有 pack 完成后调用，
+    本次构建没有用到缓存时不做任何事
+    """
+    if not _zip_used or not os.path.isdir(ZIP_CACHE):
+        return
+    for root, dirs, names in os.walk(ZIP_CACHE, topdown=False):
+        for name in names:
+            path = os.path.join(root, name)
+            if path not in _zip_used:
+                os.remove(path)
+        if root != ZIP_CACHE and not os.listdir(root):
+            os.rmdir(root)
+
+
 @dataclass
 class Target:
     system: str
     arch: str
     version: str
     name: str
-    url_list: list = field(default_factory=list)
-
-    def __post_init__(self):
-        self.url_list.extend(
-            [
-                "https://npmmirror.com/mirrors/electron/{version}/electron-v{version}-{system}-{arch}.zip",
-                "https://ghproxy.cn/https://github.com/electron/electron/releases/download/v{version}/electron-v{version}-{system}-{arch}.zip",
-                "https://github.com/electron/electron/releases/download/v{version}/electron-v{version}-{system}-{arch}.zip",
-            ]
-        )
+    url_list: list = field(default_factory=lambda: list(MIRRORS))
 
     def __str__(self):
         return f"{self.name}-{self.arch}-{self.version}"
@@ -64,15 +195,24 @@ class ProjectInfo:
 class Builer:
     MAX_RETRIES = 3  # 最大重试次数
     RETRY_DELAY = 0.5  # 重试间隔（秒）
+    TIMEOUT = 10  # 连接和读取超时（秒）
+    CHUNK_SIZE = 1024 * 1024  # 下载缓冲区大小
+    PROBE_SIZE = 256 * 1024  # 镜像测速时下载的字节数
+    PROBE_TIMEOUT = 5  # 镜像测速的最长时间（秒）
+    MANIFEST = ".cache/manifest.json"  # 已校验文件的大小、修改时间和 SHA-256
 
     def __init__(self, args):
         self.args = args
         self.default_version = self.args.default_version
+        self.mirrors = getattr(args, "mirror", None) or MIRRORS
+        self.shasums_url = getattr(args, "shasums_url", None) or SHASUMS_URL
         self.cname = {
             "win7": "win32",
             "win": "win32",
         }
         self.sha256sum = {}
+        self.manifest = self.load_manifest()
+        self.manifest_lock = threading.Lock()
         self.targets = self.make_target()
         self.info = ProjectInfo()
 
@@ -84,30 +224,126 @@ class Builer:
                 v = "22.3.27"
             else:
                 v = self.default_version
-            return [Target(system, arch, v, name)]
+            return [Target(system, arch, v, name, list(self.mirrors))]
 
         return [
-            Target("win32", "x64", self.default_version, "win"),  # Windows x64
-            Target("win32", "ia32", "22.3.27", "win7"),  # Windows x86 兼容版
+            # Windows x64
+            Target("win32", "x64", self.default_version, "win", list(self.mirrors)),
+            # Windows x86 兼容版
+            Target("win32", "ia32", "22.3.27", "win7", list(self.mirrors)),
         ]
 
-    def download_file(self, target: Target, r: requests.Response):
-        # 获取文件大小
-        total_size = int(r.headers.get("content-length", 0))
+    def probe(self, url):
+        """
+        下载 url 的前 PROBE_SIZE 字节，返回速度（字节/秒），失败时返回 None
+        """
+        start = time.perf_counter()
+        received = 0
+        try:
+            with requests.get(
+                url,
+                headers={"Range": f"bytes=0-{self.PROBE_SIZE - 1}"},
+                stream=True,
+                timeout=self.PROBE_TIMEOUT,
+            ) as r:
+                if r.status_code not in (200, 206):
+                    return None
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if (
+                        received >= self.PROBE_SIZE
+                        or time.perf_counter() - start > self.PROBE_TIMEOUT
+                    ):
+                        break
+        except requests.RequestException:
+            return None
+        if not received:
+            return None
+        return received / max(time.perf_counter() - start, 1e-6)
+
+    def rank_mirrors(self, target):
+        """
+        同时对所有镜像测速，按速度从快到慢排列，失败的放在最后
+        """
+        urls = list(target.make_url())
+        if len(urls) <= 1:
+            return urls
+        with ThreadPoolExecutor(len(urls)) as pool:
+            speeds = list(pool.map(self.probe, urls))
+        ranked = sorted(
+            zip(urls, speeds), key=lambda x: -x[1] if x[1] is not None else 0
+        )
+        for url, speed in ranked:
+            if speed is None:
+                print(f"{target} mirror failed: {url}")
+            else:
+                print(f"{target} mirror {speed / 1024 / 1024:.2f} MB/s: {url}")
+        return [url for url, _ in ranked]
 
-        # 创建缓存目录（如果不存在）
-        os.makedirs(".cache", exist_ok=True)
+    def download_file(self, target: Target, url: str, position: int = 0):
+        """
+        下载到 .part 文件，已有部分时用 Range 续传，完整后改名
 
+        边下载边计算 SHA-256，完成时返回摘要并记入清单，未完成时返回 None
+        """
         file_path = f".cache/ele-{target}.zip"
-        with open(file_path, "wb") as f, tqdm.tqdm(
-            total=total_size, unit="B", unit_scale=True
-        ) as pbar:
-            for chunk in r.iter_content(chunk_size=1024):
-                if chunk:
+        part_path = file_path + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        h = hashlib.sha256()
+
+        with requests.get(
+            url, headers=headers, stream=True, timeout=self.TIMEOUT
+        ) as r:
+            if r.status_code == 416:
+                # 部分文件比服务器上的还大，丢弃重新下载
+                os.remove(part_path)
+                return None
+            if r.status_code == 206:
+                match = re.match(
+                    r"bytes (\d+)-\d+/(\d+)", r.headers.get("content-range", "")
+                )
+                if match is None or int(match.group(1)) != offset:
+                    os.remove(part_path)
+                    return None
+                total_size = int(match.group(2))
+                # 续传时先补上已下载部分的摘要
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                        h.update(chunk)
+            elif r.status_code == 200:
+                # 服务器不支持 Range，从头下载
+                offset = 0
+                total_size = int(r.headers.get("content-length", 0))
+            else:
+                print(
+                    f"Error downloading from {url}, status code: {r.status_code}"
+                )
+                return None
+
+            if offset:
+                print(f"{target} resuming from {offset} bytes")
+            with open(part_path, "ab" if offset else "wb") as f, tqdm.tqdm(
+                total=total_size,
+                initial=offset,
+                unit="B",
+                unit_scale=True,
+                desc=str(target),
+                position=position,
+            ) as pbar:
+                for chunk in r.iter_content(chunk_size=self.CHUNK_SIZE):
                     f.write(chunk)
+                    h.update(chunk)
                     pbar.update(len(chunk))
 
-    def download_target(self, target):
+        if total_size and os.path.getsize(part_path) < total_size:
+            return None
+        os.replace(part_path, file_path)
+        digest = h.hexdigest()
+        self.record_digest(target, digest)
+        return digest
+
+    def download_target(self, target, position=0):
         file_path = f".cache/ele-{target}.zip"
         if os.path.exists(file_path):
             print(f"{target} SDK already exists, checking integrity...")
@@ -122,69 +358,125 @@ class Builer:
 
         print(f"Downloading {target} SDK ...")
 
-        for url in target.make_url():
+        for url in self.rank_mirrors(target):
 
             for attempt in range(self.MAX_RETRIES):
                 try:
-                    r = requests.get(url, stream=True, timeout=5)
-                    if r.status_code == 200:  # 请求成功
-                        self.download_file(target, r)
+                    digest = self.download_file(target, url, position)
+                    if digest is not None:
                         # 进行校验
                         if not self.args.no_check:
-                            if not self.check_file(target):
+                            if not self.check_file(target, digest):
                                 print(
                                     f"{target} SDK integrity check failed, redownloading..."
                                 )
-                                break  # 重新开始下载循环
+                                os.remove(file_path)
+                                break  # 换下一个镜像
                         print(f"{target} SDK downloaded successfully.")
                         return
-                    else:
-                        print(
-                            f"Error downloading from {url}, status code: {r.status_code}"
-                        )
                 except requests.RequestException as e:
+                    # 已下载的部分保留在 .part 文件中，重试时续传
                     print(f"Request failed: {e}")
-                finally:
-                    r.close()
 
                 # 如果请求失败，等待一段时间后重试
                 if attempt < self.MAX_RETRIES - 1:
                     print(f"Retrying in {self.RETRY_DELAY} seconds...")
                     time.sleep(self.RETRY_DELAY)
 
+        print(f"Failed to download {target} SDK.")
+        exit(1)
+
     def download(self):
-        for target in self.targets:
-            self.download_target(target)
+        # 各目标同时下载
+        os.makedirs(".cache", exist_ok=True)
+        with ThreadPoolExecutor(len(self.targets)) as pool:
+            futures = [
+                pool.submit(self.download_target, target, i)
+                for i, target in enumerate(self.targets)
+            ]
+            for future in futures:
+                future.result()
+
+    def load_manifest(self):
+        try:
+            with open(self.MANIFEST) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def record_digest(self, target, digest):
+        """
+        把文件的大小、修改时间和摘要写入清单，之后文件未变时不再重新计算
+        """
+        st = os.stat(os.path.join(".cache", target.get_save_name()))
+        with self.manifest_lock:
+            self.manifest[target.get_save_name()] = {
+                "size": st.st_size,
+                "mtime": st.st_mtime_ns,
+                "sha256": digest,
+            }
+            os.makedirs(".cache", exist_ok=True)
+            with open(self.MANIFEST + ".tmp", "w") as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(self.MANIFEST + ".tmp", self.MANIFEST)
+
+    def file_digest(self, target):
+        """
+        计算已下载 SDK 的 SHA-256，大小和修改时间与清单一致时直接使用记录的值
+        """
+        path = os.path.join(".cache", target.get_save_name())
+        st = os.stat(path)
+        entry = self.manifest.get(target.get_save_name())
+        if (
+            entry is not None
+            and entry["size"] == st.st_size
+            and entry["mtime"] == st.st_mtime_ns
+        ):
+            return entry["sha256"]
 
-    def check_file(self, target):
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            with tqdm.tqdm(total=st.st_size, unit="B", unit_scale=True) as pbar:
+                for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    pbar.update(len(chunk))
+        digest = h.hexdigest()
+        self.record_digest(target, digest)
+        return digest
+
+    def check_file(self, target, digest=None):
+        """
+        校验 SDK 的 SHA-256，digest 为下载时已算出的摘要
+        """
         print(f"Checking {target}...")
         v_hash = self.sha256sum.get(target.version)
         if v_hash is None:
             print("No hash found for version.", target)
             exit(1)
-        hash_value = v_hash[target.get_file_name()]
-
-        h = hashlib.sha256()
-        with open(os.path.join(".cache", target.get_save_name()), "rb") as f:
-            size = os.stat(os.path.join(".cache", target.get_save_name())).st_size
-            with tqdm.tqdm(total=size, unit="B", unit_scale=True) as pbar:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    h.update(chunk)
-                    pbar.update(len(chunk))
+        hash_value = v_hash.get(target.get_file_name())
+        if digest is None:
+            digest = self.file_digest(target)
 
         # 校验哈希值
-        is_valid = h.hexdigest() == hash_value
+        is_valid = digest == hash_value
         if not is_valid:
-            print(
-                f"{target} SDK hash mismatch. Expected: {hash_value}, Got: {h.hexdigest()}"
-            )
+            print(f"{target} SDK hash mismatch. Expected: {hash_value}, Got: {digest}")
         return is_valid
 
+    def parse_sha256sum(self, text):
+        """
+        解析 SHASUMS256.txt，每行为 "<摘要> *<文件名>"
+        """
+        sums = {}
+        for line in text.splitlines():
+            digest, sep, name = line.partition(" *")
+            if sep:
+                sums[name.strip()] = digest.strip()
+        return sums
+
     def download_sha256sum(self):
         print("Downloading SHA256SUMS...")
-        url_temp = (
-            "https://cdn.npmmirror.com/binaries/electron/{version}/SHASUMS256.txt"
-        )
+        url_temp = self.shasums_url
         versions = []
         for t in self.targets:
             if t.version in versions:
@@ -192,7 +484,14 @@ class Builer:
             versions.append(t.version)
 
         for v in versions:
-            self.sha256sum[v] = {}
+            if v in self.sha256sum:
+                continue
+            # 解析结果缓存为 JSON，之后直接读取
+            json_path = f".cache/SHASUMS256_{v}.json"
+            if os.path.exists(json_path):
+                with open(json_path) as f:
+                    self.sha256sum[v] = json.load(f)
+                continue
             if os.path.exists(f".cache/SHASUMS256_{v}.txt"):
                 print(f"{v} SHA256SUMS already exists, skipping...")
                 with open(f".cache/SHASUMS256_{v}.txt") as f:
@@ -200,13 +499,14 @@ class Builer:
             else:
                 print(f"Downloading {v} SHA256SUMS...")
                 url = url_temp.format(version=v)
-                r = requests.get(url)
+                r = requests.get(url, timeout=self.TIMEOUT)
+                r.raise_for_status()
                 text = r.text
                 with open(f".cache/SHASUMS256_{v}.txt", "w") as f:
                     f.write(text)
-            for i in text.split("\n"):
-                i_list = i.split(" *")
-                self.sha256sum[v][i_list[1]] = i_list[0]
+            self.sha256sum[v] = self.parse_sha256sum(text)
+            with open(json_path, "w") as f:
+                json.dump(self.sha256sum[v], f)
 
     def check(self):
         for target in self.targets:
@@ -271,17 +571,11 @@ class Builer:
 
     def make_zip(self, target):
         print("Making zip...")
-        build_dir = os.path.join("build", str(target))
-        with zipfile.ZipFile(
+        pack(
+            os.path.join("build", str(target)),
             f"dist/{self.info.name}-{self.info.version}-{target.name}-{target.arch}.zip",
-            "w",
-        ) as zip_ref:
-            for root, dirs, files in os.walk(build_dir):
-                for file in files:
-                    zip_ref.write(
-                        os.path.join(root, file),
-                        os.path.relpath(os.path.join(root, file), build_dir),
-                    )
+            getattr(self.args, "zip_workers", None),
+        )
 
     def make_asar(self):
         print("Making asar...")
@@ -295,16 +589,7 @@ class Builer:
                 "{*.mp3,*.woff2,*.mp4}",
             ]
         )
-        with zipfile.ZipFile(
-            f"dist/asar.zip",
-            "w",
-        ) as zip_ref:
-            for root, dirs, files in os.walk("build/asar"):
-                for file in files:
-                    zip_ref.write(
-                        os.path.join(root, file),
-                        os.path.relpath(os.path.join(root, file), "build/asar"),
-                    )
+        pack("build/asar", "dist/asar.zip", getattr(self.args, "zip_workers", None))
 
     def copy_asar(self, target):
         with zipfile.ZipFile("dist/asar.zip", "r") as zip_ref:
@@ -350,65 +635,291 @@ class Builer:
 
 
 class HtmlBuiler:
+    MANIFEST = ".cache/html-manifest.json"  # 文件 -> 已计算的大小、修改时间和 SHA-256
+    ARCHIVE = ".cache/archive"  # 历史版本: objects 中按 SHA-256 存放文件，versions 中为各版本的文件列表
+    PATCHES = "dist/patches"  # 旧版本到当前版本的补丁和 index.json
+    KEEP_VERSIONS = 5  # 为最近几个旧版本生成直接补丁
+
     def __init__(self, args):
         self.args = args
+        self.manifest = {}
+
+    def load_manifest(self):
+        try:
+            with open(self.MANIFEST) as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.manifest = {}
+
+    def lookup(self, f, size, mtime):
+        for entry in self.manifest.get(f, []):
+            if entry["size"] == size and entry["mtime"] == mtime:
+                return entry["sha256"]
+        return None
+
+    def save_manifest(self, *trees):
+        """
+        只保留与本次扫描结果一致的记录；清单按相对路径记录，不区分 html 和 html.old，
+        build 用 copytree 复制 html 时保留修改时间，下次构建的 html.old 可以直接使用本次 html 的记录
+        """
+        manifest = {}
+        for files in trees:
+            for f, (size, mtime) in files.items():
+                digest = self.lookup(f, size, mtime)
+                if digest is None:
+                    continue
+                entry = {"size": size, "mtime": mtime, "sha256": digest}
+                entries = manifest.setdefault(f, [])
+                if entry not in entries:
+                    entries.append(entry)
+        os.makedirs(".cache", exist_ok=True)
+        with open(self.MANIFEST + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(self.MANIFEST + ".tmp", self.MANIFEST)
+        self.manifest = manifest
+
+    @staticmethod
+    def scan(tree):
+        """
+        返回 相对路径 -> (大小, 修改时间)
+        """
+        files = {}
+        for root, dirs, names in os.walk(tree):
+            for name in names:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                files[os.path.relpath(path, tree)] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    def digests(self, tree, files, paths):
+        """
+        计算 tree 中 paths 的 SHA-256，大小和修改时间与清单一致时直接使用记录的值
+        """
+        out, todo = {}, []
+        for f in paths:
+            digest = self.lookup(f, *files[f])
+            if digest is not None:
+                out[f] = digest
+            else:
+                todo.append(f)
+        # hashlib 在计算大块数据时释放 GIL
+        with ThreadPoolExecutor() as pool:
+            hashes = pool.map(lambda f: sha256_file(os.path.join(tree, f)), todo)
+            for f, digest in zip(todo, hashes):
+                out[f] = digest
+                size, mtime = files[f]
+                self.manifest.setdefault(f, []).append(
+                    {"size": size, "mtime": mtime, "sha256": digest}
+                )
+        return out
 
     def make_diff(self):
-        import bsdiff4
-
         print("Making diff...")
-        os.makedirs("build/diff", exist_ok=True)
-        old_file = []
         out = {"delfile": [], "addfile": [], "modfile": []}
 
-        for root, dirs, files in os.walk("html.old"):
-            for file in files:
-                old_file.append(os.sep.join(os.path.join(root, file).split(os.sep)[1:]))
-
-        for root, dirs, files in os.walk("html"):
-            for file in files:
-                f = os.sep.join(os.path.join(root, file).split(os.sep)[1:])
-                if f in old_file:
-                    with open(os.path.join("html.old", f), "rb") as f1:
-                        old_md5 = hashlib.md5(f1.read()).hexdigest()
-                    with open(os.path.join("html", f), "rb") as f2:
-                        new_md5 = hashlib.md5(f2.read()).hexdigest()
-
-                    if old_md5 != new_md5:
-                        out["modfile"].append(f)
-
-                    old_file.remove(f)
+        self.load_manifest()
+        old_files = self.scan("html.old")
+        new_files = self.scan("html")
+        common = new_files.keys() & old_files.keys()
+        out["addfile"] = sorted(new_files.keys() - old_files.keys())
+        out["delfile"] = sorted(old_files.keys() - new_files.keys())
+
+        # 大小不同一定修改过，大小和修改时间都相同视为未修改，其余的比较 SHA-256
+        modified = {f for f in common if new_files[f][0] != old_files[f][0]}
+        unsure = [
+            f for f in common if f not in modified and new_files[f] != old_files[f]
+        ]
+        old_sha = self.digests("html.old", old_files, unsure)
+        # 新增和修改的文件都需要 SHA-256 用于应用补丁后的校验
+        new_sha = self.digests(
+            "html", new_files, out["addfile"] + sorted(modified) + unsure
+        )
+        modified.update(f for f in unsure if old_sha[f] != new_sha[f])
+        out["modfile"] = sorted(modified)
+        # 补丁应用后逐个文件校验
+        out["sha256"] = {f: new_sha[f] for f in out["addfile"] + out["modfile"]}
+        self.save_manifest(old_files, new_files)
+
+        self.write_patch(
+            out, lambda f: os.path.join("html.old", f), "build/diff", "dist/diff.zip"
+        )
 
-                elif not os.path.exists(os.path.join("html.old", f)):
-                    out["addfile"].append(f)
+    def write_patch(self, out, old_path, work, output):
+        """
+        生成补丁 zip: diff.json、修改文件的二进制补丁和新增文件
 
-                    os.makedirs(
-                        os.path.dirname(os.path.join("build/diff", f)), exist_ok=True
-                    )
-                    shutil.copy(os.path.join("html", f), os.path.join("build/diff", f))
-                    # old_file.remove(f)
-        out["delfile"] = old_file
+        Args:
+            out: diff.json 的内容，包含 addfile、modfile、delfile 和 sha256
+            old_path: 文件 -> 旧版本文件的路径
+            work: 存放 diff.json 和二进制补丁的临时目录
+            output: 补丁 zip 的路径
+        """
+        import bsdiff4
 
-        with open("build/diff/diff.json", "w") as f:
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work, exist_ok=True)
+        diff_format = getattr(self.args, "diff_format", None) or "bsdiff"
+        out["diff_format"] = diff_format
+        with open(os.path.join(work, "diff.json"), "w") as f:
             json.dump(out, f)
 
-        for f in out["addfile"]:
-            os.makedirs(os.path.dirname(os.path.join("build/diff", f)), exist_ok=True)
-            shutil.copy(os.path.join("html", f), os.path.join("build/diff", f))
+        if diff_format == "chunked":
+            # 与 python/patch.py 共用分块差分格式
+            sys.path.insert(
+                0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python")
+            )
+            import chunkdiff
+
+            file_diff = chunkdiff.diff_file
+        else:
+            file_diff = bsdiff4.file_diff
+
+        # bsdiff 是单线程的，多个文件在进程池中同时计算
+        workers = getattr(self.args, "diff_workers", None)
+        with ProcessPoolExecutor(workers) as pool:
+            futures = []
+            for f in out["modfile"]:
+                os.makedirs(os.path.dirname(os.path.join(work, f)), exist_ok=True)
+                futures.append(
+                    pool.submit(
+                        file_diff,
+                        old_path(f),
+                        os.path.join("html", f),
+                        os.path.join(work, f + ".diff"),
+                    )
+                )
+            for future in futures:
+                future.result()
+
+        # 新增文件直接从 html 写入 zip，不再复制到临时目录
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        with zipfile.ZipFile(output + ".tmp", "w") as zip_ref:
+            zip_ref.write(os.path.join(work, "diff.json"), "diff.json")
+            for f in out["modfile"]:
+                zip_ref.write(os.path.join(work, f + ".diff"), f + ".diff")
+            for f in out["addfile"]:
+                zip_ref.write(os.path.join("html", f), f)
+        os.replace(output + ".tmp", output)
+
+    def object_path(self, digest):
+        return os.path.join(self.ARCHIVE, "objects", digest[:2], digest)
+
+    def load_versions(self):
+        """
+        返回已归档的版本，按归档时间排序
+        """
+        versions = []
+        root = os.path.join(self.ARCHIVE, "versions")
+        for name in os.listdir(root) if os.path.isdir(root) else []:
+            if name.endswith(".json"):
+                with open(os.path.join(root, name)) as f:
+                    versions.append(json.load(f))
+        return sorted(versions, key=lambda v: v["time"])
+
+    def archive(self, version, files):
+        """
+        把 html 存入归档，相同内容的文件只保存一份
+
+        Args:
+            version: 版本号
+            files: 文件 -> SHA-256
+        """
+        for f, digest in files.items():
+            path = self.object_path(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copyfile(os.path.join("html", f), path + ".tmp")
+                os.replace(path + ".tmp", path)
+        record = os.path.join(self.ARCHIVE, "versions", version + ".json")
+        os.makedirs(os.path.dirname(record), exist_ok=True)
+        with open(record + ".tmp", "w") as f:
+            json.dump({"version": version, "time": time.time(), "files": files}, f)
+        os.replace(record + ".tmp", record)
+
+    def prune(self, keep):
+        """
+        只保留最近 keep 个版本，删除不再被引用的文件
+        """
+        versions = self.load_versions()
+        for v in versions[:-keep]:
+            os.remove(os.path.join(self.ARCHIVE, "versions", v["version"] + ".json"))
+        used = {d for v in versions[-keep:] for d in v["files"].values()}
+        for root, dirs, names in os.walk(os.path.join(self.ARCHIVE, "objects")):
+            for name in names:
+                if name not in used:
+                    os.remove(os.path.join(root, name))
+
+    def make_deltas(self):
+        """
+        归档当前的 html，并为最近 KEEP_VERSIONS 个旧版本生成直接到当前版本的补丁，
+        补丁和索引写入 dist/patches，python/patch.py 的 --index 据此选择最小的升级路径
+        """
+        version = ProjectInfo().version
+        keep = getattr(self.args, "keep_versions", None) or self.KEEP_VERSIONS
+        print(f"Making deltas to {version}...")
+
+        self.load_manifest()
+        new_files = self.scan("html")
+        new_sha = self.digests("html", new_files, list(new_files))
+        self.save_manifest(new_files)
+
+        os.makedirs(self.PATCHES, exist_ok=True)
+        index_path = os.path.join(self.PATCHES, "index.json")
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = {"patches": []}
+        # 同一版本号重新构建时，之前到该版本的补丁已经不对应当前内容
+        index["patches"] = [
+            p
+            for p in index["patches"]
+            if version not in (p["from"], p["to"])
+            and os.path.exists(os.path.join(self.PATCHES, p["file"]))
+        ]
 
-        for f in out["modfile"]:
-            os.makedirs(os.path.dirname(os.path.join("build/diff", f)), exist_ok=True)
-            bsdiff4.file_diff(
-                os.path.join("html.old", f),
-                os.path.join("html", f),
-                os.path.join("build/diff", f + ".diff"),
+        old_versions = [v for v in self.load_versions() if v["version"] != version]
+        for old in old_versions[-keep:]:
+            old_sha = old["files"]
+            out = {
+                "from": old["version"],
+                "to": version,
+                "addfile": sorted(new_sha.keys() - old_sha.keys()),
+                "delfile": sorted(old_sha.keys() - new_sha.keys()),
+                "modfile": sorted(
+                    f
+                    for f in new_sha.keys() & old_sha.keys()
+                    if new_sha[f] != old_sha[f]
+                ),
+            }
+            out["sha256"] = {f: new_sha[f] for f in out["addfile"] + out["modfile"]}
+            name = f"{old['version']}-{version}.zip"
+            self.write_patch(
+                out,
+                lambda f: self.object_path(old_sha[f]),
+                os.path.join("build", "delta"),
+                os.path.join(self.PATCHES, name),
+            )
+            index["patches"].append(
+                {
+                    "from": old["version"],
+                    "to": version,
+                    "file": name,
+                    "size": os.path.getsize(os.path.join(self.PATCHES, name)),
+                }
             )
 
-        with zipfile.ZipFile("dist/diff.zip", "w") as zip_ref:
-            for root, dirs, files in os.walk("build/diff"):
-                for file in files:
-                    f = os.sep.join(os.path.join(root, file).split(os.sep)[2:])
-                    zip_ref.write(os.path.join(root, file), f)
+        self.archive(version, new_sha)
+        self.prune(keep + 1)
+        index["latest"] = version
+        if os.path.exists("dist/html.zip"):
+            index["full"] = {
+                "file": "../html.zip",
+                "size": os.path.getsize("dist/html.zip"),
+            }
+        with open(index_path + ".tmp", "w") as f:
+            json.dump(index, f, indent=2)
+        os.replace(index_path + ".tmp", index_path)
 
     def build(self):
         os.makedirs("dist", exist_ok=True)
@@ -427,16 +938,11 @@ class HtmlBuiler:
             return
 
         print("Making zip...")
-        with zipfile.ZipFile("dist/html.zip", "w") as zip_ref:
-            for root, dirs, files in os.walk("html"):
-                for file in files:
-                    zip_ref.write(
-                        os.path.join(root, file),
-                        os.path.relpath(os.path.join(root, file), "html"),
-                    )
+        pack("html", "dist/html.zip", getattr(self.args, "zip_workers", None))
 
         if os.path.exists("html.old"):
             self.make_diff()
+        self.make_deltas()
 
 
 if __name__ == "__main__":
@@ -452,6 +958,36 @@ if __name__ == "__main__":
     parser.add_argument("--default-version", help="default version", default="38.1.0")
     parser.add_argument("--no-clean", action="store_true", help="no clean")
     parser.add_argument("--no-ele", action="store_true", help="no clean")
+    parser.add_argument(
+        "--mirror",
+        action="append",
+        help="Electron SDK url template with {version} {system} {arch}, repeatable, replaces the built-in mirrors",
+    )
+    parser.add_argument(
+        "--diff-format",
+        choices=["bsdiff", "chunked"],
+        default="bsdiff",
+        help="binary diff format for modified files, chunked bounds patching memory",
+    )
+    parser.add_argument(
+        "--diff-workers",
+        type=int,
+        help="processes used to diff modified files, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--zip-workers",
+        type=int,
+        help="processes used to compress zip entries, defaults to the number of CPUs",
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        help="number of archived versions that get a direct patch to the new build",
+    )
+    parser.add_argument(
+        "--shasums-url",
+        help="SHASUMS256.txt url template with {version}",
+    )
     args = parser.parse_args()
     if args.no_ele:
         builders = [HtmlBuiler(args)]
@@ -460,3 +996,4 @@ if __name__ == "__main__":
 
     for builder in builders:
         builder.build()
+    prune_zip_cache()
@@ -0,0 +1,135 @@
+"""
+build.py 下载基准测试
+
+用本地镜像服务器代替真实镜像，比较基线版本（仓库第一个提交中的 build.py）与当前版本:
+
+- slow-first: 镜像列表中第一个较慢、第二个较快
+- flaky:      唯一的镜像在传输到一半时断开一次（校验续传后的 SHA-256）
+- verify:     下载并校验 SHA-256
+- cached:     SDK 已在 .cache 中，再次构建时的校验
+
+    python bench/bench_build_download.py --size 16
+"""
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import common
+from mirror_server import Mirror, MirrorServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+TEMPLATE = "electron-v{version}-{system}-{arch}.zip"
+TARGETS = [("win32", "x64", "38.1.0", "win"), ("win32", "ia32", "22.3.27", "win7")]
+
+
+def load_build(source: str, name: str):
+    path = os.path.join(tempfile.gettempdir(), f"{name}.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    # 注册后进程池才能按名称序列化模块中的函数
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def baseline_source() -> str:
+    root = subprocess.check_output(["git", "rev-list", "--max-parents=0", "HEAD"], cwd=ROOT, text=True).split()[0]
+    return subprocess.check_output(["git", "show", f"{root}:build.py"], cwd=ROOT, text=True)
+
+
+def make_args(mirrors, check, shasums_url):
+    return argparse.Namespace(
+        target="all", default_version="38.1.0", no_check=not check, mirror=mirrors, shasums_url=shasums_url
+    )
+
+
+def run_build(build, server, mirrors, baseline, check=False, warm=False):
+    urls = [server.url(m, TEMPLATE) for m in mirrors]
+    builder = build.Builer(make_args(urls, check, server.url("fast", "{version}/SHASUMS256.txt")))
+    if baseline:
+        # 基线版本没有 --mirror，直接替换目标（其后仍会附加真实镜像，但第一个成功即返回）
+        builder.targets = [build.Target(*t, url_list=list(urls)) for t in TARGETS]
+    shutil.rmtree(".cache", ignore_errors=True)
+    os.makedirs(".cache", exist_ok=True)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        if check:
+            if baseline:
+                # 基线版本的 SHASUMS 地址是固定的，预先放入缓存；其解析不接受结尾的空行
+                for _, _, version, _ in TARGETS:
+                    with open(f".cache/SHASUMS256_{version}.txt", "w") as f:
+                        f.write(server.files[f"{version}/SHASUMS256.txt"].decode().rstrip("\n"))
+            builder.download_sha256sum()
+        if warm:
+            builder.download()
+            if not baseline:
+                # 新的构建进程
+                builder = build.Builer(builder.args)
+                builder.download_sha256sum()
+        for mirror in server.mirrors.values():
+            mirror.sent = 0
+        with common.Timer() as t:
+            builder.download()
+    for target in builder.targets:
+        with open(f".cache/ele-{target}.zip", "rb") as f:
+            assert f.read() == server.files[target.get_file_name()], target
+    return t.elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=16, help="每个 SDK 的大小（MiB）")
+    parser.add_argument("--slow-rate", type=float, default=4, help="慢镜像的速度（MiB/s）")
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    files = {}
+    for system, arch, version, _ in TARGETS:
+        name = TEMPLATE.format(version=version, system=system, arch=arch)
+        files[name] = os.urandom(size)
+        files[f"{version}/SHASUMS256.txt"] = f"{hashlib.sha256(files[name]).hexdigest()} *{name}\n".encode()
+
+    builds = {
+        "baseline": load_build(baseline_source(), "build_baseline"),
+        "current": load_build(open(os.path.join(ROOT, "build.py"), encoding="utf-8").read(), "build_current"),
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        with open("package.json", "w") as f:
+            f.write('{"name": "bench", "version": "0.0.0"}')
+        try:
+            scenarios = (
+                ("slow-first", ["slow", "fast"], {}),
+                ("flaky", ["flaky"], {"check": True}),
+                ("verify", ["fast"], {"check": True}),
+                ("cached", ["fast"], {"check": True, "warm": True}),
+            )
+            for scenario, mirrors, options in scenarios:
+                for label, build in builds.items():
+                    servers = {
+                        "slow": Mirror(rate=args.slow_rate * 1024 * 1024),
+                        "fast": Mirror(),
+                        "flaky": Mirror(drop_after=size // 2),
+                    }
+                    with MirrorServer(files, servers) as server:
+                        elapsed = run_build(build, server, mirrors, label == "baseline", **options)
+                    sent = sum(m.sent for m in servers.values())
+                    print(
+                        f"{scenario:10} {label:8} {elapsed:6.2f}s "
+                        f"transferred {sent / len(TARGETS) / size:4.2f}x of SDK size"
+                    )
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+热点存档缓存基准测试
+
+大量账号按 Zipf 分布反复下载存档，穿插少量上传；
+比较关闭/开启缓存时 DOWN_SAVE 的延迟，并报告命中率与缓存占用的内存
+
+    python bench/bench_cache.py --accounts 2000 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+
+import common
+import codec
+from bench_delta import FakeConnection, make_save
+from cache import SaveCache
+from connect import Message
+from model import MsgCode, MsgType
+from server import HANDLERS, Server
+from storage import SQLiteStore
+
+
+async def run_once(args, cache, tmp, keys):
+    handle = Server(
+        SQLiteStore(os.path.join(tmp, "saves.db")),
+        SQLiteStore(os.path.join(tmp, "saves.db"), "accounts"),
+        cache=cache,
+    )
+    down, _ = HANDLERS[MsgType.DOWN_SAVE]
+    upload, _ = HANDLERS[MsgType.UPLOAD_SAVE]
+    save = make_save(args.items)
+    conns = {}
+    latencies, not_modified = [], 0
+    for i, key in enumerate(keys):
+        conn = conns.get(key)
+        if conn is None:
+            conn = conns[key] = FakeConnection(key)
+            conn.rev = None
+        if random.random() < args.writes:
+            save["updatedAt"] = i
+            msg = Message.from_dict({"code": MsgCode.OK, "type": MsgType.UPLOAD_SAVE, "data": save})
+            code, data = await upload(handle, conn, msg)
+            conn.rev = data["rev"]
+            continue
+        # 部分客户端带上已知版本，期待 NotModified
+        known = {"rev": conn.rev} if conn.rev is not None and random.random() < args.conditional else None
+        msg = Message.from_dict({"code": MsgCode.OK, "type": MsgType.DOWN_SAVE, "data": known})
+        with common.Timer() as t:
+            code, data = await down(handle, conn, msg)
+        latencies.append(t.elapsed)
+        if code == MsgCode.NotModified:
+            not_modified += 1
+        else:
+            conn.rev = codec.loads(data)["rev"]
+    handle.saves.close()
+    handle.accounts.close()
+    return common.summary(latencies), not_modified, handle.cache.stats()
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # 预先为每个账号写入存档
+        store = SQLiteStore(os.path.join(tmp, "saves.db"))
+        save = make_save(args.items)
+        raw = codec.dumps(save)
+        for a in range(args.accounts):
+            store.put(f"user{a}", raw, 0)
+        store.close()
+        print(f"{args.accounts} accounts, save={len(raw) / 1024:.1f}KiB, {args.requests} requests")
+
+        weights = [1 / (k + 1) ** args.zipf for k in range(args.accounts)]
+        keys = random.choices([f"user{a}" for a in range(args.accounts)], weights, k=args.requests)
+        for label, cache in (
+            ("no cache", SaveCache(0)),
+            ("cache", SaveCache(args.cache_mb * 1024 * 1024)),
+        ):
+            s, nm, stats = await run_once(args, cache, tmp, keys)
+            print(
+                f"  {label:8} p50={s['p50_us']:8.1f}us p99={s['p99_us']:8.1f}us "
+                f"hit={stats['hit_ratio']:6.1%} not-modified={nm:<6} "
+                f"entries={stats['entries']:<5} memory={stats['bytes'] / 1024 / 1024:.1f}MiB "
+                f"evictions={stats['evictions']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=500, help="存档中的物品数量")
+    parser.add_argument("--zipf", type=float, default=1.1, help="访问分布的 Zipf 指数")
+    parser.add_argument("--writes", type=float, default=0.05, help="上传请求的比例")
+    parser.add_argument("--conditional", type=float, default=0.3, help="带已知版本的下载比例")
+    parser.add_argument("--cache-mb", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
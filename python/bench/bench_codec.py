@@ -0,0 +1,103 @@
+"""
+消息解码基准测试
+
+对比旧版 Message.load（标准库 json + 递归包装 ToClass）与当前实现
+在大存档上的耗时和内存峰值
+
+    python bench/bench_codec.py --items 5000
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+import common
+import codec
+from connect import Message
+from model import MsgCode, MsgType
+
+
+class LegacyToClass:
+    """
+    旧版 ToClass，构造时递归包装所有嵌套字典
+    """
+
+    def __init__(self, conf: dict):
+        self._conf_Dict = conf
+        self.__name__ = "<Standard Dictionary>"
+        for k, v in conf.items():
+            if isinstance(v, dict):
+                setattr(self, k, LegacyToClass(v))
+            elif isinstance(v, list):
+                setattr(self, k, [LegacyToClass(i) if isinstance(i, dict) else i for i in v])
+            else:
+                setattr(self, k, v)
+
+
+def legacy_load(raw):
+    parsed = json.loads(raw)
+    code = MsgCode(parsed["code"])
+    type_ = MsgType(parsed["type"])
+    data = parsed.get("data")
+    if type(data) == dict:
+        data = LegacyToClass(data)
+    return Message(code, type_, data)
+
+
+def make_save(items):
+    return {
+        "version": "1.0.0",
+        "updatedAt": int(time.time() * 1000),
+        "data": {
+            "items": [
+                {"id": i, "name": f"item{i}", "count": random.randrange(999)} for i in range(items)
+            ],
+            "relics": [
+                {
+                    "id": i,
+                    "level": random.randrange(20),
+                    "main": {"type": "atk", "value": random.random()},
+                    "sub": [{"type": "hp", "value": random.random()} for _ in range(4)],
+                }
+                for i in range(items)
+            ],
+        },
+    }
+
+
+def measure(func, raw, repeat):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func(raw)
+        times.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    msg = func(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del msg
+    return common.summary(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000, help="物品与遗器各多少个")
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    raw = json.dumps(
+        {"code": MsgCode.OK, "type": MsgType.UPLOAD_SAVE, "data": make_save(args.items)}
+    )
+    print(f"payload {len(raw) / 1024:.0f} KiB, backend={codec.BACKEND}")
+    for name, func in (("legacy", legacy_load), ("current", Message.load)):
+        s, peak = measure(func, raw, args.repeat)
+        print(
+            f"  {name:8} p50={s['p50_us'] / 1000:7.2f}ms p99={s['p99_us'] / 1000:7.2f}ms "
+            f"peak={peak / 1024 / 1024:6.1f}MiB"
+        )
+
+
+if __name__ == "__main__":
+    main()
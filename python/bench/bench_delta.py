@@ -0,0 +1,108 @@
+"""
+增量上传基准测试
+
+对典型的小改动（获得一个物品、修改金币等），比较完整上传与增量补丁
+在请求字节数和服务器 CPU 时间上的差别
+
+    python bench/bench_delta.py --items 5000
+"""
+import argparse
+import asyncio
+import copy
+import os
+import random
+import tempfile
+import time
+
+import common
+import codec
+from connect import Connection, Message
+from model import MsgCode, MsgType
+from server import HANDLERS, Server
+from storage import SQLiteStore
+
+
+class FakeConnection(Connection):
+    def __init__(self, account):
+        super().__init__(None)
+        self.account = account
+
+
+def make_save(items):
+    return {
+        "version": "1.0.0",
+        "updatedAt": 0,
+        "data": {
+            "gold": 1000,
+            "items": [{"id": i, "count": random.randrange(999)} for i in range(items)],
+            "characters": [{"id": i, "level": 1, "exp": 0} for i in range(50)],
+        },
+    }
+
+
+def edits(save):
+    """
+    生成 (名称, 修改后的完整存档, 补丁)
+    """
+    n = len(save["data"]["items"])
+    i = random.randrange(n)
+    full = copy.deepcopy(save)
+    full["data"]["items"][i]["count"] += 1
+    yield "item+1", full, [{"op": "replace", "path": f"/data/items/{i}/count", "value": full["data"]["items"][i]["count"]}]
+
+    full = copy.deepcopy(save)
+    full["data"]["items"].append({"id": n, "count": 1})
+    yield "new item", full, [{"op": "add", "path": "/data/items/-", "value": {"id": n, "count": 1}}]
+
+    full = copy.deepcopy(save)
+    full["data"]["gold"] -= 100
+    full["data"]["characters"][3]["level"] += 1
+    yield "gold+level", full, [
+        {"op": "replace", "path": "/data/gold", "value": full["data"]["gold"]},
+        {"op": "replace", "path": "/data/characters/3/level", "value": full["data"]["characters"][3]["level"]},
+    ]
+
+
+async def upload(server, ws, data, rounds):
+    func, _ = HANDLERS[MsgType.UPLOAD_SAVE]
+    raw = Message(MsgCode.OK, MsgType.UPLOAD_SAVE, data).dump()
+    cpu = time.process_time()
+    for _ in range(rounds):
+        msg = Message.load(raw)
+        if "base" in data:
+            # 每轮使用最新的版本号
+            msg.data._conf_Dict["base"] = server.saves.get(ws.account).version
+        code, _ = await func(server, ws, msg)
+        assert code == MsgCode.OK, code
+    return len(raw), (time.process_time() - cpu) / rounds
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "saves.db")
+        server = Server(SQLiteStore(db), SQLiteStore(db, "accounts"))
+        ws = FakeConnection("user")
+        save = make_save(args.items)
+        server.saves.put("user", codec.dumps(save), 0)
+
+        for name, full, patch in edits(save):
+            full_bytes, full_cpu = await upload(server, ws, full, args.rounds)
+            server.saves.put("user", codec.dumps(save), 0)
+            delta = {"base": 0, "updatedAt": 1, "patch": patch}
+            delta_bytes, delta_cpu = await upload(server, ws, delta, args.rounds)
+            server.saves.put("user", codec.dumps(save), 0)
+            print(
+                f"{name:10} full={full_bytes:8d}B {full_cpu * 1000:6.2f}ms  "
+                f"delta={delta_bytes:5d}B {delta_cpu * 1000:6.2f}ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
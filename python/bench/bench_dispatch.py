@@ -0,0 +1,103 @@
+"""
+消息分发循环压力测试
+
+在本进程内启动服务器，模拟大量客户端并发执行 INIT/REG/UPLOAD/DOWN，
+统计每类请求的延迟和总吞吐
+
+    python bench/bench_dispatch.py --clients 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import common
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+from model import MsgCode, MsgType
+from server import Server
+from storage import SQLiteStore
+
+
+class Client:
+    """
+    按请求编号把回复分发给等待者的模拟客户端
+    """
+
+    def __init__(self, ws, latencies):
+        self.ws = ws
+        self.latencies = latencies
+        self.pending = {}
+        self.next_id = 0
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        async for raw in self.ws:
+            reply = json.loads(raw)
+            fut = self.pending.pop(reply.get("id"), None)
+            if fut is not None:
+                fut.set_result(reply)
+
+    async def request(self, type_, data):
+        rid = self.next_id
+        self.next_id += 1
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[rid] = fut
+        t = time.perf_counter()
+        await self.ws.send(json.dumps({"code": MsgCode.OK, "type": type_, "data": data, "id": rid}))
+        reply = await fut
+        self.latencies.setdefault(type_, []).append(time.perf_counter() - t)
+        return reply
+
+
+async def client(port, i, args, payload, latencies):
+    async with connect(f"ws://127.0.0.1:{port}", max_size=None) as ws:
+        c = Client(ws, latencies)
+        await c.request(MsgType.INIT, f"client{i}")
+        await c.request(MsgType.REG, {"account": f"user{i}", "password": "pw"})
+        for _ in range(args.rounds):
+            save = {"version": "1.0.0", "updatedAt": int(time.time() * 1000), "data": payload}
+            # 上传与下载并发发送，验证同一连接上的请求互不阻塞
+            await asyncio.gather(
+                c.request(MsgType.UPLOAD_SAVE, save),
+                c.request(MsgType.DOWN_SAVE, None),
+            )
+        c.reader.cancel()
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        Server.PBKDF2_ROUNDS = 1  # 压测时不关心密码哈希的开销
+        handle = Server(
+            SQLiteStore(os.path.join(tmp, "saves.db")),
+            SQLiteStore(os.path.join(tmp, "saves.db"), "accounts"),
+        )
+        payload = {"items": [{"id": k, "count": random.randrange(100)} for k in range(args.items)]}
+        latencies = {}
+        async with serve(handle.accpect, "127.0.0.1", 0, ping_interval=None, max_size=None) as server:
+            port = server.sockets[0].getsockname()[1]
+            start = time.perf_counter()
+            await asyncio.gather(*(client(port, i, args, payload, latencies) for i in range(args.clients)))
+            elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.clients} clients, {total} requests in {elapsed:.2f}s, {total / elapsed:.0f} req/s")
+    for type_, values in latencies.items():
+        s = common.summary(values)
+        print(f"  {type_:4} n={s['count']:<6} p50={s['p50_us'] / 1000:8.2f}ms p99={s['p99_us'] / 1000:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3, help="每个客户端的上传/下载轮数")
+    parser.add_argument("--items", type=int, default=100, help="存档中的物品数量")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+广播基准测试
+
+向 N 个本地模拟连接广播公告，其中一部分连接消费很慢；
+比较“每个连接单独编码发送”与 ConnectionManager.broadcast 的耗时，
+并确认慢连接不会拖慢其他连接
+
+    python bench/bench_fanout.py --clients 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import common
+import codec
+from connect import Connection, ConnectionManager, Message
+from model import MsgCode, MsgType
+from websockets.protocol import State
+
+
+class FakeSocket:
+    """
+    模拟 websocket，慢客户端每次发送都要等待一段时间
+    """
+
+    def __init__(self, delay):
+        self.state = State.OPEN
+        self.delay = delay
+        self.received = 0
+
+    async def send(self, frame, text=None):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received += 1
+
+
+async def run(args):
+    manager = ConnectionManager()
+    sockets = []
+    wires = [codec.WireCodec()] + [codec.WireCodec(f, c) for f in codec.FORMATS for c in codec.COMPRESSORS]
+    for i in range(args.clients):
+        slow = random.random() < args.slow
+        sock = FakeSocket(1.0 if slow else 0)
+        conn = Connection(sock)
+        conn.codec = random.choice(wires)
+        manager.accpect(f"c{i}", conn)
+        sockets.append((sock, slow))
+
+    notice = {"title": "维护公告", "body": "服务器将于今晚 23:00 维护" * 20, "version": "1.4.1"}
+
+    # 预热，创建各连接的推送队列
+    manager.broadcast(notice)
+    await asyncio.sleep(0.1)
+
+    # 对照: 每个连接单独编码后入队
+    t = time.perf_counter()
+    for conn in manager.conns.values():
+        msg = Message(MsgCode.OK, MsgType.NOTICE, notice)
+        if conn.codec.binary:
+            conn.push(conn.codec.encode(msg)[0], False)
+        else:
+            conn.push(msg.dump(), True)
+    naive = time.perf_counter() - t
+    await asyncio.sleep(0.1)
+    for sock, _ in sockets:
+        sock.received = 0
+    for conn in manager.conns.values():
+        conn.dropped = 0
+
+    enqueue = 0.0
+    for _ in range(args.rounds):
+        t = time.perf_counter()
+        manager.broadcast(notice)
+        enqueue += time.perf_counter() - t
+        # 让出事件循环，推送任务开始发送
+        await asyncio.sleep(0)
+    enqueue /= args.rounds
+
+    # 等待快客户端收完
+    t = time.perf_counter()
+    while any(not slow and sock.received < args.rounds for sock, slow in sockets):
+        await asyncio.sleep(0.01)
+    drain = time.perf_counter() - t
+
+    slow_dropped = sum(conn.dropped for conn in manager.conns.values())
+    print(
+        f"{args.clients} clients ({args.slow:.0%} slow), {len(wires)} encodings\n"
+        f"  per-client encode:      {naive * 1000:8.2f}ms\n"
+        f"  broadcast() per round:  {enqueue * 1000:8.2f}ms (encode once + enqueue)\n"
+        f"  fast clients drained {args.rounds} rounds in {drain * 1000:.1f}ms, "
+        f"dropped for slow clients: {slow_dropped}"
+    )
+    for conn in manager.conns.values():
+        conn.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10_000)
+    parser.add_argument("--slow", type=float, default=0.01, help="慢客户端比例")
+    parser.add_argument("--rounds", type=int, default=100, help="连续广播的次数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+make_diff 基准测试
+
+生成 N 个小文件的 html.old，复制为 html（保留修改时间，与 build 中的 copytree 一致）后:
+修改 1% 的文件（其中一部分是较大的文件，用于 bsdiff）、新增 10%、删除 5%、
+另有 30% 重新写入相同内容（只改变修改时间，模拟重新构建）。
+
+比较基线版本（仓库第一个提交中的 build.py）与当前版本的耗时，当前版本分别在没有清单（cold）
+和清单已有 html.old 记录（warm，即上一次构建后 html 被复制为 html.old 的情况）时运行，
+并确认两者得出的新增、修改、删除文件一致
+
+    python bench/bench_make_diff.py --files 2000 5000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import common
+from bench_build_download import ROOT, baseline_source, load_build
+
+
+def write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_trees(count: int, small: int, large: int):
+    for tree in ("html.old", "html", "build", ".cache"):
+        shutil.rmtree(tree, ignore_errors=True)
+    for i in range(count):
+        size = large if i % 100 == 3 else small
+        write(os.path.join("html.old", f"d{i % 50}", f"f{i}.js"), os.urandom(size))
+    shutil.copytree("html.old", "html")
+    for i in range(count):
+        name = os.path.join("html", f"d{i % 50}", f"f{i}.js")
+        if i % 20 == 1:
+            os.remove(name)
+            continue
+        with open(name, "rb") as f:
+            data = bytearray(f.read())
+        if i % 100 in (3, 7):
+            data[len(data) // 2 : len(data) // 2 + 64] = os.urandom(64)
+        elif i % 10 not in (4, 5, 6):
+            continue
+        # 修改或只重新写入，修改时间都会变
+        with open(name, "wb") as f:
+            f.write(bytes(data))
+        os.utime(name, ns=(time.time_ns(), time.time_ns() + 1))
+    for i in range(count // 10):
+        write(os.path.join("html", f"d{i % 50}", f"new{i}.js"), os.urandom(small))
+
+
+def run(build, warm: bool):
+    shutil.rmtree("build", ignore_errors=True)
+    os.makedirs("dist", exist_ok=True)
+    if not warm:
+        shutil.rmtree(".cache", ignore_errors=True)
+    builder = build.HtmlBuiler(argparse.Namespace(diff_format="bsdiff", diff_workers=None))
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.make_diff()
+    elapsed = time.perf_counter() - start
+    with open("build/diff/diff.json") as f:
+        info = json.load(f)
+    return elapsed, {k: sorted(info[k]) for k in ("addfile", "modfile", "delfile")}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, nargs="+", default=[2000, 5000], help="html.old 中的文件数")
+    parser.add_argument("--small", type=int, default=8, help="小文件的大小（KiB）")
+    parser.add_argument("--large", type=int, default=1024, help="大文件的大小（KiB）")
+    args = parser.parse_args()
+
+    baseline = load_build(baseline_source(), "build_baseline")
+    current = load_build(open(os.path.join(ROOT, "build.py"), encoding="utf-8").read(), "build_current")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            for count in args.files:
+                make_trees(count, args.small * 1024, args.large * 1024)
+                # 上一次构建的清单: 只有 html.old（即当时的 html）的记录
+                prev = current.HtmlBuiler(argparse.Namespace())
+                files = prev.scan("html.old")
+                prev.digests("html.old", files, list(files))
+                prev.save_manifest(files)
+                warm_manifest = open(prev.MANIFEST).read()
+
+                results = [("baseline", *run(baseline, warm=False))]
+                expected = results[0][2]
+                results.append(("cold", *run(current, warm=False)))
+                os.makedirs(".cache", exist_ok=True)
+                with open(prev.MANIFEST, "w") as f:
+                    f.write(warm_manifest)
+                results.append(("warm", *run(current, warm=True)))
+                for label, elapsed, sets in results:
+                    counts = " ".join(f"{k} {len(v)}" for k, v in sets.items())
+                    print(
+                        f"{count:6} files {label:8} {elapsed:6.2f}s {counts} "
+                        f"{'ok' if sets == expected else 'MISMATCH'}"
+                    )
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+指标开销基准测试
+
+在模拟连接上循环收发小消息，比较关闭/开启指标时每条消息的耗时，
+以及导出一次指标文本的耗时
+
+    python bench/bench_metrics.py
+"""
+import argparse
+import asyncio
+import time
+
+import common
+import metrics
+from connect import Connection
+from model import MsgCode
+from websockets.protocol import State
+
+
+class LoopSocket:
+    """
+    发出的帧直接作为下一次收到的帧
+    """
+
+    def __init__(self):
+        self.state = State.OPEN
+        self.frame = '{"code":200,"type":"ds","data":null,"id":1}'
+
+    async def recv(self):
+        return self.frame
+
+    async def send(self, frame, text=None):
+        pass
+
+
+async def rate(n):
+    conn = Connection(LoopSocket())
+    start = time.perf_counter()
+    for i in range(n):
+        msg = await conn.recv()
+        await conn.send(MsgCode.OK, "done", id=msg.id, reply_to=msg.type)
+    return (time.perf_counter() - start) / n
+
+
+async def run(args):
+    off = await rate(args.messages)
+    metrics.enable()
+    on = await rate(args.messages)
+    metrics.enable(False)
+    print(
+        f"recv+send per message: disabled={off * 1e6:.2f}us enabled={on * 1e6:.2f}us "
+        f"(+{(on - off) * 1e6:.2f}us)"
+    )
+    with common.Timer() as t:
+        text = metrics.render()
+    print(f"render: {t.elapsed * 1000:.2f}ms, {len(text)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200_000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+大消息卸载基准测试
+
+若干客户端持续上传大存档的同时，其他客户端发送小请求（DOWN_SAVE 空存档），
+比较关闭/开启进程池卸载时小请求的 p99 延迟
+
+    python bench/bench_offload.py --big-clients 1 --big-items 50000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import common
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+import offload
+from bench_dispatch import Client
+from model import MsgType
+from server import Server
+from storage import SQLiteStore
+
+
+async def big_client(port, i, frame, stop, counter):
+    async with connect(f"ws://127.0.0.1:{port}", max_size=None) as ws:
+        c = Client(ws, {})
+        await c.request(MsgType.INIT, f"big{i}")
+        await c.request(MsgType.REG, {"account": f"big{i}", "password": "pw"})
+        while not stop.is_set():
+            # 帧预先编码好，避免客户端自身的编码占用本进程的事件循环
+            fut = asyncio.get_running_loop().create_future()
+            c.pending[-1] = fut
+            await ws.send(frame)
+            await fut
+            counter[0] += 1
+        c.reader.cancel()
+
+
+async def small_client(port, i, args, latencies):
+    async with connect(f"ws://127.0.0.1:{port}", max_size=None) as ws:
+        c = Client(ws, latencies)
+        await c.request(MsgType.INIT, f"small{i}")
+        await c.request(MsgType.REG, {"account": f"small{i}", "password": "pw"})
+        latencies.clear()
+        for _ in range(args.requests):
+            await c.request(MsgType.DOWN_SAVE, None)
+            await asyncio.sleep(args.interval)
+        c.reader.cancel()
+
+
+async def run_once(args, threshold):
+    offload.THRESHOLD = threshold
+    with tempfile.TemporaryDirectory() as tmp:
+        Server.PBKDF2_ROUNDS = 1
+        handle = Server(
+            SQLiteStore(os.path.join(tmp, "saves.db")),
+            SQLiteStore(os.path.join(tmp, "saves.db"), "accounts"),
+        )
+        payload = {"items": [{"id": k, "name": f"item{k}", "count": k % 100} for k in range(args.big_items)]}
+        save = {"version": "1.0.0", "updatedAt": int(time.time() * 1000), "data": payload}
+        frame = json.dumps({"code": 200, "type": MsgType.UPLOAD_SAVE, "data": save, "id": -1})
+        size = len(frame)
+        offload.start()
+        counter, stop = [0], asyncio.Event()
+        async with serve(handle.accpect, "127.0.0.1", 0, ping_interval=None, max_size=None) as server:
+            port = server.sockets[0].getsockname()[1]
+            bigs = [asyncio.create_task(big_client(port, i, frame, stop, counter)) for i in range(args.big_clients)]
+            await asyncio.sleep(0.5)
+            start = time.perf_counter()
+            smalls = [{} for _ in range(args.small_clients)]
+            await asyncio.gather(*(small_client(port, i, args, smalls[i]) for i in range(args.small_clients)))
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await asyncio.gather(*bigs)
+        offload.shutdown()
+
+    values = [v for lat in smalls for v in lat.get(MsgType.DOWN_SAVE, [])]
+    s = common.summary(values)
+    return size, s, counter[0] / elapsed
+
+
+async def run(args):
+    for label, threshold in (("inline", float("inf")), ("offload", offload.THRESHOLD)):
+        size, s, uploads = await run_once(args, threshold)
+        print(
+            f"{label:8} save={size / 1024:.0f}KiB uploads={uploads:6.1f}/s  small requests "
+            f"p50={s['p50_us'] / 1000:7.2f}ms p99={s['p99_us'] / 1000:7.2f}ms max={s['max_us'] / 1000:7.2f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--big-clients", type=int, default=1, help="持续上传大存档的客户端数")
+    parser.add_argument("--big-items", type=int, default=50_000, help="大存档中的物品数量")
+    parser.add_argument("--small-clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="每个小客户端的请求数")
+    parser.add_argument("--interval", type=float, default=0.01, help="小请求之间的间隔（秒）")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
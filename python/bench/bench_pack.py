@@ -0,0 +1,158 @@
+"""
+打包基准测试
+
+按 `build.py all` 的打包阶段生成合成目录: html（脚本、样式和已压缩的媒体文件）、build/asar（app.asar 和解包的媒体）、
+两个目标的 build/<target>（Electron SDK 的可执行文件、pak、dll 和 resources），依次打包为
+dist/html.zip、dist/asar.zip 和两个目标的 zip，比较:
+
+- baseline: 仓库原来的写法，逐个文件 zip_ref.write，ZipFile 默认不压缩
+- deflate:  同样逐个文件写入，全部使用 ZIP_DEFLATED
+- cold:     pack，清空 .cache/zip 后运行
+- warm:     pack，再次构建且内容未变
+- changed:  pack，html 中 5% 的脚本和 app.asar 改变（SDK 不变，与两次构建之间改了代码的情况一致）
+
+并确认每个 zip 解压后的内容与源目录一致
+
+    python bench/bench_pack.py --sdk 64 --html 2000
+"""
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+
+import common
+from bench_build_download import ROOT, load_build
+
+WORDS = [b"function", b"return", b"const", b"this", b"props", b"value", b"=>", b"{", b"}", b"(", b")", b";", b"\n"]
+
+
+def text(rng: random.Random, size: int) -> bytes:
+    """
+    可压缩的类代码文本
+    """
+    out = bytearray()
+    while len(out) < size:
+        out += rng.choice(WORDS) + b" " + str(rng.randrange(1000)).encode() + b" "
+    return bytes(out[:size])
+
+
+def binary(rng: random.Random, size: int) -> bytes:
+    """
+    可执行文件: 一半随机数据，一半重复的段
+    """
+    block = rng.randbytes(64 * 1024)
+    out = bytearray()
+    while len(out) < size:
+        out += rng.randbytes(64 * 1024) if rng.random() < 0.5 else block
+    return bytes(out[:size])
+
+
+def write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_trees(rng: random.Random, html: int, sdk: int):
+    for i in range(html):
+        if i % 10 == 0:
+            ext = rng.choice([".mp3", ".png", ".jpg", ".woff2"])
+            write(os.path.join("html", "assets", f"m{i}{ext}"), rng.randbytes(rng.randrange(16, 128) * 1024))
+        else:
+            ext = rng.choice([".js", ".css", ".json"])
+            write(os.path.join("html", "assets", f"s{i}{ext}"), text(rng, rng.randrange(1, 16) * 1024))
+    write(os.path.join("build", "asar", "app.asar"), text(rng, 8 * 1024 * 1024))
+    for i in range(20):
+        write(os.path.join("build", "asar", "app.asar.unpacked", f"bgm{i}.mp3"), rng.randbytes(256 * 1024))
+    for target in ("win-x64-38.1.0", "win7-ia32-22.3.27"):
+        base = os.path.join("build", target)
+        write(os.path.join(base, "bench.exe"), binary(rng, sdk))
+        for name in ("ffmpeg.dll", "libGLESv2.dll", "vk_swiftshader.dll"):
+            write(os.path.join(base, name), binary(rng, sdk // 8))
+        write(os.path.join(base, "resources.pak"), binary(rng, sdk // 8))
+        write(os.path.join(base, "icudtl.dat"), text(rng, sdk // 8))
+        write(os.path.join(base, "locales", "zh-CN.pak"), text(rng, 512 * 1024))
+        write(os.path.join(base, "LICENSES.chromium.html"), text(rng, 4 * 1024 * 1024))
+        shutil.copytree(os.path.join("build", "asar"), os.path.join(base, "resources"))
+
+
+def jobs():
+    return [
+        ("html", "dist/html.zip"),
+        ("build/asar", "dist/asar.zip"),
+        ("build/win-x64-38.1.0", "dist/bench-win-x64.zip"),
+        ("build/win7-ia32-22.3.27", "dist/bench-win7-ia32.zip"),
+    ]
+
+
+def walk_zip(src: str, output: str, compression: int):
+    with zipfile.ZipFile(output, "w", compression) as zip_ref:
+        for root, dirs, files in os.walk(src):
+            for file in files:
+                zip_ref.write(os.path.join(root, file), os.path.relpath(os.path.join(root, file), src))
+
+
+def check(src: str, output: str) -> bool:
+    with zipfile.ZipFile(output) as zip_ref:
+        if zip_ref.testzip() is not None:
+            return False
+        names = set(zip_ref.namelist())
+        for root, dirs, files in os.walk(src):
+            for file in files:
+                path = os.path.join(root, file)
+                name = os.path.relpath(path, src).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    if name not in names or zip_ref.read(name) != f.read():
+                        return False
+                names.discard(name)
+        return not names
+
+
+def run(label: str, pack) -> None:
+    start = time.perf_counter()
+    for src, output in jobs():
+        pack(src, output)
+    elapsed = time.perf_counter() - start
+    size = sum(os.path.getsize(output) for _, output in jobs())
+    ok = all(check(src, output) for src, output in jobs())
+    print(f"{label:8} {elapsed:6.2f}s {size / 1024 / 1024:7.1f} MiB {'ok' if ok else 'FAILED'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sdk", type=int, default=64, help="每个目标主程序的大小（MiB）")
+    parser.add_argument("--html", type=int, default=2000, help="html 中的文件数")
+    args = parser.parse_args()
+
+    build = load_build(open(os.path.join(ROOT, "build.py"), encoding="utf-8").read(), "build_current")
+    rng = random.Random(0)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            os.makedirs("dist")
+            make_trees(rng, args.html, args.sdk * 1024 * 1024)
+            raw = sum(
+                os.path.getsize(os.path.join(root, f)) for src, _ in jobs() for root, _, files in os.walk(src) for f in files
+            )
+            print(f"sources  {raw / 1024 / 1024:15.1f} MiB")
+            run("baseline", lambda src, output: walk_zip(src, output, zipfile.ZIP_STORED))
+            run("deflate", lambda src, output: walk_zip(src, output, zipfile.ZIP_DEFLATED))
+            shutil.rmtree(".cache", ignore_errors=True)
+            run("cold", build.pack)
+            run("warm", build.pack)
+            scripts = sorted(os.listdir(os.path.join("html", "assets")))
+            for name in rng.sample([n for n in scripts if n.endswith(".js")], args.html // 20):
+                write(os.path.join("html", "assets", name), text(rng, 8 * 1024))
+            for target in ("asar", "win-x64-38.1.0/resources", "win7-ia32-22.3.27/resources"):
+                write(os.path.join("build", target, "app.asar"), text(random.Random(1), 8 * 1024 * 1024))
+            run("changed", build.pack)
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
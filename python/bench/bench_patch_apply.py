@@ -0,0 +1,129 @@
+"""
+补丁应用基准测试
+
+生成 N 个小文件的 html.old，在 html 中修改 10%、新增 10%、删除 5%，用 build.py 的 make_diff 生成补丁，
+比较基线版本（仓库第一个提交中的 patch.py）与当前版本在不同文件数下的应用耗时；
+当前版本分别用单线程和默认线程数暂存。最后篡改补丁中的一个文件，确认应用失败后安装目录不变
+
+    python bench/bench_patch_apply.py --files 100 1000 5000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import common
+from bench_build_download import ROOT, load_build
+from bench_patch_memory import PATCH, baseline_patch
+
+
+def make_trees(count: int, size: int):
+    shutil.rmtree("html.old", ignore_errors=True)
+    shutil.rmtree("html", ignore_errors=True)
+    for i in range(count):
+        name = os.path.join("html.old", f"d{i % 50}", f"f{i}.js")
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name, "wb") as f:
+            f.write(os.urandom(size))
+    shutil.copytree("html.old", "html")
+    for i in range(count):
+        name = os.path.join("html", f"d{i % 50}", f"f{i}.js")
+        if i % 20 == 1:
+            os.remove(name)
+        elif i % 10 == 2:
+            with open(name, "r+b") as f:
+                f.seek(size // 2)
+                f.write(os.urandom(64))
+    for i in range(count // 10):
+        with open(os.path.join("html", f"d{i % 50}", f"new{i}.js"), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def make_patch(build) -> str:
+    shutil.rmtree("build", ignore_errors=True)
+    os.makedirs("dist", exist_ok=True)
+    builder = build.HtmlBuiler(argparse.Namespace(diff_format="bsdiff"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.make_diff()
+    return os.path.abspath("dist/diff.zip")
+
+
+def snapshot(root: str) -> dict:
+    out = {}
+    for base, _, files in os.walk(root):
+        for file in files:
+            path = os.path.join(base, file)
+            with open(path, "rb") as f:
+                out[os.path.relpath(path, root)] = f.read()
+    return out
+
+
+def apply(args: list) -> tuple:
+    shutil.rmtree("install", ignore_errors=True)
+    shutil.copytree("html.old", "install")
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, *args], cwd="install", stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start, proc.returncode
+
+
+def corrupt(patch: str) -> str:
+    """
+    复制补丁并把最后一个修改文件的补丁换成另一个文件的，使其生成的内容校验失败
+    """
+    path = patch.replace(".zip", "-bad.zip")
+    with zipfile.ZipFile(patch) as src, zipfile.ZipFile(path, "w") as dst:
+        info = json.loads(src.read("diff.json"))
+        first, last = info["modfile"][0], info["modfile"][-1]
+        for item in src.infolist():
+            data = src.read(item)
+            if item.filename == last + ".diff":
+                data = src.read(first + ".diff")
+            dst.writestr(item, data)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 1000, 5000], help="html.old 中的文件数")
+    parser.add_argument("--size", type=int, default=16, help="每个文件的大小（KiB）")
+    args = parser.parse_args()
+
+    build = load_build(open(os.path.join(ROOT, "build.py"), encoding="utf-8").read(), "build_current")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            baseline = baseline_patch(tmp)
+            for count in args.files:
+                make_trees(count, args.size * 1024)
+                patch = make_patch(build)
+                expected = snapshot("html")
+                runs = (
+                    ("baseline", [baseline, patch]),
+                    ("workers=1", [PATCH, patch, "--workers", "1"]),
+                    ("default", [PATCH, patch]),
+                )
+                for label, argv in runs:
+                    elapsed, code = apply(argv)
+                    # 基线版本修改文件总是失败，只统计到失败为止的耗时
+                    ok = code == 0 and snapshot("install") == expected
+                    print(f"{count:6} files {label:10} {elapsed:6.2f}s {'ok' if ok else 'FAILED'}")
+
+            before = snapshot("html.old")
+            elapsed, code = apply([PATCH, corrupt(patch)])
+            leftovers = [n for n in os.listdir("install") if n.startswith(".patch")]
+            unchanged = snapshot("install") == before and not leftovers
+            print(f"corrupt patch: exit {code}, install {'unchanged' if unchanged else 'MODIFIED'}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
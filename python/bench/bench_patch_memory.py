@@ -0,0 +1,122 @@
+"""
+补丁应用内存基准测试
+
+用 build.py 的 make_diff 为一个大文件的修改和一个大文件的添加生成补丁，
+分别用基线版本（仓库第一个提交中的 patch.py）和当前版本应用，比较耗时与峰值内存（子进程的 VmHWM）
+
+    python bench/bench_patch_memory.py --size 32
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+from bench_build_download import ROOT, load_build
+
+PATCH = os.path.join(ROOT, "python", "patch.py")
+
+# 运行补丁脚本后输出本进程的峰值内存；VmHWM 只统计 exec 之后的地址空间，不含从父进程继承的部分
+MEASURE = """
+import os, runpy, sys
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+finally:
+    with open("/proc/self/status") as f:
+        sys.stderr.write(next(line for line in f if line.startswith("VmHWM:")))
+"""
+
+
+def baseline_patch(tmp: str) -> str:
+    root = subprocess.check_output(["git", "rev-list", "--max-parents=0", "HEAD"], cwd=ROOT, text=True).split()[0]
+    path = os.path.join(tmp, "patch_baseline.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(subprocess.check_output(["git", "show", f"{root}:python/patch.py"], cwd=ROOT, text=True))
+    return path
+
+
+def make_trees(size: int):
+    """
+    html.old 中有 media/a.mp4，html 中 a.mp4 有少量修改和插入，并新增 media/b.mp4
+    """
+    old = os.urandom(size)
+    new = bytearray(old)
+    for i in range(8):
+        pos = (i + 1) * size // 10
+        new[pos : pos + 4096] = os.urandom(4096)
+    new[size // 3 : size // 3] = os.urandom(64 * 1024)
+    for root, files in (("html.old", {"media/a.mp4": old}), ("html", {"media/a.mp4": bytes(new), "media/b.mp4": os.urandom(size)})):
+        for name, data in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+            with open(os.path.join(root, name), "wb") as f:
+                f.write(data)
+
+
+def make_patch(build, diff_format: str) -> str:
+    shutil.rmtree("build", ignore_errors=True)
+    builder = build.HtmlBuiler(argparse.Namespace(diff_format=diff_format))
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.make_diff()
+    path = f"diff-{diff_format}.zip"
+    os.replace("dist/diff.zip", path)
+    return os.path.abspath(path)
+
+
+def apply(script: str, patch: str):
+    shutil.rmtree("install", ignore_errors=True)
+    shutil.copytree("html.old", "install")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", MEASURE, script, patch],
+        cwd="install",
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    peak = int(proc.stderr.split("VmHWM:")[1].split()[0]) * 1024
+    ok = True
+    for name in ("media/a.mp4", "media/b.mp4"):
+        with open(os.path.join("install", name), "rb") as a, open(os.path.join("html", name), "rb") as b:
+            ok = ok and a.read() == b.read()
+    return elapsed, peak, ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=32, help="每个文件的大小（MiB）")
+    args = parser.parse_args()
+
+    build = load_build(open(os.path.join(ROOT, "build.py"), encoding="utf-8").read(), "build_current")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            os.makedirs("dist")
+            make_trees(args.size * 1024 * 1024)
+            patches = {fmt: make_patch(build, fmt) for fmt in ("bsdiff", "chunked")}
+            runs = (
+                ("baseline", baseline_patch(tmp), "bsdiff"),
+                ("current", PATCH, "bsdiff"),
+                ("current", PATCH, "chunked"),
+            )
+            for label, script, fmt in runs:
+                elapsed, rss, ok = apply(script, patches[fmt])
+                # 基线版本把补丁内容当作路径传给 file_patch_inplace，修改文件总是失败
+                print(
+                    f"{label:8} {fmt:7} patch {os.path.getsize(patches[fmt]) / 1024:8.1f} KiB "
+                    f"apply {elapsed:5.2f}s peak RSS {rss / 1024 / 1024:6.1f} MiB {'ok' if ok else 'FAILED'}"
+                )
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+限流基准测试
+
+攻击者（127.0.0.2）不等回复地连续发送请求并不断新建连接，
+正常客户端（127.0.0.3 起）按固定间隔下载存档；
+比较关闭/开启限流时正常客户端的延迟，以及攻击者被拒绝的情况
+
+    python bench/bench_ratelimit.py --attackers 4 --clients 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+import common
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+from websockets.exceptions import InvalidStatus, WebSocketException
+
+from bench_dispatch import Client
+from limits import RateLimiter
+from model import MsgCode, MsgType
+from server import Server
+from storage import SQLiteStore
+
+FLOOD = json.dumps({"code": MsgCode.OK, "type": MsgType.DOWN_SAVE, "data": None, "id": -1})
+
+
+async def attacker(port, i, stop, counts):
+    try:
+        async with connect(f"ws://127.0.0.1:{port}", local_addr=("127.0.0.2", 0), max_size=None) as ws:
+            await ws.send(json.dumps({"code": 200, "type": MsgType.INIT, "data": f"bad{i}"}))
+            await ws.send(json.dumps({"code": 200, "type": MsgType.REG, "data": {"account": f"bad{i}", "password": "pw"}}))
+
+            async def drain():
+                try:
+                    async for raw in ws:
+                        counts["replies"] += 1
+                        if '"code":500' in raw:
+                            counts["rejected"] += 1
+                except WebSocketException:
+                    pass
+
+            reader = asyncio.create_task(drain())
+            while not stop.is_set():
+                await ws.send(FLOOD)
+                counts["sent"] += 1
+            reader.cancel()
+    except WebSocketException:
+        counts["closed"] += 1
+
+
+async def reconnector(port, stop, counts):
+    # 不断新建连接
+    while not stop.is_set():
+        try:
+            async with connect(f"ws://127.0.0.1:{port}", local_addr=("127.0.0.2", 0)):
+                counts["accepted"] += 1
+        except InvalidStatus:
+            counts["refused"] += 1
+        except (OSError, WebSocketException):
+            pass
+
+
+async def good_client(port, i, args, latencies):
+    async with connect(f"ws://127.0.0.1:{port}", local_addr=(f"127.0.0.{3 + i % 200}", 0), max_size=None) as ws:
+        c = Client(ws, latencies)
+        await c.request(MsgType.INIT, f"good{i}")
+        await c.request(MsgType.REG, {"account": f"good{i}", "password": "pw"})
+        await c.request(MsgType.UPLOAD_SAVE, {"version": "1.0.0", "updatedAt": 1, "data": {"gold": i}})
+        latencies.clear()
+        for _ in range(args.requests):
+            await c.request(MsgType.DOWN_SAVE, None)
+            await asyncio.sleep(args.interval)
+        c.reader.cancel()
+
+
+async def run_once(args, limits):
+    with tempfile.TemporaryDirectory() as tmp:
+        Server.PBKDF2_ROUNDS = 1
+        handle = Server(
+            SQLiteStore(os.path.join(tmp, "saves.db")),
+            SQLiteStore(os.path.join(tmp, "saves.db"), "accounts"),
+            limits=limits,
+        )
+        stop = asyncio.Event()
+        counts = dict.fromkeys(("sent", "replies", "rejected", "closed", "accepted", "refused"), 0)
+        async with serve(
+            handle.accpect, "127.0.0.1", 0, ping_interval=None, max_size=handle.MAX_FRAME, process_request=handle.admit
+        ) as server:
+            port = server.sockets[0].getsockname()[1]
+            attack = [asyncio.create_task(attacker(port, i, stop, counts)) for i in range(args.attackers)]
+            attack.append(asyncio.create_task(reconnector(port, stop, counts)))
+            await asyncio.sleep(0.5)
+            lats = [{} for _ in range(args.clients)]
+            await asyncio.gather(*(good_client(port, i, args, lats[i]) for i in range(args.clients)))
+            stop.set()
+            await asyncio.wait(attack, timeout=5)
+        await handle.writes.close()
+    values = [v for lat in lats for v in lat.get(MsgType.DOWN_SAVE, [])]
+    return common.summary(values), counts
+
+
+async def run(args):
+    for label, limits in (("no limit", None), ("limited", RateLimiter())):
+        s, c = await run_once(args, limits)
+        print(
+            f"{label:9} good p50={s['p50_us'] / 1000:7.2f}ms p99={s['p99_us'] / 1000:7.2f}ms | "
+            f"flood sent={c['sent']} rejected={c['rejected']} closed={c['closed']} | "
+            f"reconnects accepted={c['accepted']} refused={c['refused']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--attackers", type=int, default=4, help="洪泛连接数")
+    parser.add_argument("--clients", type=int, default=20, help="正常客户端数")
+    parser.add_argument("--requests", type=int, default=50, help="每个正常客户端的请求数")
+    parser.add_argument("--interval", type=float, default=0.02, help="正常客户端的请求间隔（秒）")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+回复编码基准测试
+
+对比旧版 Message.dump（str(data) 再 json.dumps）与当前实现每秒可编码的回复数
+
+    python bench/bench_reply.py
+"""
+import argparse
+import json
+import time
+
+import common
+import codec
+from connect import Message
+from model import MsgCode, MsgType
+
+
+def legacy_dump(msg):
+    return json.dumps(
+        {"code": msg.code, "type": msg.type, "data": str(msg.data)}, ensure_ascii=False
+    )
+
+
+def rate(func, msg, seconds):
+    n = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for _ in range(100):
+            func(msg)
+        n += 100
+    return n / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=1.0)
+    parser.add_argument("--items", type=int, default=1000, help="存档中的物品数量")
+    args = parser.parse_args()
+
+    save = {
+        "version": "1.0.0",
+        "updatedAt": 0,
+        "data": {"items": [{"id": i, "count": i % 97} for i in range(args.items)]},
+    }
+    cases = {
+        "done": Message(MsgCode.OK, MsgType.RET, "done", 1),
+        "error": Message(MsgCode.ClientError, MsgType.RET, "未登录", 1),
+        "dict": Message(MsgCode.OK, MsgType.RET, {"version": 3, "updatedAt": 0}, 1),
+        "save": Message(MsgCode.OK, MsgType.RET, save, 1),
+        # 存储中取出的已编码存档
+        "save-bytes": Message(MsgCode.OK, MsgType.RET, codec.dumps(save), 1),
+    }
+    print(f"backend={codec.BACKEND}")
+    for name, msg in cases.items():
+        old = rate(legacy_dump, msg, args.seconds)
+        new = rate(Message.dump, msg, args.seconds)
+        print(f"  {name:10} legacy={old:12,.0f}/s current={new:12,.0f}/s x{new / old:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+重启基准测试
+
+客户端持续以 ack=enqueue 上传存档（入队即回复）并下载，期间重启服务器，比较:
+
+- kill:  SIGKILL 后重新启动（相当于没有平滑关闭）
+- drain: SIGTERM 平滑关闭后重新启动
+- hot:   SIGUSR2 热重启，监听套接字交给新进程
+
+统计失败的请求、连接被拒绝的次数、客户端从断开到重新可用的最长时间，
+以及结束后核对存储中已确认却丢失的上传数
+
+    python bench/bench_restart.py --clients 50 --duration 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+from loadgen import SERVER, free_port, wait_port
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from model import MsgCode, MsgType
+from storage import open_store
+
+
+class Session:
+    """
+    断线后凭令牌自动重连的客户端，一次只发一个请求
+    """
+
+    def __init__(self, url, i, stats):
+        self.url = url
+        self.name = f"client{i}"
+        self.account = f"user{i}"
+        self.stats = stats
+        self.token = None
+        self.ws = None
+        self.next_id = 0
+        self.acked = 0  # 已确认的最大 updatedAt
+
+    async def connect(self):
+        down = time.perf_counter()
+        while True:
+            try:
+                self.ws = await connect(self.url, max_size=None)
+                if self.token is not None:
+                    reply = await self.call(MsgType.INIT, {"token": self.token})
+                    if reply["data"].get("resumed"):
+                        self.token = reply["data"]["token"]
+                        break
+                    await self.ws.close()
+                    self.token = None
+                    continue
+                await self.call(MsgType.INIT, {"name": self.name, "session": True, "takeover": True})
+                reply = await self.call(MsgType.REG, {"account": self.account, "password": "pw"})
+                self.token = reply["data"]["token"]
+                break
+            except (OSError, ConnectionClosed, InvalidHandshake):
+                # 进程被杀死时握手可能只收到不完整的 HTTP 回复
+                self.stats["refused"] += 1
+                await asyncio.sleep(0.05)
+        self.stats["gap"] = max(self.stats["gap"], time.perf_counter() - down)
+
+    async def call(self, type_, data):
+        self.next_id += 1
+        await self.ws.send(json.dumps({"code": MsgCode.OK, "type": type_, "data": data, "id": self.next_id}))
+        while True:
+            reply = json.loads(await self.ws.recv())
+            if reply.get("id") == self.next_id:
+                return reply
+
+    async def run(self, deadline):
+        n = 0
+        while time.perf_counter() < deadline:
+            n += 1
+            updated_at = int(time.time() * 1000) * 1000 + n
+            try:
+                reply = await self.call(
+                    MsgType.UPLOAD_SAVE, {"version": "1.0.0", "updatedAt": updated_at, "ack": "enqueue", "data": {"n": n}}
+                )
+                if reply["code"] == MsgCode.OK:
+                    self.acked = updated_at
+                else:
+                    self.stats["failed"] += 1
+                reply = await self.call(MsgType.DOWN_SAVE, None)
+                if reply["code"] != MsgCode.OK:
+                    self.stats["failed"] += 1
+                self.stats["requests"] += 2
+            except ConnectionClosed:
+                self.stats["failed"] += 1
+                await self.connect()
+        await self.ws.close()
+
+
+def wait_group(pgid, timeout=30):
+    """
+    等待进程组中的所有进程退出
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            os.killpg(pgid, 0)
+        except ProcessLookupError:
+            return
+        time.sleep(0.05)
+    os.killpg(pgid, signal.SIGKILL)
+
+
+def start_server(port, store):
+    return subprocess.Popen(
+        [sys.executable, SERVER, "--port", str(port), "--store", store, "--no-rate-limit"],
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def kill_group(pgid):
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_mode(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = f"sqlite:{tmp}/saves.db"
+        port = free_port()
+        servers = [start_server(port, store)]
+        try:
+            stats, lost = await measure(mode, args, store, port, servers)
+        finally:
+            # 出错时也不留下服务器进程，热重启后的新进程与旧进程在同一进程组
+            for server in servers:
+                kill_group(server.pid)
+    print(
+        f"{mode:5} requests={stats['requests']:6} failed={stats['failed']:4} refused={stats['refused']:4} "
+        f"max gap={stats['gap'] * 1000:7.1f}ms lost acked uploads={lost}"
+    )
+
+
+async def measure(mode, args, store, port, servers):
+    """
+    运行客户端并在中途重启，返回 (统计, 丢失的已确认上传数)；启动的服务器进程追加到 servers
+    """
+    server = servers[0]
+    wait_port(port)
+    stats = dict.fromkeys(("requests", "failed", "refused", "gap"), 0)
+    sessions = [Session(f"ws://127.0.0.1:{port}", i, stats) for i in range(args.clients)]
+    # 先全部登录（REG 的 PBKDF2 较慢），再开始计时
+    await asyncio.gather(*(s.connect() for s in sessions))
+    stats["refused"] = 0
+    deadline = time.perf_counter() + args.duration
+    clients = asyncio.gather(*(s.run(deadline) for s in sessions))
+
+    await asyncio.sleep(args.duration / 2)
+    stats["gap"] = 0
+    if mode == "hot":
+        server.send_signal(signal.SIGUSR2)
+    else:
+        if mode == "kill":
+            # 连同进程池一起结束，相当于 systemd 按 cgroup 杀死服务
+            os.killpg(server.pid, signal.SIGKILL)
+        else:
+            server.send_signal(signal.SIGTERM)
+        await asyncio.to_thread(server.wait)
+        await asyncio.to_thread(wait_group, server.pid)
+        server = start_server(port, store)
+        servers.append(server)
+    await clients
+
+    # SIGTERM 平滑关闭，进程组中还有热重启后的新进程
+    os.killpg(server.pid, signal.SIGTERM)
+    await asyncio.to_thread(server.wait)
+    await asyncio.to_thread(wait_group, server.pid)
+    saves = open_store(store)
+    lost = 0
+    for s in sessions:
+        record = saves.get(s.account)
+        if record is None or record.updated_at < s.acked:
+            lost += 1
+    saves.close()
+    return stats, lost
+
+
+async def run(args):
+    for mode in args.modes.split(","):
+        await run_mode(mode, args)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50, help="客户端数")
+    parser.add_argument("--duration", type=float, default=4, help="每种方式的运行时间（秒），在中间重启")
+    parser.add_argument("--modes", default="kill,drain,hot", help="逗号分隔的重启方式")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
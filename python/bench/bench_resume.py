@@ -0,0 +1,139 @@
+"""
+会话恢复基准测试
+
+模拟网络抖动后所有客户端同时重连，比较两种方式从建立连接到可以收发存档的耗时:
+重新 INIT + REG（PBKDF2 校验密码、查询账号表）与凭令牌恢复（只校验 HMAC）；
+另外验证断线前未完成的分块上传在恢复后可以继续
+
+    python bench/bench_resume.py --clients 100
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+import time
+
+import common
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+from bench_dispatch import Client
+from model import MsgCode, MsgType
+from server import Server
+from storage import SQLiteStore
+
+
+class CountingStore:
+    """
+    统计账号表的读取次数
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.gets = 0
+
+    def get(self, key):
+        self.gets += 1
+        return self.target.get(key)
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+async def login(port, i):
+    ws = await connect(f"ws://127.0.0.1:{port}", max_size=None)
+    c = Client(ws, {})
+    await c.request(MsgType.INIT, {"name": f"client{i}", "session": True})
+    reply = await c.request(MsgType.REG, {"account": f"user{i}", "password": "pw"})
+    return c, reply["data"]["token"]
+
+
+async def reconnect(port, i, token, latencies):
+    start = time.perf_counter()
+    ws = await connect(f"ws://127.0.0.1:{port}", max_size=None)
+    c = Client(ws, {})
+    if token is None:
+        await c.request(MsgType.INIT, {"name": f"client{i}", "session": True, "takeover": True})
+        await c.request(MsgType.REG, {"account": f"user{i}", "password": "pw"})
+    else:
+        reply = await c.request(MsgType.INIT, {"token": token})
+        assert reply["data"]["resumed"], reply
+    latencies.append(time.perf_counter() - start)
+    return c
+
+
+async def close(c):
+    c.reader.cancel()
+    await c.ws.close()
+
+
+async def check_upload(port):
+    """
+    分块上传发送一半后断线，凭令牌重连后从下一块继续
+    """
+    data = os.urandom(3 * 65536)
+    c, token = await login(port, "upload")
+    reply = await c.request(
+        MsgType.UPLOAD_SAVE,
+        {"stream": True, "updatedAt": 1, "size": len(data), "sha256": hashlib.sha256(data).hexdigest()},
+    )
+    tid, chunk = reply["data"]["tid"], reply["data"]["chunk"]
+    pieces = [data[i : i + chunk] for i in range(0, len(data), chunk)]
+    await c.request(MsgType.UPLOAD_CHUNK, {"tid": tid, "seq": 0, "data": base64.b64encode(pieces[0]).decode()})
+    await close(c)
+    await asyncio.sleep(0.1)
+
+    ws = await connect(f"ws://127.0.0.1:{port}", max_size=None)
+    c = Client(ws, {})
+    reply = await c.request(MsgType.INIT, {"token": token})
+    seq = next(u["seq"] for u in reply["data"]["uploads"] if u["tid"] == tid)
+    for i in range(seq, len(pieces)):
+        reply = await c.request(MsgType.UPLOAD_CHUNK, {"tid": tid, "seq": i, "data": base64.b64encode(pieces[i]).decode()})
+    await close(c)
+    return reply["code"] == MsgCode.OK and "rev" in reply["data"]
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        Server.PBKDF2_ROUNDS = args.rounds
+        accounts = CountingStore(SQLiteStore(os.path.join(tmp, "saves.db"), "accounts"))
+        handle = Server(SQLiteStore(os.path.join(tmp, "saves.db")), accounts)
+        async with serve(handle.accpect, "127.0.0.1", 0, ping_interval=None, max_size=None) as server:
+            port = server.sockets[0].getsockname()[1]
+            sessions = [await login(port, i) for i in range(args.clients)]
+            tokens = [token for _, token in sessions]
+            clients = [c for c, _ in sessions]
+
+            for label, use_token in (("INIT+REG", False), ("token", True)):
+                await asyncio.gather(*(close(c) for c in clients))
+                before, latencies = accounts.gets, []
+                with common.Timer() as t:
+                    clients = await asyncio.gather(
+                        *(
+                            reconnect(port, i, tokens[i] if use_token else None, latencies)
+                            for i in range(args.clients)
+                        )
+                    )
+                s = common.summary(latencies)
+                print(
+                    f"{label:8} {args.clients} reconnects in {t.elapsed * 1000:8.1f}ms "
+                    f"p50={s['p50_us'] / 1000:7.2f}ms p99={s['p99_us'] / 1000:7.2f}ms "
+                    f"account reads={accounts.gets - before}"
+                )
+            await asyncio.gather(*(close(c) for c in clients))
+            print("resume chunked upload:", "ok" if await check_upload(port) else "FAILED")
+        if handle.writes is not None:
+            await handle.writes.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100, help="同时重连的客户端数")
+    parser.add_argument("--rounds", type=int, default=Server.PBKDF2_ROUNDS, help="PBKDF2 迭代次数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
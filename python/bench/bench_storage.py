@@ -0,0 +1,95 @@
+"""
+存档存储基准测试
+
+分别向各存储引擎写入 N 份存档，然后随机读写单个账号，统计 p50/p99 延迟
+
+    python bench/bench_storage.py --sizes 10000 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import common
+from storage import LogStore, SQLiteStore
+
+
+def make_store(kind, tmp):
+    if kind == "sqlite":
+        return SQLiteStore(os.path.join(tmp, "saves.db"))
+    return LogStore(os.path.join(tmp, "saves.log"))
+
+
+def fill(store, n, payload):
+    if isinstance(store, SQLiteStore):
+        # 批量预填充，不计入统计
+        with store.lock:
+            store.db.execute("BEGIN")
+            store.db.executemany(
+                "INSERT INTO saves_data (blob, seq, data) VALUES (?, 0, ?)",
+                ((i + 1, payload) for i in range(n)),
+            )
+            store.db.executemany(
+                "INSERT INTO saves (key, version, updated_at, blob) VALUES (?, 1, 0, ?)",
+                ((f"user{i}", i + 1) for i in range(n)),
+            )
+            store.db.execute("COMMIT")
+    else:
+        for i in range(n):
+            store.put(f"user{i}", payload, 0)
+
+
+def run(kind, n, ops, payload):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = make_store(kind, tmp)
+        fill(store, n, payload)
+
+        reads, writes = [], []
+        for _ in range(ops):
+            key = f"user{random.randrange(n)}"
+            t = time.perf_counter()
+            store.get(key)
+            reads.append(time.perf_counter() - t)
+
+            t = time.perf_counter()
+            store.put(key, payload)
+            writes.append(time.perf_counter() - t)
+
+        if isinstance(store, LogStore):
+            # 重启后重建索引的耗时
+            store.close()
+            t = time.perf_counter()
+            store = LogStore(store.path)
+            reopen = time.perf_counter() - t
+        else:
+            reopen = None
+        store.close()
+
+    return {"read": common.summary(reads), "write": common.summary(writes), "reopen_s": reopen}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--save-size", type=int, default=4096, help="单个存档字节数")
+    parser.add_argument("--engines", nargs="+", default=["sqlite", "log"])
+    args = parser.parse_args()
+
+    payload = os.urandom(args.save_size)
+    for n in args.sizes:
+        for kind in args.engines:
+            r = run(kind, n, args.ops, payload)
+            line = (
+                f"{kind:6} n={n:<7} "
+                f"get p50={r['read']['p50_us']:8.1f}us p99={r['read']['p99_us']:8.1f}us  "
+                f"put p50={r['write']['p50_us']:8.1f}us p99={r['write']['p99_us']:8.1f}us"
+            )
+            if r["reopen_s"] is not None:
+                line += f"  reopen={r['reopen_s'] * 1000:.0f}ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
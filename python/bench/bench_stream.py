@@ -0,0 +1,109 @@
+"""
+分块传输测试
+
+用分块模式上传、下载一份大存档，校验内容并记录服务器进程的内存峰值增量
+
+    python bench/bench_stream.py --size 64
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import resource
+import tempfile
+import time
+
+import common
+import codec
+from connect import Message
+from model import MsgCode, MsgType
+from server import Server
+from storage import SQLiteStore
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+
+def rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args):
+    Server.PBKDF2_ROUNDS = 1
+    blob = os.urandom(args.size * 1024 * 1024)
+    digest = hashlib.sha256(blob).hexdigest()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "saves.db")
+        handle = Server(SQLiteStore(db), SQLiteStore(db, "accounts"))
+        async with serve(handle.accpect, "127.0.0.1", 0, ping_interval=None) as server:
+            port = server.sockets[0].getsockname()[1]
+            async with connect(f"ws://127.0.0.1:{port}", compression=None) as ws:
+                wire = codec.WireCodec("msgpack" if "msgpack" in codec.FORMATS else "json")
+                init = {"name": "c", "formats": [wire.format]}
+                await ws.send(Message(MsgCode.OK, MsgType.INIT, init).dump(), text=True)
+                await ws.recv()
+
+                async def send(type_, data, id=None):
+                    msg = Message(MsgCode.OK, type_, data, id)
+                    if wire.binary:
+                        await ws.send(wire.encode(msg)[0])
+                    else:
+                        await ws.send(msg.dump(), text=True)
+
+                async def recv():
+                    raw = await ws.recv()
+                    if isinstance(raw, str):
+                        return codec.loads(raw)
+                    return wire.decode(raw)[0]
+
+                await send(MsgType.REG, {"account": "u", "password": "pw"})
+                await recv()
+
+                base_rss = rss_mib()
+                t = time.perf_counter()
+                start = {"stream": True, "updatedAt": 1, "size": len(blob), "sha256": digest}
+                await send(MsgType.UPLOAD_SAVE, start)
+                reply = await recv()
+                tid, size, window = reply["data"]["tid"], reply["data"]["chunk"], reply["data"]["window"]
+                view = memoryview(blob)
+                inflight = 0
+                for seq, offset in enumerate(range(0, len(blob), size)):
+                    chunk = bytes(view[offset : offset + size])
+                    if inflight >= window:
+                        await recv()
+                        inflight -= 1
+                    await send(MsgType.UPLOAD_CHUNK, {"tid": tid, "seq": seq, "data": chunk})
+                    inflight += 1
+                while inflight:
+                    last = await recv()
+                    inflight -= 1
+                up = time.perf_counter() - t
+                assert "rev" in last["data"], last
+
+                t = time.perf_counter()
+                await send(MsgType.DOWN_SAVE, {"stream": True})
+                received = hashlib.sha256()
+                while True:
+                    reply = await recv()
+                    if reply["type"] == MsgType.DOWN_CHUNK:
+                        data = reply["data"]["data"]
+                        received.update(data if isinstance(data, bytes) else codec.base64.b64decode(data))
+                    elif reply["data"].get("done"):
+                        break
+                down = time.perf_counter() - t
+                assert received.hexdigest() == digest == reply["data"]["sha256"]
+
+    print(
+        f"{args.size}MiB format={wire.format} upload={up:.2f}s download={down:.2f}s "
+        f"peak rss +{rss_mib() - base_rss:.1f}MiB (payload itself {args.size}MiB)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=64, help="存档大小（MiB）")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+多版本升级基准测试
+
+连续构建 6 个版本（每个版本修改约 5% 的小文件和一个较大的 bundle，新增和删除少量文件），
+每次构建后调用 build.py 的 make_deltas，并统计归档去重后的大小:
+
+- chain:  --keep-versions 1，只有相邻版本之间的补丁，落后多个版本时需要依次应用
+- direct: --keep-versions 5，最近 5 个版本都有直接到最新版本的补丁
+
+对每个旧版本用 patch.py --index 升级到最新版本，比较下载量、耗时和应用的补丁数，并确认结果与最新版本一致
+
+    python bench/bench_version_deltas.py --files 500 --bundle 2048
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+from bench_build_download import ROOT, load_build
+from bench_patch_apply import snapshot
+from bench_patch_memory import PATCH
+
+VERSIONS = [f"1.{i}.0" for i in range(6)]
+
+
+def write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def next_version(rng: random.Random, step: int, count: int, small: int, bundle: int):
+    """
+    在 html 上生成下一个版本
+    """
+    if step == 0:
+        shutil.rmtree("html", ignore_errors=True)
+        for i in range(count):
+            write(os.path.join("html", "assets", f"f{i}.js"), rng.randbytes(small))
+        write(os.path.join("html", "index.js"), rng.randbytes(bundle))
+        return
+    names = sorted(os.listdir(os.path.join("html", "assets")))
+    for name in rng.sample(names, len(names) // 20):
+        write(os.path.join("html", "assets", name), rng.randbytes(small))
+    for name in rng.sample(names, 5):
+        os.remove(os.path.join("html", "assets", name))
+    for i in range(10):
+        write(os.path.join("html", "assets", f"v{step}-{i}.js"), rng.randbytes(small))
+    with open(os.path.join("html", "index.js"), "rb") as f:
+        data = bytearray(f.read())
+    for _ in range(16):
+        pos = rng.randrange(len(data) - 256)
+        data[pos : pos + 256] = rng.randbytes(256)
+    write(os.path.join("html", "index.js"), bytes(data))
+
+
+def build_versions(build, keep: int, args) -> dict:
+    """
+    依次构建所有版本，返回 版本 -> 文件内容
+    """
+    rng = random.Random(0)
+    snapshots = {}
+    for step, version in enumerate(VERSIONS):
+        next_version(rng, step, args.files, args.small * 1024, args.bundle * 1024)
+        with open("package.json", "w") as f:
+            json.dump({"name": "bench", "version": version}, f)
+        builder = build.HtmlBuiler(
+            argparse.Namespace(diff_format="bsdiff", diff_workers=None, keep_versions=keep)
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            builder.make_deltas()
+        snapshots[version] = snapshot("html")
+    return snapshots
+
+
+def upgrade(installed: str, files: dict) -> tuple:
+    shutil.rmtree("install", ignore_errors=True)
+    for name, data in files.items():
+        write(os.path.join("install", name), data)
+    with open(os.path.join("install", ".patch-version"), "w") as f:
+        f.write(installed)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, PATCH, "--index", os.path.abspath("dist/patches/index.json")],
+        cwd="install",
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    match = re.search(r"via (\d+) patch\(es\), (\d+) bytes", proc.stdout)
+    patches, size = (int(match.group(1)), int(match.group(2))) if match else (0, 0)
+    return elapsed, patches, size, proc.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500, help="小文件数")
+    parser.add_argument("--small", type=int, default=8, help="小文件的大小（KiB）")
+    parser.add_argument("--bundle", type=int, default=2048, help="bundle 的大小（KiB）")
+    args = parser.parse_args()
+
+    build = load_build(open(os.path.join(ROOT, "build.py"), encoding="utf-8").read(), "build_current")
+    cwd = os.getcwd()
+    for label, keep in (("chain", 1), ("direct", 5)):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                snapshots = build_versions(build, keep, args)
+                stored = sum(len(d) for d in snapshot(os.path.join(".cache", "archive", "objects")).values())
+                kept = VERSIONS[-keep - 1 :]
+                raw = sum(len(d) for v in kept for d in snapshots[v].values())
+                print(f"{label:6} archive of {len(kept)} versions: {stored / 1024:.0f} KiB stored, {raw / 1024:.0f} KiB raw")
+                latest = snapshots[VERSIONS[-1]]
+                for installed in VERSIONS[:-1]:
+                    elapsed, patches, size, code = upgrade(installed, snapshots[installed])
+                    current = snapshot("install")
+                    current.pop(".patch-version", None)
+                    ok = code == 0 and current == latest
+                    print(
+                        f"{label:6} {installed} -> {VERSIONS[-1]} {patches} patch(es) "
+                        f"{size / 1024:8.1f} KiB {elapsed:5.2f}s {'ok' if ok else 'FAILED'}"
+                    )
+            finally:
+                os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
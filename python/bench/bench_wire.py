@@ -0,0 +1,122 @@
+"""
+帧编码对比
+
+用不同的协商结果上传、下载同一份存档，输出各消息类型节省的字节数，
+并检查损坏的压缩帧只会得到 ClientError 回复而不会断开连接
+
+    python bench/bench_wire.py --items 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import common
+import codec
+import offload
+from connect import Message, TRANSFER_STATS, TransferStats
+from model import MsgCode, MsgType
+from server import Server
+from storage import SQLiteStore
+from websockets.asyncio.client import connect
+from websockets.asyncio.server import serve
+
+
+async def session(port, name, formats, compress, save, rounds):
+    # 关闭 permessage-deflate，只比较应用层编码
+    async with connect(f"ws://127.0.0.1:{port}", max_size=None, compression=None) as ws:
+        init = {"name": name, "formats": formats, "compress": compress}
+        await ws.send(Message(MsgCode.OK, MsgType.INIT, init).dump(), text=True)
+        reply = Message.load(await ws.recv())
+        wire = codec.WireCodec(reply.data.format, reply.data.compress)
+
+        async def request(type_, data):
+            msg = Message(MsgCode.OK, type_, data)
+            if wire.binary:
+                frame, _ = wire.encode(msg)
+                await ws.send(frame)
+            else:
+                await ws.send(msg.dump(), text=True)
+            await ws.recv()
+
+        await request(MsgType.REG, {"account": name, "password": "pw"})
+        for _ in range(rounds):
+            await request(MsgType.UPLOAD_SAVE, save)
+            await request(MsgType.DOWN_SAVE, None)
+        return wire
+
+
+async def corrupt_frame(port, method, frame):
+    """
+    协商 method 压缩后发送损坏的帧，返回回复的 code 以及之后连接是否仍可用
+    """
+    async with connect(f"ws://127.0.0.1:{port}", max_size=None, compression=None) as ws:
+        init = {"name": f"corrupt-{method}-{len(frame)}", "compress": [method]}
+        await ws.send(Message(MsgCode.OK, MsgType.INIT, init).dump(), text=True)
+        await ws.recv()
+        wire = codec.WireCodec("json", method)
+        await ws.send(frame)
+        code = wire.decode(await ws.recv())[0]["code"]
+        frame, _ = wire.encode(Message(MsgCode.OK, MsgType.UNDEFINED, None))
+        await ws.send(frame)
+        await ws.recv()
+        return code
+
+
+async def run(args):
+    Server.PBKDF2_ROUNDS = 1
+    save = {
+        "version": "1.0.0",
+        "updatedAt": int(time.time() * 1000),
+        "data": {
+            "items": [
+                {"id": i, "name": f"item{i}", "count": random.randrange(999)}
+                for i in range(args.items)
+            ]
+        },
+    }
+    modes = [(["json"], [])]
+    for fmt in codec.FORMATS:
+        for method in codec.COMPRESSORS:
+            modes.append(([fmt], [method]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "saves.db")
+        handle = Server(SQLiteStore(db), SQLiteStore(db, "accounts"))
+        async with serve(
+            handle.accpect, "127.0.0.1", 0, ping_interval=None, max_size=None, compression=None
+        ) as server:
+            port = server.sockets[0].getsockname()[1]
+            for i, (formats, compress) in enumerate(modes):
+                TRANSFER_STATS["recv"] = TransferStats()
+                TRANSFER_STATS["send"] = TransferStats()
+                wire = await session(port, f"c{i}", formats, compress, save, args.rounds)
+                label = f"{wire.format}+{wire.compress or 'none'}"
+                for direction, stats in TRANSFER_STATS.items():
+                    for type_, (n, plain, sent) in stats.types.items():
+                        if type_ not in (MsgType.UPLOAD_SAVE, MsgType.DOWN_SAVE):
+                            continue
+                        print(
+                            f"{label:16} {direction:4} {type_:3} n={n:<3} "
+                            f"plain={plain // n:8d}B wire={sent // n:8d}B saved={stats.saved()[type_] // n:8d}B"
+                        )
+            # 大帧在进程池中解码
+            big = b"\x01" + os.urandom(offload.THRESHOLD)
+            for method in codec.COMPRESSORS:
+                for label, frame in (("small", b"\x01garbage"), ("large", big)):
+                    code = await corrupt_frame(port, method, frame)
+                    ok = "ok" if code == MsgCode.ClientError else "FAILED"
+                    print(f"corrupt {method:8} {label} frame: code={code} {ok}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+多进程扩展性测试
+
+分别以 1、2、4… 个工作进程启动 server.py，用多个客户端进程施加相同的负载，
+比较吞吐随工作进程数的变化
+
+    python bench/bench_workers.py --workers 1 2 4 --clients 400
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+from bench_dispatch import Client
+from model import MsgType
+from websockets.asyncio.client import connect
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def client(port, name, args, payload, latencies):
+    async with connect(f"ws://127.0.0.1:{port}", max_size=None) as ws:
+        c = Client(ws, latencies)
+        await c.request(MsgType.INIT, name)
+        await c.request(MsgType.REG, {"account": name, "password": "pw"})
+        for _ in range(args.rounds):
+            save = {"version": "1.0.0", "updatedAt": int(time.time() * 1000), "data": payload}
+            await c.request(MsgType.UPLOAD_SAVE, save)
+            await c.request(MsgType.DOWN_SAVE, None)
+        c.reader.cancel()
+
+
+def load_process(port, index, args, queue):
+    payload = {"items": [{"id": k, "count": k % 97} for k in range(args.items)]}
+    latencies = {}
+
+    async def run():
+        await asyncio.gather(
+            *(client(port, f"p{index}c{i}", args, payload, latencies) for i in range(args.clients))
+        )
+
+    asyncio.run(run())
+    queue.put(sum(len(v) for v in latencies.values()))
+
+
+def measure(workers, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        port = free_port()
+        cmd = [sys.executable, SERVER, "--port", str(port), "--store", f"sqlite:{tmp}/saves.db", "--no-rate-limit"]
+        if workers > 1:
+            cmd += ["--workers", str(workers)]
+        server = subprocess.Popen(cmd, stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.time() + 10
+            while time.time() < deadline:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            time.sleep(0.5 * workers)  # 等所有工作进程开始监听
+
+            queue = multiprocessing.Queue()
+            procs = [
+                multiprocessing.Process(target=load_process, args=(port, i, args, queue))
+                for i in range(args.procs)
+            ]
+            start = time.perf_counter()
+            for p in procs:
+                p.start()
+            total = sum(queue.get() for _ in procs)
+            elapsed = time.perf_counter() - start
+            for p in procs:
+                p.join()
+        finally:
+            server.terminate()
+            server.wait()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--procs", type=int, default=4, help="客户端进程数")
+    parser.add_argument("--clients", type=int, default=100, help="每个客户端进程的连接数")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--items", type=int, default=2000, help="存档中的物品数量")
+    args = parser.parse_args()
+
+    print(f"cpus={os.cpu_count()}")
+    base = None
+    for n in args.workers:
+        rate = measure(n, args)
+        base = base or rate
+        print(f"workers={n:<3} {rate:9.0f} req/s  x{rate / base:.2f}")
+
+
+if __name__ == "__main__":
+    main()
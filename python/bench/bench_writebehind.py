@@ -0,0 +1,85 @@
+"""
+延迟写入基准测试
+
+N 个账号并发连续上传完整存档（存储开启 fsync），比较:
+- direct: 每次上传单独写入
+- commit: 合并提交，写入存储后才回复
+- enqueue: 合并提交，入队即回复
+
+    python bench/bench_writebehind.py --accounts 200 --uploads 20
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import common
+from bench_delta import FakeConnection, make_save
+from connect import Message
+from model import MsgCode, MsgType
+from server import HANDLERS, Server
+from storage import open_store
+
+
+async def run_once(args, tmp, mode):
+    store = open_store(f"{args.store}:{os.path.join(tmp, mode)}{'.db' if args.store == 'sqlite' else ''}")
+    if hasattr(store, "fsync"):
+        store.fsync = True
+    else:
+        store.db.execute("PRAGMA synchronous=FULL")
+    Server.WRITE_WINDOW = 0 if mode == "direct" else args.window / 1000
+    handle = Server(store, store)
+    upload, _ = HANDLERS[MsgType.UPLOAD_SAVE]
+    save = make_save(args.items)
+    latencies = []
+
+    async def client(a):
+        conn = FakeConnection(f"user{a}")
+        for i in range(args.uploads):
+            package = dict(save, updatedAt=i, ack=mode if mode == "enqueue" else "commit")
+            msg = Message.from_dict({"code": MsgCode.OK, "type": MsgType.UPLOAD_SAVE, "data": package})
+            with common.Timer() as t:
+                code, _ = await upload(handle, conn, msg)
+            assert code == MsgCode.OK
+            latencies.append(t.elapsed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(a) for a in range(args.accounts)))
+    if handle.writes is not None:
+        await handle.writes.close()
+    elapsed = time.perf_counter() - start
+    stats = handle.writes.stats() if handle.writes is not None else None
+    store.close()
+    return elapsed, common.summary(latencies), stats
+
+
+async def run(args):
+    total = args.accounts * args.uploads
+    print(f"{args.accounts} accounts x {args.uploads} uploads, store={args.store}, fsync on")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("direct", "commit", "enqueue"):
+            elapsed, s, stats = await run_once(args, tmp, mode)
+            line = (
+                f"  {mode:8} {total / elapsed:8.0f} uploads/s  "
+                f"p50={s['p50_us'] / 1000:7.2f}ms p99={s['p99_us'] / 1000:7.2f}ms"
+            )
+            if stats is not None:
+                line += f"  commits={stats['commits']} ({stats['commits'] / elapsed:.0f}/s) written={stats['written']} coalesced={stats['coalesced']}"
+            else:
+                line += f"  commits={total} ({total / elapsed:.0f}/s)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--uploads", type=int, default=20, help="每个账号的上传次数")
+    parser.add_argument("--items", type=int, default=200, help="存档中的物品数量")
+    parser.add_argument("--window", type=float, default=5, help="合并窗口（毫秒）")
+    parser.add_argument("--store", choices=("sqlite", "log"), default="sqlite")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+基准测试公共工具
+"""
+import os
+import sys
+import time
+
+# 让 bench 下的脚本可以直接导入 python/ 下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    """
+    计算百分位数（最近秩法），values 需已排序
+    """
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[k]
+
+
+def summary(latencies):
+    """
+    延迟统计，输入单位为秒，输出单位为微秒
+    """
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_us": percentile(values, 50) * 1e6,
+        "p99_us": percentile(values, 99) * 1e6,
+        "max_us": (values[-1] if values else 0.0) * 1e6,
+    }
+
+
+class Timer:
+    def __init__(self):
+        self.start = 0.0
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
@@ -0,0 +1,378 @@
+"""
+存档服务器负载生成器
+
+启动本地 server.py（或连接已有的服务器），由若干客户端进程运行 N 个异步客户端，
+每个客户端先 INIT/REG，之后按给定比例重放上传、下载、条件下载和增量上传，
+报告吞吐、各操作的延迟分位数、服务器的内存与 CPU，并把结果保存为 JSON 以便对比版本
+
+    python bench/loadgen.py --clients 500 --duration 30 --mix upload=2,down=5,cached=2,delta=1 \\
+        --save-size 4k=7,64k=2,1m=1 --out results/1.4.1.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+from model import MsgCode, MsgType
+from websockets.asyncio.client import connect
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server.py")
+OPS = ("upload", "down", "cached", "delta")
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def parse_weights(text: str, convert=str) -> dict:
+    """
+    解析 "a=1,b=2" 形式的权重
+    """
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        weights[convert(name.strip())] = float(weight or 1)
+    return weights
+
+
+def parse_size(text: str) -> int:
+    units = {"k": 1024, "m": 1024 * 1024}
+    text = text.lower()
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def make_save(size: int) -> dict:
+    # 每个物品编码后约 40 字节
+    items = [{"id": i, "count": random.randrange(1000), "flag": i % 3} for i in range(max(1, size // 40))]
+    return {"version": "1.0.0", "updatedAt": 0, "data": {"gold": 0, "items": items}}
+
+
+class Client:
+    """
+    一个连接，按请求编号匹配回复，记录每种操作的延迟
+    """
+
+    def __init__(self, ws, result):
+        self.ws = ws
+        self.result = result
+        self.pending = {}
+        self.next_id = 0
+        self.rev = None
+        self.reader = asyncio.create_task(self.read())
+
+    async def read(self):
+        async for raw in self.ws:
+            reply = json.loads(raw)
+            fut = self.pending.pop(reply.get("id"), None)
+            if fut is not None:
+                fut.set_result(reply)
+
+    async def request(self, op, type_, data):
+        rid = self.next_id
+        self.next_id += 1
+        fut = asyncio.get_running_loop().create_future()
+        self.pending[rid] = fut
+        frame = json.dumps({"code": MsgCode.OK, "type": type_, "data": data, "id": rid})
+        t = time.perf_counter()
+        await self.ws.send(frame)
+        reply = await fut
+        self.result["latency"].setdefault(op, []).append(time.perf_counter() - t)
+        self.result["sent_bytes"] += len(frame)
+        if reply["code"] not in (MsgCode.OK, MsgCode.NotModified, MsgCode.Conflict):
+            self.result["errors"][op] = self.result["errors"].get(op, 0) + 1
+        return reply
+
+
+async def client(url, name, args, save, deadline, result):
+    ops = list(args.mix)
+    weights = list(args.mix.values())
+    async with connect(url, max_size=None) as ws:
+        c = Client(ws, result)
+        await c.request("init", MsgType.INIT, name)
+        await c.request("reg", MsgType.REG, {"account": name, "password": "pw"})
+        n = 0
+        while time.perf_counter() < deadline and (not args.requests or n < args.requests):
+            n += 1
+            op = random.choices(ops, weights)[0]
+            now = int(time.time() * 1000)
+            if op == "upload" or c.rev is None:
+                # 还没有存档时先上传
+                save["updatedAt"] = now
+                reply = await c.request("upload", MsgType.UPLOAD_SAVE, save)
+                c.rev = reply["data"].get("rev") if reply["code"] == MsgCode.OK else None
+            elif op == "down":
+                reply = await c.request("down", MsgType.DOWN_SAVE, None)
+                if reply["code"] == MsgCode.OK:
+                    c.rev = reply["data"]["rev"]
+            elif op == "cached":
+                # 客户端已有最新存档，期待 NotModified
+                await c.request("cached", MsgType.DOWN_SAVE, {"rev": c.rev})
+            else:
+                save["data"]["gold"] += 1
+                patch = [{"op": "replace", "path": "/data/gold", "value": save["data"]["gold"]}]
+                reply = await c.request("delta", MsgType.UPLOAD_SAVE, {"base": c.rev, "updatedAt": now, "patch": patch})
+                c.rev = reply["data"].get("rev") if isinstance(reply["data"], dict) else None
+            if args.think:
+                await asyncio.sleep(random.expovariate(1 / args.think))
+        c.reader.cancel()
+
+
+def load_process(url, index, args, sizes, queue):
+    """
+    客户端进程，结束时把延迟和计数放入 queue
+    """
+    result = {"latency": {}, "errors": {}, "sent_bytes": 0, "failed_clients": 0}
+    saves = {size: make_save(size) for size in sizes}
+
+    async def one(i):
+        size = random.choices(list(sizes), list(sizes.values()))[0]
+        save = json.loads(json.dumps(saves[size]))
+        try:
+            await client(url, f"p{index}c{i}", args, save, deadline, result)
+        except Exception:
+            result["failed_clients"] += 1
+
+    async def run():
+        # 连接在 ramp 秒内均匀建立
+        tasks = []
+        for i in range(index, args.clients, args.procs):
+            tasks.append(asyncio.create_task(one(i)))
+            await asyncio.sleep(args.ramp / max(1, args.clients))
+        await asyncio.gather(*tasks)
+
+    deadline = time.perf_counter() + args.ramp + args.duration
+    asyncio.run(run())
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    result["cpu_seconds"] = usage.ru_utime + usage.ru_stime
+    queue.put(result)
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                pids += [int(c) for c in f.read().split()]
+        except OSError:
+            pass
+    return pids
+
+
+def sample_server(pid: int) -> dict:
+    """
+    读取服务器进程（含工作进程）的 CPU 时间与内存，仅支持 Linux
+    """
+    cpu, rss = 0.0, 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            cpu += (int(fields[11]) + int(fields[12])) / CLK_TCK
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss += int(line.split()[1]) * 1024
+        except (OSError, IndexError, ValueError):
+            pass
+    return {"cpu_seconds": cpu, "rss_bytes": rss}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("服务器未能启动")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(SERVER), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, sizes, tmp):
+    server, url = None, args.url
+    if url is None:
+        port = free_port()
+        cmd = [sys.executable, SERVER, "--port", str(port), "--store", f"{args.store}:{tmp}/saves{'.db' if args.store == 'sqlite' else ''}", "--no-rate-limit"]
+        if args.workers > 1:
+            cmd += ["--workers", str(args.workers)]
+        # 单独的进程组，结束时连同工作进程、进程池一起终止
+        server = subprocess.Popen(cmd + args.server_args, stderr=subprocess.DEVNULL, start_new_session=True)
+        wait_port(port)
+        time.sleep(0.5 * args.workers)
+        url = f"ws://127.0.0.1:{port}"
+
+    try:
+        before = sample_server(server.pid) if server else None
+        peak_rss = 0
+        queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=load_process, args=(url, i, args, sizes, queue))
+            for i in range(args.procs)
+        ]
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        results = []
+        while len(results) < len(procs):
+            try:
+                results.append(queue.get(timeout=0.5))
+            except Exception:
+                pass
+            if server:
+                peak_rss = max(peak_rss, sample_server(server.pid)["rss_bytes"])
+        elapsed = time.perf_counter() - start
+        for p in procs:
+            p.join()
+        after = sample_server(server.pid) if server else None
+    finally:
+        if server:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+
+    latency, errors = {}, {}
+    for r in results:
+        for op, values in r["latency"].items():
+            latency.setdefault(op, []).extend(values)
+        for op, n in r["errors"].items():
+            errors[op] = errors.get(op, 0) + n
+    total = sum(len(v) for v in latency.values())
+    report = {
+        "elapsed_seconds": elapsed,
+        "requests": total,
+        "throughput": total / elapsed,
+        "sent_bytes": sum(r["sent_bytes"] for r in results),
+        "failed_clients": sum(r["failed_clients"] for r in results),
+        "errors": errors,
+        "client_cpu_seconds": sum(r["cpu_seconds"] for r in results),
+        "ops": {},
+    }
+    for op, values in sorted(latency.items()):
+        values.sort()
+        report["ops"][op] = {
+            "count": len(values),
+            "rate": len(values) / elapsed,
+            "p50_ms": common.percentile(values, 50) * 1000,
+            "p90_ms": common.percentile(values, 90) * 1000,
+            "p99_ms": common.percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+    if server:
+        report["server"] = {
+            "cpu_seconds": after["cpu_seconds"] - before["cpu_seconds"],
+            "cpu_percent": (after["cpu_seconds"] - before["cpu_seconds"]) / elapsed * 100,
+            "rss_bytes": after["rss_bytes"],
+            "peak_rss_bytes": peak_rss,
+        }
+    return report
+
+
+def print_report(report):
+    print(
+        f"{report['requests']} requests in {report['elapsed_seconds']:.1f}s, "
+        f"{report['throughput']:.0f} req/s, failed clients={report['failed_clients']}, errors={report['errors']}"
+    )
+    for op, s in report["ops"].items():
+        print(
+            f"  {op:7} n={s['count']:<7} {s['rate']:8.1f}/s p50={s['p50_ms']:8.2f}ms "
+            f"p90={s['p90_ms']:8.2f}ms p99={s['p99_ms']:8.2f}ms max={s['max_ms']:8.2f}ms"
+        )
+    server = report.get("server")
+    if server:
+        print(
+            f"  server cpu={server['cpu_percent']:.0f}% rss={server['rss_bytes'] / 1024 / 1024:.1f}MiB "
+            f"peak={server['peak_rss_bytes'] / 1024 / 1024:.1f}MiB"
+        )
+    print(f"  client cpu={report['client_cpu_seconds']:.1f}s")
+
+
+def compare(report, path):
+    """
+    与之前保存的结果对比吞吐和 p99
+    """
+    with open(path, encoding="utf-8") as f:
+        base = json.load(f)
+    old = base["results"]
+    print(f"compared with {path} ({base.get('revision')}):")
+    print(f"  throughput {old['throughput']:8.0f} -> {report['throughput']:8.0f} req/s ({report['throughput'] / old['throughput'] - 1:+.1%})")
+    for op, s in report["ops"].items():
+        prev = old["ops"].get(op)
+        if prev:
+            print(f"  {op:7} p99 {prev['p99_ms']:8.2f} -> {s['p99_ms']:8.2f}ms ({s['p99_ms'] / prev['p99_ms'] - 1:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="连接已有的服务器，不指定时启动本地 server.py")
+    parser.add_argument("--store", choices=("sqlite", "log"), default="sqlite", help="本地服务器的存储")
+    parser.add_argument("--workers", type=int, default=1, help="本地服务器的工作进程数")
+    parser.add_argument("--server-args", nargs=argparse.REMAINDER, default=[], help="传给 server.py 的其他参数")
+    parser.add_argument("--clients", type=int, default=200, help="客户端总数")
+    parser.add_argument("--procs", type=int, default=max(1, (os.cpu_count() or 1) // 2), help="客户端进程数")
+    parser.add_argument("--duration", type=float, default=10, help="所有客户端连上后持续施压的秒数")
+    parser.add_argument("--requests", type=int, default=0, help="每个客户端的请求数上限，0 为不限")
+    parser.add_argument("--ramp", type=float, default=1, help="建立全部连接所用的秒数")
+    parser.add_argument("--think", type=float, default=0, help="请求之间的平均间隔（秒）")
+    parser.add_argument("--mix", default="upload=2,down=5,cached=2,delta=1", help=f"操作比例，可选 {', '.join(OPS)}")
+    parser.add_argument("--save-size", default="16k", help="存档大小及比例，如 4k=7,64k=2,1m=1")
+    parser.add_argument("--out", help="把结果保存为 JSON")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+
+    args.mix = parse_weights(args.mix)
+    unknown = set(args.mix) - set(OPS)
+    if unknown:
+        parser.error(f"未知的操作: {', '.join(unknown)}")
+    sizes = parse_weights(args.save_size, parse_size)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = run(args, sizes, tmp)
+    print_report(report)
+    if args.compare:
+        compare(report, args.compare)
+
+    if args.out:
+        config = {k: v for k, v in vars(args).items() if k not in ("out", "compare")}
+        config["save_size"] = {str(k): v for k, v in sizes.items()}
+        data = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": config,
+            "results": report,
+        }
+        if os.path.dirname(args.out):
+            os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+本地镜像服务器，用于测试 build.py 的下载
+
+按 /<镜像名>/<路径> 提供内存中的文件，支持 Range 请求；
+每个镜像可以限速、在首次传输到一定字节数时断开连接（模拟网络中断）
+"""
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Mirror:
+    """
+    Attributes:
+        rate: 限速（字节/秒），None 表示不限速
+        drop_after: 每个文件第一次传输到该字节数时断开连接
+        delay: 回复前等待的时间（秒）
+    """
+
+    def __init__(self, rate=None, drop_after=None, delay=0.0):
+        self.rate = rate
+        self.drop_after = drop_after
+        self.delay = delay
+        self.dropped = set()  # 已经断开过的路径
+        self.sent = 0  # 发送的字节数
+        self.requests = 0
+
+
+class MirrorServer:
+    def __init__(self, files: dict, mirrors: dict):
+        self.files = files  # 路径 -> 内容
+        self.mirrors = mirrors  # 镜像名 -> Mirror
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def url(self, mirror: str, path: str) -> str:
+        return f"http://127.0.0.1:{self.port}/{mirror}/{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                name, _, path = self.path.lstrip("/").partition("/")
+                mirror = server.mirrors.get(name)
+                data = server.files.get(path)
+                if mirror is None or data is None:
+                    self.send_error(404)
+                    return
+                with server.lock:
+                    mirror.requests += 1
+                time.sleep(mirror.delay)
+
+                start, end = 0, len(data) - 1
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if match:
+                    start = int(match.group(1))
+                    if match.group(2):
+                        end = min(end, int(match.group(2)))
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+
+                drop = None
+                if mirror.drop_after is not None and path not in mirror.dropped:
+                    mirror.dropped.add(path)
+                    drop = mirror.drop_after
+                pos, began = start, time.perf_counter()
+                try:
+                    while pos <= end:
+                        n = min(64 * 1024, end + 1 - pos)
+                        if drop is not None and pos + n > drop:
+                            self.wfile.write(data[pos:drop])
+                            self.close_connection = True
+                            return
+                        self.wfile.write(data[pos : pos + n])
+                        pos += n
+                        with server.lock:
+                            mirror.sent += n
+                        if mirror.rate:
+                            wait = (pos - start) / mirror.rate - (time.perf_counter() - began)
+                            if wait > 0:
+                                time.sleep(wait)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
@@ -0,0 +1,76 @@
+"""
+ConnectionManager 长时间运行测试
+
+模拟大量客户端反复连接、断开、重连取代，其中一部分断开时不调用 release
+（只能靠 sweep 清理），定期输出登记数量与内存占用，内存应保持平稳
+
+    python bench/soak_conn.py --cycles 2000000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+import common
+from connect import Connection, ConnectionManager
+from websockets.protocol import State
+
+
+class FakeConnection(Connection):
+    def __init__(self):
+        super().__init__(None)
+        self._state = State.OPEN
+
+    @property
+    def state(self):
+        return self._state
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cycles", type=int, default=2_000_000)
+    parser.add_argument("--online", type=int, default=5000, help="同时在线的客户端数")
+    parser.add_argument("--names", type=int, default=200_000, help="客户端名称的取值范围")
+    parser.add_argument("--sweep-every", type=int, default=10_000)
+    args = parser.parse_args()
+
+    manager = ConnectionManager()
+    online = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    report_every = max(1, args.cycles // 10)
+
+    for i in range(1, args.cycles + 1):
+        name = f"client{random.randrange(args.names)}"
+        conn = FakeConnection()
+        try:
+            old = manager.accpect(name, conn, takeover=random.random() < 0.5)
+        except NameError:
+            old = None
+            conn = None
+        if old is not None:
+            old._state = State.CLOSED
+        if conn is not None:
+            online.append((name, conn))
+
+        while len(online) > args.online:
+            name, conn = online.pop(random.randrange(len(online)))
+            conn._state = State.CLOSED
+            # 10% 的断开不走正常流程，留给 sweep
+            if random.random() < 0.9:
+                manager.release(name, conn)
+
+        if i % args.sweep_every == 0:
+            manager.sweep()
+        if i % report_every == 0:
+            current, peak = tracemalloc.get_traced_memory()
+            stats = manager.stats()
+            print(
+                f"{i:>9} cycles  registered={stats['count']:6d} accepted={stats['accepted']:9d} "
+                f"evicted={stats['evicted']:8d} mem={current / 1024 / 1024:6.2f}MiB "
+                f"peak={peak / 1024 / 1024:6.2f}MiB  {i / (time.perf_counter() - start):,.0f} cycles/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+热点存档缓存
+
+缓存 DOWN_SAVE 编码好的回复，按账号索引、按字节数限制总大小，LRU 淘汰
+"""
+from collections import OrderedDict
+from typing import Optional
+
+ENTRY_OVERHEAD = 200  # 每个条目除回复本身外的大致内存开销（字节）
+
+
+class CacheEntry:
+    __slots__ = ("version", "updated_at", "reply")
+
+    def __init__(self, version: int, updated_at: int, reply: bytes):
+        self.version = version
+        self.updated_at = updated_at
+        self.reply = reply
+
+
+class SaveCache:
+    """
+    Attributes:
+        max_bytes: 缓存回复的总字节数上限
+        max_entry: 单个回复超过该大小时不缓存
+        validate: 为真时命中后仍到存储中核对版本（多进程共用存储时需要）
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry: Optional[int] = None, validate: bool = False):
+        self.max_bytes = max_bytes
+        self.max_entry = max_entry if max_entry is not None else max_bytes // 8
+        self.validate = validate
+        self.entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0  # 客户端已有最新版本、未下发存档的次数
+        # 读取存储期间发生的失效，防止把读到的旧版本写回缓存
+        self.epoch = 0
+        self.reading = 0
+        self.invalidated: dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """
+        查看条目，不计入命中率也不调整淘汰顺序
+        """
+        return self.entries.get(key)
+
+    def begin(self) -> int:
+        """
+        开始从存储读取，返回交给 fill 的凭据；之后必须调用 fill 或 end
+        """
+        self.reading += 1
+        return self.epoch
+
+    def end(self):
+        self.reading -= 1
+        if not self.reading:
+            self.invalidated.clear()
+
+    def fill(self, key: str, ticket: int, version: int, updated_at: int, reply: bytes):
+        """
+        缓存从存储读到的回复，读取期间该账号被写入过时放弃
+        """
+        try:
+            if self.invalidated.get(key, -1) >= ticket or len(reply) > self.max_entry:
+                return
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old.reply) + ENTRY_OVERHEAD
+            self.entries[key] = CacheEntry(version, updated_at, reply)
+            self.bytes += len(reply) + ENTRY_OVERHEAD
+            while self.bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= len(evicted.reply) + ENTRY_OVERHEAD
+                self.evictions += 1
+        finally:
+            self.end()
+
+    def invalidate(self, key: str):
+        """
+        账号的存档被写入或删除时调用
+        """
+        if self.reading:
+            self.invalidated[key] = self.epoch
+            self.epoch += 1
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry.reply) + ENTRY_OVERHEAD
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "not_modified": self.not_modified,
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
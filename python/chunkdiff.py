@@ -0,0 +1,89 @@
+"""
+分块二进制差分
+
+把新文件按固定窗口切分，每个窗口只与旧文件中对应位置附近的一段做 bsdiff，
+应用补丁时逐个窗口读取旧数据、生成新数据并写出，内存占用取决于窗口大小而不是文件大小
+
+格式: MAGIC + (窗口大小, 旧文件大小, 新文件大小)，
+之后每个窗口为 (旧数据偏移, 旧数据长度, 补丁长度) + bsdiff 补丁
+"""
+import struct
+from typing import BinaryIO
+
+import bsdiff4
+
+MAGIC = b"CHUNKDIFF1\n"
+HEADER = struct.Struct(">QQQ")
+WINDOW = struct.Struct(">QQQ")
+
+WINDOW_SIZE = 4 * 1024 * 1024  # 新文件每个窗口的大小
+SLACK = 1024 * 1024  # 旧数据在对应位置前后多取的字节数，用于匹配插入或删除造成的偏移
+
+
+class ChunkDiffError(ValueError):
+    pass
+
+
+def is_chunkdiff(head: bytes) -> bool:
+    return head.startswith(MAGIC)
+
+
+def diff_file(old_path: str, new_path: str, patch_path: str, window: int = WINDOW_SIZE, slack: int = SLACK):
+    """
+    生成 old_path 到 new_path 的分块补丁
+    """
+    with open(old_path, "rb") as old, open(new_path, "rb") as new, open(patch_path, "wb") as out:
+        old_size = old.seek(0, 2)
+        new_size = new.seek(0, 2)
+        new.seek(0)
+        out.write(MAGIC)
+        out.write(HEADER.pack(window, old_size, new_size))
+        pos = 0
+        while pos < new_size:
+            dst = new.read(window)
+            # 按两个文件的长度比例找到旧文件中的对应位置
+            center = pos * old_size // new_size if new_size else 0
+            start = max(0, center - slack)
+            end = min(old_size, center + len(dst) + slack)
+            old.seek(start)
+            src = old.read(end - start)
+            patch = bsdiff4.diff(src, dst)
+            out.write(WINDOW.pack(start, len(src), len(patch)))
+            out.write(patch)
+            pos += len(dst)
+
+
+def _read(stream: BinaryIO, n: int) -> bytes:
+    data = stream.read(n)
+    if len(data) != n:
+        raise ChunkDiffError("补丁不完整")
+    return data
+
+
+def patch_file(old_path: str, patch: BinaryIO, new_path: str):
+    """
+    把分块补丁（可以是 zip 中的流）应用到 old_path，结果写入 new_path
+    """
+    with open(new_path, "wb") as out:
+        patch_stream(old_path, patch, out)
+
+
+def patch_stream(old_path: str, patch: BinaryIO, out: BinaryIO):
+    """
+    同 patch_file，结果写入可写对象 out（只调用 write）
+    """
+    if _read(patch, len(MAGIC)) != MAGIC:
+        raise ChunkDiffError("不是分块补丁")
+    _, old_size, new_size = HEADER.unpack(_read(patch, HEADER.size))
+    with open(old_path, "rb") as old:
+        if old.seek(0, 2) != old_size:
+            raise ChunkDiffError(f"旧文件大小不符: {old_path}")
+        written = 0
+        while written < new_size:
+            start, length, patch_len = WINDOW.unpack(_read(patch, WINDOW.size))
+            old.seek(start)
+            data = bsdiff4.patch(old.read(length), _read(patch, patch_len))
+            out.write(data)
+            written += len(data)
+        if written != new_size:
+            raise ChunkDiffError("新文件大小不符")
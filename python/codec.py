@@ -0,0 +1,222 @@
+"""
+JSON 编解码
+
+优先使用 orjson 或 msgspec，未安装时回退到标准库 json
+
+另外提供二进制帧编码（WireCodec），可选依赖:
+msgpack / cbor2 用于结构编码，zstandard 用于 zstd 压缩
+"""
+import base64
+import json
+import threading
+import zlib
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _default(obj):
+    """
+    处理后端不能直接序列化的类型
+    """
+    # 不直接依赖 model，凡是带原始字典的对象（ToClass）都按字典输出
+    conf = getattr(obj, "_conf_Dict", None)
+    if isinstance(conf, dict):
+        return conf
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(obj).decode("ascii")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default)
+
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    _decoder = msgspec.json.Decoder()
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return _decoder.decode(data)
+
+    def dumps(obj: Any) -> bytes:
+        return _encoder.encode(obj)
+
+else:
+    BACKEND = "json"
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(
+            obj, ensure_ascii=False, separators=(",", ":"), default=_default
+        ).encode("utf-8")
+
+
+# 各后端解析失败时抛出的异常
+DecodeError: tuple = (ValueError,)
+if msgspec is not None:
+    DecodeError += (msgspec.DecodeError,)
+
+
+# ---------------- 二进制帧 ----------------
+
+MAX_MESSAGE = 16 * 1024 * 1024  # 解压后的最大消息长度
+COMPRESS_MIN = 1024  # 小于该长度的消息不压缩
+
+FLAG_COMPRESSED = 0x01
+
+# 按优先级排列的可用编码与压缩算法
+FORMATS = ["json"] + (["msgpack"] if msgpack else []) + (["cbor"] if cbor2 else [])
+COMPRESSORS = (["zstd"] if zstandard else []) + ["deflate"]
+
+
+class WireError(ValueError):
+    pass
+
+
+# 压缩数据损坏时各后端抛出的异常
+_DECOMPRESS_ERRORS: tuple = (zlib.error,) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+_local = threading.local()
+
+
+def _zstd():
+    # zstd 上下文不能跨线程共用
+    if not hasattr(_local, "zstd"):
+        _local.zstd = (zstandard.ZstdCompressor(level=3), zstandard.ZstdDecompressor())
+    return _local.zstd
+
+
+def _compress(method: str, body: bytes) -> bytes:
+    if method == "zstd":
+        return _zstd()[0].compress(body)
+    return zlib.compress(body, 6)
+
+
+def _decompress(method: str, body: bytes) -> bytes:
+    try:
+        if method == "zstd":
+            with _zstd()[1].stream_reader(body) as reader:
+                out = reader.read(MAX_MESSAGE + 1)
+        else:
+            d = zlib.decompressobj()
+            out = d.decompress(body, MAX_MESSAGE + 1)
+    except _DECOMPRESS_ERRORS as e:
+        raise WireError(f"无法解压消息: {e}") from e
+    if len(out) > MAX_MESSAGE:
+        raise WireError("消息过大")
+    return out
+
+
+def negotiate(formats, compress) -> "WireCodec":
+    """
+    按客户端给出的优先级选出双方都支持的编码与压缩算法
+    """
+    fmt = next((f for f in formats or [] if f in FORMATS), "json")
+    method = next((c for c in compress or [] if c in COMPRESSORS), None)
+    return WireCodec(fmt, method)
+
+
+class WireCodec:
+    """
+    连接协商后的帧编码
+
+    二进制帧格式: 1 字节标志位 + 消息体，标志位最低位表示消息体已压缩；
+    json 且不压缩时仍使用文本帧
+    """
+
+    def __init__(self, format: str = "json", compress: Optional[str] = None):
+        self.format = format
+        self.compress = compress
+
+    @property
+    def binary(self) -> bool:
+        return self.format != "json" or self.compress is not None
+
+    def info(self) -> dict:
+        return {"format": self.format, "compress": self.compress}
+
+    def _pack(self, obj) -> bytes:
+        if self.format == "msgpack":
+            return msgpack.packb(obj, default=_default_binary)
+        if self.format == "cbor":
+            return cbor2.dumps(obj, default=lambda enc, v: enc.encode(_default_binary(v)))
+        return dumps(obj)
+
+    def _unpack(self, body: bytes):
+        if self.format == "msgpack":
+            return msgpack.unpackb(body)
+        if self.format == "cbor":
+            return cbor2.loads(body)
+        return loads(body)
+
+    def encode(self, msg) -> tuple[bytes, int]:
+        """
+        编码消息，返回 (帧, 压缩前长度)
+
+        msg 需提供 dump()（JSON）和 to_dict()
+        """
+        if self.format == "json":
+            body = msg.dump()
+        else:
+            body = self._pack(msg.to_dict())
+        plain = len(body)
+        if self.compress is not None and plain >= COMPRESS_MIN:
+            return b"%c" % FLAG_COMPRESSED + _compress(self.compress, body), plain
+        return b"\x00" + body, plain
+
+    def decode(self, frame: bytes) -> tuple[Any, int]:
+        """
+        解码帧，返回 (消息, 解压后长度)
+        """
+        if not frame:
+            raise WireError("空消息")
+        flags, body = frame[0], memoryview(frame)[1:]
+        if flags & FLAG_COMPRESSED:
+            if self.compress is None:
+                raise WireError("未协商压缩")
+            body = _decompress(self.compress, body)
+        try:
+            return self._unpack(bytes(body)), len(body)
+        except Exception as e:
+            raise WireError(f"无法解析消息: {e}") from e
+
+
+def _default_binary(obj):
+    # 二进制编码可以直接存放 bytes，只需处理 ToClass
+    conf = getattr(obj, "_conf_Dict", None)
+    if isinstance(conf, dict):
+        return conf
+    raise TypeError(f"Type is not serializable: {type(obj).__name__}")
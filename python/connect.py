@@ -1,29 +1,67 @@
-from typing import Mapping, Any
+import asyncio
+import os
+import time
 from websockets.asyncio.server import ServerConnection
+from websockets.exceptions import ConnectionClosed
 from websockets.protocol import State
 from dataclasses import dataclass
-import json
+from functools import lru_cache
+import codec
+import metrics
+import offload
 from model import MsgCode, MsgType, ToClass
 
 
-import json
-from typing import Any, Union
+from typing import Any, Callable, Iterable, Optional, Union
 
-Data = Union[ToClass, str, dict]
+# bytes 表示已经编码好的 JSON，原样写入消息
+Data = Union[ToClass, str, dict, bytes, None]
 
-@dataclass
+
+@lru_cache(maxsize=64)
+def _encode_head(code: MsgCode, type: str) -> bytes:
+    # {"code":200,"type":"ret"  不含结尾的 }
+    return codec.dumps({"code": code, "type": type})[:-1]
+
+
+# 超过此长度的字符串不进缓存，回复中回显的客户端内容不会被长期持有
+CONST_MAX = 256
+
+
+@lru_cache(maxsize=1024)
+def _encode_const(code: MsgCode, type: str, data: Optional[str]) -> bytes:
+    """
+    预编码常量回复（"done"、错误提示等），命中缓存时不再序列化
+    """
+    return _encode_head(code, type) + b',"data":' + codec.dumps(data)
+
+
+def _encode_str(code: MsgCode, type: str, data: Optional[str]) -> bytes:
+    if data is None or len(data) <= CONST_MAX:
+        return _encode_const(code, type, data)
+    return _encode_head(code, type) + b',"data":' + codec.dumps(data)
+
+
+@dataclass(slots=True)
 class Message:
     code: MsgCode
     type: str
     data: Data
+    id: Any = None  # 请求编号，服务器回复时原样带回
     @classmethod
-    def load(cls, data: str) -> 'Message':
+    def load(cls, data: Union[str, bytes]) -> 'Message':
         # 尝试解析 JSON 数据
         try:
-            parsed_data:dict = json.loads(data)
-        except json.JSONDecodeError:
+            parsed_data:dict = codec.loads(data)
+        except codec.DecodeError:
             # 如果解析失败，则返回一个默认的 ClientError
             return cls(MsgCode.ClientError, "", None)
+        return cls.from_dict(parsed_data)
+
+    @classmethod
+    def from_dict(cls, parsed_data: Any) -> 'Message':
+        if not isinstance(parsed_data, dict):
+            return cls(MsgCode.ClientError, "", None)
         
         # 获取 code, type 和 data 字段
         code = MsgCode.ClientError  # 默认值
@@ -41,57 +79,375 @@ class Message:
                 pass
         data = parsed_data.get("data", None)  # 默认为 None
         if type(data) == dict:
+            # 惰性包装，访问属性时才转换嵌套的字典
             data = ToClass(data)
         
-        return cls(code, type_, data)
+        return cls(code, type_, data, parsed_data.get("id"))
+
+    def dump(self) -> bytes:
+        """
+        编码为 UTF-8 JSON
+        """
+        if isinstance(self.data, str) or self.data is None:
+            parts = [_encode_str(self.code, self.type, self.data)]
+        elif isinstance(self.data, (bytes, bytearray, memoryview)):
+            parts = [_encode_head(self.code, self.type), b',"data":', self.data]
+        else:
+            parts = [_encode_head(self.code, self.type), b',"data":', codec.dumps(self.data)]
+        if self.id is not None:
+            parts.append(b',"id":')
+            parts.append(codec.dumps(self.id))
+        parts.append(b"}")
+        return b"".join(parts)
+
+    def to_dict(self) -> dict:
+        data = self.data
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = codec.loads(data)
+        out = {"code": self.code, "type": self.type, "data": data}
+        if self.id is not None:
+            out["id"] = self.id
+        return out
+
 
-    def dump(self):
-        return json.dumps({"code": self.code, "type": self.type, "data": str(self.data)}, ensure_ascii=False)
+# 超出限流时 recv 返回的消息，调用方按身份比较，客户端发来的消息不会与之相同
+LIMITED = Message(MsgCode.ServerError, MsgType.UNDEFINED, None)
+
+
+class TransferStats:
+    """
+    按消息类型统计收发字节数
+
+    plain 为编码后、压缩前的长度，wire 为实际发送的帧长度
+    """
+
+    def __init__(self):
+        self.types: dict[str, list[int]] = {}  # 类型 -> [消息数, plain, wire]
+
+    def add(self, type: str, plain: int, wire: int, count: int = 1):
+        entry = self.types.get(type)
+        if entry is None:
+            entry = self.types[type] = [0, 0, 0]
+        entry[0] += count
+        entry[1] += plain * count
+        entry[2] += wire * count
+
+    def saved(self) -> dict[str, int]:
+        return {t: plain - wire for t, (_, plain, wire) in self.types.items()}
+
+
+TRANSFER_STATS = {"recv": TransferStats(), "send": TransferStats()}
+
+
+def _transfer_samples(field: int) -> dict:
+    return {
+        (direction, type): entry[field]
+        for direction, stats in TRANSFER_STATS.items()
+        for type, entry in stats.types.items()
+    }
+
+
+metrics.Counter("save_messages_total", "收发的消息数", ("direction", "type"), func=lambda: _transfer_samples(0))
+metrics.Counter(
+    "save_message_bytes_total", "消息编码后、压缩前的字节数", ("direction", "type"), func=lambda: _transfer_samples(1)
+)
+metrics.Counter("save_wire_bytes_total", "实际收发的帧字节数", ("direction", "type"), func=lambda: _transfer_samples(2))
+DECODE_SECONDS = metrics.Histogram("save_decode_seconds", "消息解码耗时", ("format",))
+ENCODE_SECONDS = metrics.Histogram("save_encode_seconds", "消息编码耗时", ("format",))
 
 
 class Connection:
+    SEND_QUEUE = 64  # 推送队列长度
+    SLOW_POLICY = "drop"  # 推送队列满时: drop 丢弃新消息，close 断开连接
+
     def __init__(self, conn: ServerConnection):
         self.conn: ServerConnection = conn
+        self.name: Optional[str] = None  # INIT 时登记的客户端名称
+        self.account: Optional[str] = None  # REG 登录后的账号
+        self.sid: Optional[str] = None  # 会话编号，客户端请求会话恢复令牌时分配
+        self.codec = codec.WireCodec()  # INIT 协商前使用 JSON 文本帧
+        self.uploads: dict = {}  # 传输编号 -> 进行中的分块上传
+        self.last_tid = 0
+        self.since = time.monotonic()  # 建立连接的时间
+        self.outbox: Optional[asyncio.Queue] = None  # 推送队列，首次推送时创建
+        self.writer: Optional[asyncio.Task] = None
+        self.dropped = 0  # 因队列已满丢弃的推送数
+        self.limiter: Optional[Callable[[int], bool]] = None  # 限流检查，参数为帧长度
+        self.limited = 0  # 因超出限流被拒绝的消息数
+
+    def new_tid(self) -> int:
+        self.last_tid += 1
+        return self.last_tid
 
     async def recv(self) -> Message:
         raw_data = await self.conn.recv()
-        return Message.load(raw_data)
+        if self.limiter is not None and not self.limiter(len(raw_data)):
+            # 超出限流时不解码，由调用方直接拒绝
+            self.limited += 1
+            return LIMITED
+        start = time.perf_counter() if metrics.ENABLED else 0.0
+        if len(raw_data) >= offload.THRESHOLD:
+            # 大消息交给进程池解码，不阻塞事件循环
+            try:
+                parsed, plain = await offload.decode(raw_data, self.codec)
+            except codec.WireError:
+                return Message(MsgCode.ClientError, "", None)
+            msg = Message.from_dict(parsed)
+        elif isinstance(raw_data, str):
+            msg = Message.load(raw_data)
+            plain = len(raw_data)
+        else:
+            try:
+                parsed, plain = self.codec.decode(raw_data)
+            except codec.WireError:
+                return Message(MsgCode.ClientError, "", None)
+            msg = Message.from_dict(parsed)
+        if metrics.ENABLED:
+            DECODE_SECONDS.labels(self.codec.format).observe(time.perf_counter() - start)
+        TRANSFER_STATS["recv"].add(msg.type, plain, len(raw_data))
+        return msg
 
-    async def send(self, code:MsgCode, data: Data, type:MsgType=MsgType.RET):
-        msg = Message(code, type, data)
-        await self.conn.send(msg.dump())
+    async def send(
+        self,
+        code: MsgCode,
+        data: Data,
+        type: MsgType = MsgType.RET,
+        id: Any = None,
+        reply_to: Optional[MsgType] = None,
+    ):
+        """
+        reply_to 为所回复的请求类型，仅用于统计
+        """
+        msg = Message(code, type, data, id)
+        start = time.perf_counter() if metrics.ENABLED else 0.0
+        if self.codec.binary:
+            if isinstance(data, bytes) and len(data) >= offload.THRESHOLD:
+                frame, plain = await offload.encode(self.codec, msg)
+            else:
+                frame, plain = self.codec.encode(msg)
+        else:
+            frame = msg.dump()
+            plain = len(frame)
+        if metrics.ENABLED:
+            ENCODE_SECONDS.labels(self.codec.format).observe(time.perf_counter() - start)
+        await self.conn.send(frame, text=not self.codec.binary)
+        TRANSFER_STATS["send"].add(reply_to or type, plain, len(frame))
+
+    def push(self, frame: bytes, text: bool) -> bool:
+        """
+        把已编码的帧放入推送队列，不等待发送
+
+        队列已满说明客户端消费过慢，按 SLOW_POLICY 丢弃或断开，返回是否入队
+        """
+        if self.state > State.OPEN:
+            return False
+        if self.outbox is None:
+            self.outbox = asyncio.Queue(self.SEND_QUEUE)
+            self.writer = asyncio.create_task(self._drain())
+        try:
+            self.outbox.put_nowait((frame, text))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.SLOW_POLICY == "close" and self.dropped == 1:
+                asyncio.create_task(self.close(4002, "too slow"))
+            return False
+        return True
+
+    async def _drain(self):
+        try:
+            while True:
+                frame, text = await self.outbox.get()
+                await self.conn.send(frame, text=text)
+        except ConnectionClosed:
+            pass
+
+    def stop(self):
+        """
+        连接结束时停止推送任务
+        """
+        if self.writer is not None:
+            self.writer.cancel()
+            self.writer = None
 
     @property
     def state(self) -> State:
         return self.conn.state
 
-    async def close(self):
-        await self.conn.close()
+    async def close(self, code: int = 1000, reason: str = ""):
+        await self.conn.close(code, reason)
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.conns: Mapping[str, Connection] = {}
+    """
+    按客户端名称登记在线连接
+
+    连接关闭时由 release 移除，遗漏的已断开连接由定期 sweep 清理，
+    因此长时间运行后占用的内存只与在线连接数有关
+
+    多进程模式下传入共享的 registry（NameRegistry），保证名称在所有进程间唯一
+    """
+
+    SWEEP_INTERVAL = 30  # 清扫间隔（秒）
+
+    def __init__(self, registry=None):
+        self.registry = registry
+        self.pid = os.getpid()
+        self.conns: dict[str, Connection] = {}
+        self.peak = 0  # 字典重建以来的最大连接数
+        self.accepted = 0  # 累计登记的连接数
+        self.evicted = 0  # 累计被清扫或被取代的连接数
+
+    def accpect(self, name: str, conn: Connection, takeover: bool = False) -> Optional[Connection]:
+        """
+        登记连接
 
-    def accpect(self, name: str, conn: Connection):
-        if name in self.conns:
+        同名连接已断开时直接替换；仍在线时，takeover 为真则取代它并返回旧连接
+        （由调用方关闭），否则抛出 NameError
+        """
+        old = self.conns.get(name)
+        if old is not None:
+            alive = old.state <= State.OPEN
+            if alive and not takeover:
+                raise NameError("该名称的连接已存在")
+        if self.registry is not None and not self.registry.claim(name, self.pid, takeover):
+            # 名称被其他进程上的连接持有
             raise NameError("该名称的连接已存在")
+        if old is not None:
+            self.evicted += 1
+            if not alive:
+                old = None
         self.conns[name] = conn
+        self.accepted += 1
+        if len(self.conns) > self.peak:
+            self.peak = len(self.conns)
+        return old
+
+    def release(self, name: Optional[str], conn: Connection) -> bool:
+        """
+        连接关闭时移除，名称已被新连接占用时不做处理
+        """
+        if name is None or self.conns.get(name) is not conn:
+            return False
+        del self.conns[name]
+        if self.registry is not None:
+            self.registry.release(name, self.pid)
+        self._shrink()
+        return True
 
     def get(self, name: str) -> Connection:
         if name not in self.conns:
             raise NameError("该名称的连接不存在")
         conn = self.conns[name]
 
-        if conn.state > 1:
+        if conn.state > State.OPEN:
+            self.release(name, conn)
+            self.evicted += 1
             raise ConnectionError("连接已断开")
 
         return conn
 
+    def sweep(self) -> int:
+        """
+        移除所有已断开的连接，返回移除的数量
+        """
+        dead = [name for name, conn in self.conns.items() if conn.state > State.OPEN]
+        for name in dead:
+            self.conns.pop(name).stop()
+            if self.registry is not None:
+                self.registry.release(name, self.pid)
+
+        if self.registry is not None:
+            # 被其他进程上的新连接取代的名称
+            owned = self.registry.owned(self.pid)
+            for name in [n for n in self.conns if n not in owned]:
+                conn = self.conns.pop(name)
+                conn.stop()
+                asyncio.get_running_loop().create_task(
+                    conn.close(4001, "replaced by a new connection")
+                )
+                dead.append(name)
+
+        self.evicted += len(dead)
+        self._shrink()
+        return len(dead)
+
+    def _shrink(self):
+        # dict 删除元素后不会释放哈希表，连接数远低于峰值时重建
+        if self.peak > 1024 and len(self.conns) < self.peak // 4:
+            self.conns = dict(self.conns)
+            self.peak = len(self.conns)
+
+    async def sweeper(self, interval: Optional[float] = None):
+        while True:
+            await asyncio.sleep(interval or self.SWEEP_INTERVAL)
+            self.sweep()
+
+    def stats(self) -> dict:
+        """
+        连接数量与在线时长（秒）
+        """
+        now = time.monotonic()
+        ages = [now - conn.since for conn in self.conns.values()]
+        return {
+            "count": len(ages),
+            "accepted": self.accepted,
+            "evicted": self.evicted,
+            "oldest": max(ages, default=0.0),
+            "mean_age": sum(ages) / len(ages) if ages else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.conns)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.conns
+
     async def close(self, name):
         conn = self.get(name)
         await conn.close()
 
+    def broadcast(
+        self,
+        data: Data,
+        type: MsgType = MsgType.NOTICE,
+        names: Optional[Iterable[str]] = None,
+        code: MsgCode = MsgCode.OK,
+    ) -> tuple[int, int]:
+        """
+        向所有（或 names 指定的）在线连接推送消息，返回 (入队数, 丢弃数)
+
+        每种协商编码只编码一次，所有接收者共享同一份字节
+        """
+        msg = Message(code, type, data)
+        if names is None:
+            targets = list(self.conns.values())
+        else:
+            targets = [self.conns[n] for n in names if n in self.conns]
+
+        groups = {}  # (format, compress) -> [帧, 是否文本, 压缩前长度, 入队数]
+        dropped = 0
+        for conn in targets:
+            wire = conn.codec
+            key = (wire.format, wire.compress)
+            entry = groups.get(key)
+            if entry is None:
+                if wire.binary:
+                    frame, plain = wire.encode(msg)
+                    entry = groups[key] = [frame, False, plain, 0]
+                else:
+                    frame = msg.dump()
+                    entry = groups[key] = [frame, True, len(frame), 0]
+            if conn.push(entry[0], entry[1]):
+                entry[3] += 1
+            else:
+                dropped += 1
+
+        sent = 0
+        for frame, _, plain, count in groups.values():
+            TRANSFER_STATS["send"].add(type, plain, len(frame), count)
+            sent += count
+        return sent, dropped
+
 
 def wapper(ws: ServerConnection):
     return Connection(ws)
@@ -0,0 +1,102 @@
+"""
+存档增量补丁
+
+采用 JSON Patch（RFC 6902）的子集: add / remove / replace / test，
+路径为 JSON Pointer（RFC 6901），相对于整个存档包
+"""
+from typing import Any
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _parse_pointer(path: str) -> list[str]:
+    if not isinstance(path, str) or (path and not path.startswith("/")):
+        raise PatchError(f"非法的路径: {path!r}")
+    if not path:
+        return []
+    return [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+
+
+def _index(container: list, token: str, allow_end: bool) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not (token.isascii() and token.isdigit()) or (token != "0" and token.startswith("0")):
+        raise PatchError(f"非法的数组下标: {token!r}")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not allow_end):
+        raise PatchError(f"数组下标越界: {i}")
+    return i
+
+
+def _resolve(doc: Any, tokens: list[str]) -> Any:
+    for token in tokens:
+        if isinstance(doc, dict):
+            if token not in doc:
+                raise PatchError(f"路径不存在: {token!r}")
+            doc = doc[token]
+        elif isinstance(doc, list):
+            doc = doc[_index(doc, token, False)]
+        else:
+            raise PatchError(f"路径不存在: {token!r}")
+    return doc
+
+
+def apply_patch(doc: Any, ops: list) -> Any:
+    """
+    原地应用补丁并返回新文档（替换根节点时返回值与 doc 不同）
+
+    任何一步失败都会抛出 PatchError，此时 doc 可能已被部分修改，
+    调用方应丢弃它
+    """
+    if not isinstance(ops, list):
+        raise PatchError("补丁必须是列表")
+
+    for op in ops:
+        if not isinstance(op, dict):
+            raise PatchError("补丁操作必须是对象")
+        kind = op.get("op")
+        tokens = _parse_pointer(op.get("path"))
+
+        if kind in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"{kind} 操作缺少 value")
+
+        if kind == "test":
+            if _resolve(doc, tokens) != op["value"]:
+                raise PatchError(f"test 失败: {op.get('path')}")
+            continue
+
+        if not tokens:
+            if kind == "remove":
+                raise PatchError("不能删除根节点")
+            doc = op["value"]
+            continue
+
+        parent = _resolve(doc, tokens[:-1])
+        key = tokens[-1]
+        if isinstance(parent, dict):
+            if kind == "add":
+                parent[key] = op["value"]
+            elif kind in ("replace", "remove"):
+                if key not in parent:
+                    raise PatchError(f"路径不存在: {op.get('path')}")
+                if kind == "replace":
+                    parent[key] = op["value"]
+                else:
+                    del parent[key]
+            else:
+                raise PatchError(f"不支持的操作: {kind!r}")
+        elif isinstance(parent, list):
+            if kind == "add":
+                parent.insert(_index(parent, key, True), op["value"])
+            elif kind == "replace":
+                parent[_index(parent, key, False)] = op["value"]
+            elif kind == "remove":
+                del parent[_index(parent, key, False)]
+            else:
+                raise PatchError(f"不支持的操作: {kind!r}")
+        else:
+            raise PatchError(f"路径不存在: {op.get('path')}")
+
+    return doc
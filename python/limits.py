@@ -0,0 +1,147 @@
+"""
+限流与准入控制
+
+每个连接、每个 IP 各有消息数和字节数两个令牌桶，另有每个 IP 新建连接的令牌桶和并发连接上限
+"""
+import asyncio
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    令牌桶，rate 为每秒补充的令牌数，burst 为桶容量
+
+    只要还有令牌就放行并扣除 n，允许单次超过容量（如一次大上传），之后按欠下的令牌限速
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, n: float = 1, now: Optional[float] = None) -> bool:
+        if now is None:
+            now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens <= 0:
+            return False
+        self.tokens -= n
+        return True
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+class IPState:
+    __slots__ = ("conns", "connects", "msgs", "bytes")
+
+    def __init__(self, limiter: "RateLimiter"):
+        self.conns = 0
+        self.connects = TokenBucket(limiter.ip_connect_rate, limiter.ip_connect_burst)
+        self.msgs = TokenBucket(limiter.ip_msg_rate, limiter.ip_msg_rate * 2)
+        self.bytes = TokenBucket(limiter.ip_byte_rate, limiter.ip_byte_rate * 4)
+
+
+class RateLimiter:
+    """
+    Attributes:
+        msg_rate: 每个连接每秒的消息数，容量为两倍
+        byte_rate: 每个连接每秒的字节数，容量为四倍
+        ip_msg_rate: 每个 IP 每秒的消息数
+        ip_byte_rate: 每个 IP 每秒的字节数
+        ip_connect_rate: 每个 IP 每秒新建的连接数
+        ip_connect_burst: 新建连接的突发上限
+        max_per_ip: 每个 IP 的并发连接上限
+    """
+
+    def __init__(
+        self,
+        msg_rate: float = 100,
+        byte_rate: float = 8 * 1024 * 1024,
+        ip_msg_rate: float = 1000,
+        ip_byte_rate: float = 64 * 1024 * 1024,
+        ip_connect_rate: float = 20,
+        ip_connect_burst: float = 50,
+        max_per_ip: int = 256,
+    ):
+        self.msg_rate = msg_rate
+        self.byte_rate = byte_rate
+        self.ip_msg_rate = ip_msg_rate
+        self.ip_byte_rate = ip_byte_rate
+        self.ip_connect_rate = ip_connect_rate
+        self.ip_connect_burst = ip_connect_burst
+        self.max_per_ip = max_per_ip
+        self.ips: dict[str, IPState] = {}
+        self.rejected = 0  # 拒绝的连接数
+        self.limited = 0  # 拒绝的消息数
+
+    def _ip(self, ip: str) -> IPState:
+        state = self.ips.get(ip)
+        if state is None:
+            state = self.ips[ip] = IPState(self)
+        return state
+
+    def admit(self, ip: str) -> Optional[str]:
+        """
+        握手前检查是否接受该 IP 的新连接，拒绝时返回原因
+        """
+        state = self._ip(ip)
+        if state.conns >= self.max_per_ip:
+            self.rejected += 1
+            return "too many connections"
+        if not state.connects.take():
+            self.rejected += 1
+            return "connecting too fast"
+        return None
+
+    def join(self, ip: str) -> Callable[[int], bool]:
+        """
+        登记连接，返回检查每个收到的帧的函数（参数为帧长度，超限时返回 False）
+        """
+        state = self._ip(ip)
+        state.conns += 1
+        msgs = TokenBucket(self.msg_rate, self.msg_rate * 2)
+        size = TokenBucket(self.byte_rate, self.byte_rate * 4)
+
+        def check(n: int) -> bool:
+            now = time.monotonic()
+            if (
+                msgs.take(1, now)
+                and size.take(n, now)
+                and state.msgs.take(1, now)
+                and state.bytes.take(n, now)
+            ):
+                return True
+            self.limited += 1
+            return False
+
+        return check
+
+    def leave(self, ip: str):
+        state = self.ips.get(ip)
+        if state is not None:
+            state.conns -= 1
+
+    def sweep(self) -> int:
+        """
+        移除没有连接且令牌已补满的 IP，返回移除的数量
+        """
+        now = time.monotonic()
+        idle = [
+            ip
+            for ip, s in self.ips.items()
+            if s.conns <= 0 and s.connects.full(now) and s.msgs.full(now) and s.bytes.full(now)
+        ]
+        for ip in idle:
+            del self.ips[ip]
+        return len(idle)
+
+    async def sweeper(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
@@ -0,0 +1,244 @@
+"""
+运行指标
+
+计数器、直方图和仪表盘，以 Prometheus 文本格式导出。
+默认关闭，热点路径用 `if metrics.ENABLED:` 判断后再计时，关闭时只多一次全局变量读取；
+已有的统计（收发字节、连接数、缓存等）通过回调在导出时读取，不重复计数
+"""
+import asyncio
+import bisect
+import logging
+import time
+from typing import Callable, Optional
+
+ENABLED = False
+
+# 指标名 -> 指标，同名重复注册时替换（测试中会多次创建 Server）
+REGISTRY: dict[str, "Metric"] = {}
+
+# 秒，覆盖 100us 到 10s
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+logger = logging.getLogger("metrics")
+
+
+def enable(enabled: bool = True):
+    global ENABLED
+    ENABLED = enabled
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+
+class GaugeChild(CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, n: float = 1):
+        self.value -= n
+
+
+class HistogramChild:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metric:
+    """
+    Attributes:
+        name: 指标名
+        help: 说明
+        labels: 标签名
+        func: 导出时调用，返回 值 或 {标签值元组: 值}；给出时不使用 labels() 计数
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), func: Optional[Callable] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self.func = func
+        self.children: dict[tuple, object] = {}
+        REGISTRY[name] = self
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._child()
+        return child
+
+    def _label_str(self, values: tuple, extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def samples(self) -> dict:
+        if self.func is None:
+            return {values: child.value for values, child in self.children.items()}
+        value = self.func()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, value in self.samples().items():
+            lines.append(f"{self.name}{self._label_str(values)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _child(self):
+        return CounterChild()
+
+    def inc(self, n: float = 1):
+        self.labels().inc(n)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _child(self):
+        return GaugeChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def _child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for values, child in self.children.items():
+            total = 0
+            for le, count in zip(self.buckets + (float("inf"),), child.counts):
+                total += count
+                le_label = 'le="%s"' % ("+Inf" if le == float("inf") else _number(le))
+                lines.append(f"{self.name}_bucket{self._label_str(values, le_label)} {total}")
+            lines.append(f"{self.name}_sum{self._label_str(values)} {_number(child.sum)}")
+            lines.append(f"{self.name}_count{self._label_str(values)} {total}")
+        return lines
+
+
+class Timed:
+    """
+    包装对象，把 methods 中方法的耗时记录到 histogram（以方法名为标签）
+
+    只应在启用指标时使用，关闭时直接使用原对象
+    """
+
+    def __init__(self, target, histogram: Histogram, methods: tuple):
+        self.target = target
+        self.histogram = histogram
+        self.methods = methods
+
+    def __getattr__(self, name):
+        attr = getattr(self.target, name)
+        if name not in self.methods:
+            return attr
+        child = self.histogram.labels(name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+
+        return timed
+
+    def __len__(self) -> int:
+        return len(self.target)
+
+    def __contains__(self, key) -> bool:
+        return key in self.target
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def render() -> str:
+    """
+    以 Prometheus 文本格式导出所有指标
+    """
+    lines = []
+    for metric in list(REGISTRY.values()):
+        try:
+            lines += metric.render()
+        except Exception:
+            logger.exception("导出指标 %s 出错", metric.name)
+    return "\n".join(lines) + "\n"
+
+
+async def serve(port: int, host: str = "0.0.0.0"):
+    """
+    启动 HTTP 服务，GET /metrics 返回指标，返回 aiohttp 的 AppRunner
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def dump_periodically(path: str, interval: float):
+    """
+    每隔 interval 秒把指标追加到日志文件
+    """
+
+    def write(text):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(text)
+
+    while True:
+        await asyncio.sleep(interval)
+        text = f"# time {time.strftime('%Y-%m-%dT%H:%M:%S')}\n{render()}\n"
+        await asyncio.to_thread(write, text)
@@ -7,13 +7,18 @@ class MsgType(StrEnum):
     DOWN_SAVE = "ds"  # 下载存档
     REG = "reg"  # 注册账号
     DEL_SAVE = "Ds"  # 删除存档
+    UPLOAD_CHUNK = "uc"  # 分块上传存档
+    DOWN_CHUNK = "dc"  # 分块下载存档（服务器推送）
+    NOTICE = "nt"  # 公告、补丁通知等广播（服务器推送）
     UNDEFINED = "ud"  # 未定义类型
     RET = "ret"  # 服务器返回
 
 
 class MsgCode(IntEnum):
     OK = 200
+    NotModified = 304  # 客户端已有最新存档
     ClientError = 400
+    Conflict = 409  # 增量上传时存档版本不一致
     ServerError = 500
 
 
@@ -21,39 +26,39 @@ class ToClass:
     """
     字典转class
 
+    只包装最外层字典，嵌套的字典和列表在访问属性时才转换，
+    不复制原始数据
+
     Attributes:
         _conf_Dict (dict):原始字典
     """
 
+    __slots__ = ("_conf_Dict",)
+
     def __init__(self, conf: dict):
         self._conf_Dict = conf
-        self.__name__ = "<Standard Dictionary>"
-        self._update()
 
     def __getattr__(self, name):
+        if name == "_conf_Dict":
+            # 未初始化（如反序列化时），避免无限递归
+            raise AttributeError(name)
         if name in self._conf_Dict:
-            return self._conf_Dict[name]
+            return self._wrap(self._conf_Dict[name])
         else:
             raise AttributeError(
                 f"'{self.__class__.__name__}' object has no attribute '{name}'"
             )
 
-    def _update(self):
+    @staticmethod
+    def _wrap(v):
         """
-        更新字典内容
+        按需包装字典和列表中的字典
         """
-        # 更新字典
-        for k, v in self._conf_Dict.items():
-            if isinstance(v, dict):
-                setattr(self, k, ToClass(v))
-            elif isinstance(v, list):
-                setattr(
-                    self,
-                    k,
-                    [ToClass(item) if isinstance(item, dict) else item for item in v],
-                )
-            else:
-                setattr(self, k, v)
+        if isinstance(v, dict):
+            return ToClass(v)
+        if isinstance(v, list):
+            return [ToClass(item) if isinstance(item, dict) else item for item in v]
+        return v
 
     def __str__(self):
         return str(self._conf_Dict)
@@ -0,0 +1,118 @@
+"""
+大消息的解码与编码卸载
+
+超过阈值的消息不在事件循环线程上处理:
+- 解析与校验（占用 GIL）放到进程池，完整存档在子进程中直接编码为存储格式，
+  只把编码后的字节传回主进程，不回传整个字典
+- 压缩与哈希（zlib/zstd/hashlib 会释放 GIL）放到线程池，直接引用原数据不复制
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Union
+
+import codec
+from model import MsgType
+
+THRESHOLD = 256 * 1024  # 超过该字节数的消息交给进程池/线程池
+PROCESSES = max(1, (os.cpu_count() or 1) // 2)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_thread_pool: Optional[ThreadPoolExecutor] = None
+
+
+class EncodedSave:
+    """
+    已在子进程中校验并编码好的完整存档
+    """
+
+    __slots__ = ("raw", "updated_at", "ack")
+
+    def __init__(self, raw: bytes, updated_at: int, ack: str = "commit"):
+        self.raw = raw
+        self.updated_at = updated_at
+        self.ack = ack
+
+
+def start():
+    """
+    预先启动进程池，避免第一次大上传时才创建进程
+    """
+    global _process_pool, _thread_pool
+    if _process_pool is None:
+        # spawn: 主进程已有线程，fork 不安全
+        _process_pool = ProcessPoolExecutor(PROCESSES, multiprocessing.get_context("spawn"))
+        for _ in range(PROCESSES):
+            _process_pool.submit(int)
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(PROCESSES, thread_name_prefix="offload")
+
+
+def shutdown():
+    global _process_pool, _thread_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(cancel_futures=True)
+        _thread_pool = None
+
+
+def _decode(raw: Union[str, bytes], format: str, compress: Optional[str]) -> tuple[dict, int]:
+    # 在子进程中执行
+    if isinstance(raw, str):
+        parsed, plain = codec.loads(raw), len(raw)
+    else:
+        parsed, plain = codec.WireCodec(format, compress).decode(raw)
+    if not isinstance(parsed, dict):
+        raise codec.WireError("消息不是对象")
+
+    package = parsed.get("data")
+    if (
+        parsed.get("type") == MsgType.UPLOAD_SAVE
+        and isinstance(package, dict)
+        and isinstance(package.get("updatedAt"), int)
+        and "data" in package
+        and "patch" not in package
+        and not package.get("stream")
+    ):
+        ack = package.pop("ack", "commit")
+        parsed["data"] = EncodedSave(codec.dumps(package), package["updatedAt"], ack)
+    return parsed, plain
+
+
+async def decode(raw: Union[str, bytes], wire: codec.WireCodec) -> tuple[dict, int]:
+    """
+    在进程池中解码消息，返回 (消息字典, 解压后长度)，解析失败抛出 WireError
+    """
+    if _process_pool is None:
+        start()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_process_pool, _decode, raw, wire.format, wire.compress)
+    except codec.WireError:
+        # 解压失败等，已在子进程中转换
+        raise
+    except codec.DecodeError as e:
+        raise codec.WireError(f"无法解析消息: {e}") from e
+
+
+def _encode(msg, format: str, compress: Optional[str]) -> tuple[bytes, int]:
+    # 在子进程中执行
+    return codec.WireCodec(format, compress).encode(msg)
+
+
+async def encode(wire: codec.WireCodec, msg) -> tuple[bytes, int]:
+    """
+    编码并压缩消息
+
+    JSON 只需拼接和压缩，放到线程池；其他格式要先解析存档再打包，放到进程池
+    """
+    if _process_pool is None:
+        start()
+    loop = asyncio.get_running_loop()
+    if wire.format == "json":
+        return await loop.run_in_executor(_thread_pool, wire.encode, msg)
+    return await loop.run_in_executor(_process_pool, _encode, msg, wire.format, wire.compress)
+
@@ -1,9 +1,13 @@
 import json
 import zipfile
 import argparse
+import hashlib
+import heapq
 import os
+import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # 尝试安装 bsdiff4，如果没有找到的话
 try:
@@ -12,69 +16,310 @@ except ImportError:
     subprocess.check_call([sys.executable, "-m", "pip", "install", "bsdiff4"])
     import bsdiff4
 
+import chunkdiff
+
+COPY_BUFFER = 1024 * 1024  # 解压添加文件时的缓冲区大小
+
+
+class PatchError(Exception):
+    pass
+
+
+class HashWriter:
+    """
+    写入文件的同时计算 SHA-256
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def write(self, data):
+        self.hash.update(data)
+        return self.f.write(data)
+
+
 class Patch:
-    def __init__(self, file):
+    """
+    补丁分三步应用:
+
+    1. 暂存: 在线程池中把新增和修改后的文件写到安装目录旁的 STAGING，并按 diff.json 中的 sha256 校验
+    2. 提交: 先写日志 JOURNAL，再把原文件改名到 BACKUP、暂存文件改名到原位置
+    3. 清理: 删除日志、备份和暂存目录
+
+    任何一步失败都会恢复原文件；提交中途进程退出时，下次运行会先根据日志回滚
+
+    Attributes:
+        root: 安装目录
+        workers: 暂存时的线程数，None 为默认值
+        BSDIFF_WORKERS: bsdiff 格式下同时应用补丁的文件数，每个文件的新旧内容和补丁都在内存中
+    """
+
+    STAGING = ".patch-staging"
+    BACKUP = ".patch-backup"
+    JOURNAL = ".patch-journal.json"
+    VERSION = ".patch-version"  # 当前安装的版本，由带 from/to 的补丁写入
+    BSDIFF_WORKERS = 1
+
+    def __init__(self, file, root=".", workers=None):
         self.file = file
+        self.root = root
+        self.workers = workers
         self.init()
-    
+
     def init(self):
         self.patch_data = zipfile.ZipFile(self.file)
         # 打开补丁文件并读取diff.json
         # 直接在内存中读取diff.json，而不是提取到磁盘
         diff_json = self.patch_data.read('diff.json').decode('utf-8')
-        
+
         self.info = json.loads(diff_json)
-        
-    def delfile(self):
-        # 删除文件列表中的文件
-        for i in self.info.get("delfile", []):
-            print(i)
-            try:
-                if os.path.exists(i):
-                    os.remove(i)
-                print(f"Deleted file: {i}")
-            except Exception as e:
-                print(f"Failed to delete file {i}: {e}")
-                exit()
-    
-    def addfile(self):
-        # 添加文件列表中的文件
-        for i in self.info.get("addfile", []):
-            print(i)
-            with self.patch_data.open(i) as f:
-                with open(i, 'wb') as out_file:
-                    out_file.write(f.read())
-            print(f"Added file: {i}")
-            
-    
-    def modfile(self):
-        # 修改文件（应用二进制补丁）
-        for i in self.info.get("modfile", []):
-            print(i)
-            patch_file = i + ".diff"
-            with self.patch_data.open(patch_file) as f:
-                patch_data = f.read()
-            bsdiff4.file_patch_inplace(i, patch_data)
-            print(f"Modified file: {i}")
-            
-                
+        # bsdiff: 整个文件一个补丁；chunked: 分块补丁，应用时内存占用与文件大小无关
+        self.diff_format = self.info.get("diff_format", "bsdiff")
+        # 文件 -> 新内容的 SHA-256，旧版本的补丁没有
+        self.sha256 = self.info.get("sha256", {})
+
+    def installed_version(self):
+        return read_version(self.root)
+
+    def check_version(self):
+        """
+        补丁记录了起始版本时，已知的安装版本必须与之一致
+        """
+        installed = self.installed_version()
+        expected = self.info.get("from")
+        if expected is not None and installed is not None and installed != expected:
+            raise PatchError(f"补丁适用于 {expected}，当前安装的是 {installed}")
+
+    def write_version(self):
+        if "to" not in self.info:
+            return
+        tmp = self.path(self.VERSION + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.info["to"])
+        os.replace(tmp, self.path(self.VERSION))
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def staged(self, i):
+        path = self.path(self.STAGING, i)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def addfile(self, i):
+        # 分块复制到暂存目录，不把整个文件读入内存
+        with self.patch_data.open(i) as f:
+            with open(self.staged(i), 'wb') as out_file:
+                writer = HashWriter(out_file)
+                shutil.copyfileobj(f, writer, COPY_BUFFER)
+        return writer.hash.hexdigest()
+
+    def modfile(self, i):
+        # 应用二进制补丁，结果写到暂存目录，原文件不动
+        patch_file = i + ".diff"
+        with self.patch_data.open(patch_file) as f, open(self.staged(i), 'wb') as out_file:
+            writer = HashWriter(out_file)
+            if self.diff_format == "chunked":
+                # 逐个窗口从 zip 中读取补丁并写出新文件
+                chunkdiff.patch_stream(self.path(i), f, writer)
+            else:
+                # file_patch_inplace 的第二个参数是补丁文件路径，这里补丁在 zip 中，直接在内存中应用
+                with open(self.path(i), 'rb') as old_file:
+                    writer.write(bsdiff4.patch(old_file.read(), f.read()))
+        return writer.hash.hexdigest()
+
+    def stage_one(self, action, i):
+        digest = action(i)
+        expected = self.sha256.get(i)
+        if expected is not None and digest != expected:
+            raise PatchError(f"{i} 校验失败，期望 {expected}，实际 {digest}")
+        return i
+
+    def stage(self):
+        """
+        并行生成所有新文件并校验，失败时删除暂存目录，安装目录不变
+        """
+        jobs = [(self.addfile, i) for i in self.info.get("addfile", [])]
+        modfiles = [(self.modfile, i) for i in self.info.get("modfile", [])]
+        if self.diff_format == "chunked":
+            jobs += modfiles
+            modfiles = []
+        try:
+            # 整文件 bsdiff 单独放到小线程池，内存占用不随 workers 增长
+            with ThreadPoolExecutor(self.workers) as pool, ThreadPoolExecutor(
+                self.BSDIFF_WORKERS
+            ) as bsdiff_pool:
+                futures = [pool.submit(self.stage_one, action, i) for action, i in jobs]
+                futures += [bsdiff_pool.submit(self.stage_one, action, i) for action, i in modfiles]
+                for future in futures:
+                    print(f"Staged file: {future.result()}")
+        except BaseException:
+            shutil.rmtree(self.path(self.STAGING), ignore_errors=True)
+            raise
+
+    def write_journal(self, entries):
+        tmp = self.path(self.JOURNAL + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path(self.JOURNAL))
+
+    def commit(self):
+        """
+        用改名替换文件，先记录每个文件原本是否存在，失败时回滚
+        """
+        deleted = set(self.info.get("delfile", []))
+        files = self.info.get("addfile", []) + self.info.get("modfile", []) + list(deleted)
+        entries = [{"path": i, "existed": os.path.exists(self.path(i))} for i in files]
+        self.write_journal(entries)
+        try:
+            for entry in entries:
+                i = entry["path"]
+                if entry["existed"]:
+                    backup = self.path(self.BACKUP, i)
+                    os.makedirs(os.path.dirname(backup), exist_ok=True)
+                    os.replace(self.path(i), backup)
+                if i in deleted:
+                    print(f"Deleted file: {i}")
+                    continue
+                if os.path.dirname(self.path(i)):
+                    os.makedirs(os.path.dirname(self.path(i)), exist_ok=True)
+                os.replace(self.path(self.STAGING, i), self.path(i))
+                print(f"Updated file: {i}")
+        except BaseException:
+            self.rollback(entries)
+            raise
+        # 删除日志即完成提交
+        os.remove(self.path(self.JOURNAL))
+        self.cleanup()
+
+    def rollback(self, entries):
+        print("Rolling back...")
+        for entry in reversed(entries):
+            i = entry["path"]
+            backup = self.path(self.BACKUP, i)
+            if os.path.exists(backup):
+                os.replace(backup, self.path(i))
+            elif not entry["existed"] and os.path.exists(self.path(i)):
+                os.remove(self.path(i))
+        os.remove(self.path(self.JOURNAL))
+        self.cleanup()
+
+    def recover(self):
+        """
+        上次提交中途退出时回滚
+        """
+        try:
+            with open(self.path(self.JOURNAL), encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            self.cleanup()
+            return
+        self.rollback(entries)
+
+    def cleanup(self):
+        shutil.rmtree(self.path(self.STAGING), ignore_errors=True)
+        shutil.rmtree(self.path(self.BACKUP), ignore_errors=True)
+
     def close(self):
         self.patch_data.close()
-            
+
     def run(self):
         # 执行所有补丁操作
         print("Patching...")
-        self.delfile()
-        self.addfile()
-        self.modfile()
+        self.recover()
+        self.check_version()
+        self.stage()
+        self.commit()
+        self.write_version()
         print("Patch Success!")
 
-if __name__ == "__main__": 
+
+def read_version(root):
+    try:
+        with open(os.path.join(root, Patch.VERSION), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def plan(index, installed):
+    """
+    在 build.py 生成的 index.json 中找出从 installed 到最新版本下载量最小的补丁序列
+
+    Returns:
+        补丁列表（index 中的条目），已是最新版本时为空列表，没有可用路径时为 None
+    """
+    latest = index["latest"]
+    edges = {}
+    for p in index["patches"]:
+        edges.setdefault(p["from"], []).append(p)
+    # Dijkstra，边权为补丁大小
+    queue = [(0, 0, installed, [])]
+    done = set()
+    counter = 1
+    while queue:
+        cost, _, version, path = heapq.heappop(queue)
+        if version == latest:
+            return path
+        if version in done:
+            continue
+        done.add(version)
+        for p in edges.get(version, []):
+            if p["to"] not in done:
+                heapq.heappush(queue, (cost + p["size"], counter, p["to"], path + [p]))
+                counter += 1
+    return None
+
+
+def run_index(index_path, root=".", version=None, workers=None):
+    """
+    按 index.json 选择最小的补丁序列并依次应用，每个补丁单独提交
+    """
+    with open(index_path, encoding="utf-8") as f:
+        index = json.load(f)
+    if version is None:
+        version = read_version(root)
+    if version is None:
+        raise PatchError("未知的安装版本，请用 --version 指定")
+    path = plan(index, version)
+    if path is None:
+        full = index.get("full", {}).get("file", "html.zip")
+        raise PatchError(f"没有从 {version} 到 {index['latest']} 的补丁，请下载完整包 {full}")
+    if not path:
+        print(f"Already up to date: {version}")
+        return
+    size = sum(p["size"] for p in path)
+    print(f"Patching {version} -> {index['latest']} via {len(path)} patch(es), {size} bytes")
+    base = os.path.dirname(index_path)
+    for p in path:
+        patch = Patch(os.path.join(base, p["file"]), root, workers)
+        try:
+            patch.run()
+        finally:
+            patch.close()
+
+if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("file", help="patch file")
+    parser.add_argument("file", nargs="?", help="patch file")
+    parser.add_argument("--root", default=".", help="install directory")
+    parser.add_argument(
+        "--workers", type=int, help="threads used to stage added files and chunked patches"
+    )
+    parser.add_argument("--index", help="index.json from dist/patches, applies the smallest patch path to the latest version")
+    parser.add_argument("--version", help="installed version for --index, defaults to the one recorded by the last patch")
     args = parser.parse_args()
-    
+    if (args.file is None) == (args.index is None):
+        parser.error("give either a patch file or --index")
+
     try:
-        Patch(args.file).run()
+        if args.index:
+            run_index(args.index, args.root, args.version, args.workers)
+        else:
+            Patch(args.file, args.root, args.workers).run()
     except Exception as e:
         print(f"Patch failed: {e}")
+        sys.exit(1)
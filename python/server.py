@@ -1,39 +1,964 @@
+import argparse
 import asyncio
+import hashlib
+import hmac
+from http import HTTPStatus
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Awaitable, Callable, Optional
 from websockets.asyncio.server import serve, ServerConnection
-import tinydb
+from websockets.exceptions import ConnectionClosed
+from websockets.frames import CloseCode
+import codec
+import metrics
+import offload
 from connect import *
+from cache import CacheEntry, SaveCache
+from delta import PatchError, apply_patch
+from offload import EncodedSave
 from model import MsgType, MsgCode
+from limits import RateLimiter
+from session import SessionSigner, load_key
+from storage import NameRegistry, RawSave, SaveStore, StoreChanged, open_store
+from writebehind import WriteBehind
+from transfer import CHUNK_SIZE, MAX_SAVE_SIZE, Download, TransferError, Upload, chunk_bytes
 
 
+DEFAULT_STORE = "sqlite:data/saves.db"
+
+logger = logging.getLogger("server")
+
+Reply = tuple[MsgCode, Data]
+Handler = Callable[["Server", Connection, Message], Awaitable[Reply]]
+
+HANDLER_SECONDS = metrics.Histogram("save_handler_seconds", "请求处理耗时（含回复）", ("type",))
+STORE_SECONDS = metrics.Histogram("save_store_seconds", "存储操作耗时", ("op",))
+STORE_OPS = ("get", "head", "put", "put_many", "delete", "open_writer", "open_reader")
+
+# 消息类型 -> (处理函数, 是否为慢操作)
+HANDLERS: dict[MsgType, tuple[Handler, bool]] = {}
+
+
+def route(type_: MsgType, slow: bool = False):
+    """
+    注册消息处理函数
+
+    慢操作（读写存储等）会在单独的任务中执行，不阻塞同一连接上的其他请求
+    """
+
+    def decorator(func: Handler) -> Handler:
+        HANDLERS[type_] = (func, slow)
+        return func
+
+    return decorator
+
+
+def remote_ip(conn: ServerConnection) -> str:
+    address = conn.remote_address
+    return address[0] if address else ""
+
 
 class Server:
-    def __init__(self):
-        self.conn = ConnectionManager()
-        self.db = tinydb.TinyDB()
-        
+    MAX_INFLIGHT = 8  # 每个连接同时处理的慢操作上限
+    PBKDF2_ROUNDS = 100_000
+    WRITE_WINDOW = 0.005  # 完整上传的合并提交窗口（秒），为 0 时每次上传直接写入
+    MAX_SESSIONS = 10_000  # 同时在线的会话上限，超过时在握手阶段拒绝
+    MAX_FRAME = codec.MAX_MESSAGE  # 单个消息的字节数上限，传给 serve()
+    MAX_PENDING = 4096  # 所有连接上进行中的慢操作上限，超过时直接回复 ServerError
+    MAX_VIOLATIONS = 200  # 连接累计被限流的消息数超过该值时断开
+    RESUME_GRACE = 120  # 断线后保留未完成分块上传的时间（秒），期间可凭令牌恢复
+    DRAIN_TIMEOUT = 30  # 平滑关闭时等待进行中请求的最长时间（秒）
 
-    async def accpect(self, conn: ServerConnection):
-        ws = wapper(conn)
-        
+    def __init__(
+        self,
+        store: Optional[SaveStore] = None,
+        accounts: Optional[SaveStore] = None,
+        registry: Optional[NameRegistry] = None,
+        cache: Optional[SaveCache] = None,
+        limits: Optional[RateLimiter] = None,
+        signer: Optional[SessionSigner] = None,
+    ):
+        self.conn = ConnectionManager(registry)
+        self.limits = limits
+        self.sessions = 0  # 已建立（含未完成 INIT）的会话数
+        self.rejected = 0  # 因会话数达到上限被拒绝的连接数
+        self.overloaded = 0  # 因服务器繁忙被拒绝的请求数
+        self.signer = signer if signer is not None else SessionSigner()
+        self.parked: dict[str, tuple[dict, int, float]] = {}  # 会话编号 -> (分块上传, last_tid, 过期时间)
+        self.resumed = 0  # 凭令牌恢复的会话数
+        self.draining = False  # 正在平滑关闭，不再接受新的慢操作
+        self.saves = store if store is not None else open_store(DEFAULT_STORE)
+        self.accounts = accounts if accounts is not None else open_store(DEFAULT_STORE, "accounts")
+        if metrics.ENABLED:
+            self.saves = metrics.Timed(self.saves, STORE_SECONDS, STORE_OPS)
+        self.cache = cache if cache is not None else SaveCache()
+        self.inflight = 0  # 所有连接上进行中的慢操作数
+        self.writes: Optional[WriteBehind] = None
+        if self.WRITE_WINDOW:
+            self.writes = WriteBehind(
+                self.saves, self.WRITE_WINDOW, on_commit=lambda record: self.cache.invalidate(record.key)
+            )
+        if metrics.ENABLED:
+            self.register_metrics()
+
+    def register_metrics(self):
+        """
+        把连接、缓存和写入队列的统计注册为导出时读取的指标
+        """
+        conn, cache = self.conn, self.cache
+        metrics.Gauge("save_connections", "在线连接数", func=lambda: len(conn))
+        metrics.Counter("save_connections_accepted_total", "累计登记的连接数", func=lambda: conn.accepted)
+        metrics.Counter("save_connections_evicted_total", "累计被清扫或取代的连接数", func=lambda: conn.evicted)
+        metrics.Gauge(
+            "save_push_queue_depth",
+            "推送队列中等待发送的消息数",
+            func=lambda: sum(c.outbox.qsize() for c in conn.conns.values() if c.outbox is not None),
+        )
+        metrics.Gauge("save_inflight_handlers", "进行中的慢操作数", func=lambda: self.inflight)
+        metrics.Gauge("save_sessions", "已建立的会话数", func=lambda: self.sessions)
+        metrics.Counter("save_sessions_rejected_total", "因会话数达到上限被拒绝的连接数", func=lambda: self.rejected)
+        metrics.Counter("save_overloaded_total", "因服务器繁忙被拒绝的请求数", func=lambda: self.overloaded)
+        metrics.Counter("save_sessions_resumed_total", "凭令牌恢复的会话数", func=lambda: self.resumed)
+        metrics.Gauge("save_parked_uploads", "断线后保留的分块上传数", func=lambda: sum(len(p[0]) for p in self.parked.values()))
+        limits = self.limits
+        if limits is not None:
+            metrics.Counter("save_rate_rejected_connections_total", "被限流拒绝的连接数", func=lambda: limits.rejected)
+            metrics.Counter("save_rate_limited_messages_total", "被限流拒绝的消息数", func=lambda: limits.limited)
+        metrics.Gauge("save_cache_bytes", "存档缓存占用的字节数", func=lambda: cache.bytes)
+        metrics.Gauge("save_cache_entries", "存档缓存条目数", func=lambda: len(cache))
+        metrics.Gauge("save_cache_hit_ratio", "存档缓存命中率", func=lambda: cache.stats()["hit_ratio"])
+        metrics.Counter("save_cache_hits_total", "存档缓存命中次数", func=lambda: cache.hits)
+        metrics.Counter("save_cache_misses_total", "存档缓存未命中次数", func=lambda: cache.misses)
+        metrics.Counter("save_cache_evictions_total", "存档缓存淘汰次数", func=lambda: cache.evictions)
+        metrics.Counter("save_not_modified_total", "回复 NotModified 的次数", func=lambda: cache.not_modified)
+        writes = self.writes
+        if writes is not None:
+            metrics.Gauge("save_write_queue_depth", "等待提交的存档数", func=lambda: len(writes.pending))
+            metrics.Counter("save_write_commits_total", "批量提交次数", func=lambda: writes.commits)
+            metrics.Counter("save_write_saves_total", "批量提交写入的存档数", func=lambda: writes.written)
+            metrics.Counter("save_write_coalesced_total", "被合并掉的上传数", func=lambda: writes.coalesced)
+
+    async def init(self, ws: Connection) -> bool:
+        """
+        处理初始化消息
+
+        data 为客户端名称，或 {"name": 名称, "formats": [...], "compress": [...]}，
+        后者按客户端给出的优先级协商之后使用的帧编码，回复协商结果
+
+        字典中带 session: true 时回复中附带会话恢复令牌 token；
+        重连时带上 token 即可恢复名称、账号、编码和未完成的分块上传，不必再 REG，
+        回复 {token, resumed: true, account, uploads: [{tid, seq}], format, compress}。
+        令牌无效或过期时按普通初始化处理，回复中 resumed 为 false
+        """
         # 期待初始化消息
         msg = await ws.recv()
-        if msg.code != MsgCode.OK or msg.type != MsgType.INIT:
-            await ws.send(MsgCode.ClientError, "错误的消息")
+        name, wire, takeover, session = msg.data, None, False, None
+        if isinstance(msg.data, ToClass):
+            name = getattr(msg.data, "name", None)
+            takeover = getattr(msg.data, "takeover", False) is True
+            token = getattr(msg.data, "token", None)
+            if token is not None:
+                # 只校验签名，不查询存储
+                session = self.signer.verify(token)
+            if session is not None and session.get("fmt") in codec.FORMATS and (
+                session.get("cmp") is None or session.get("cmp") in codec.COMPRESSORS
+            ):
+                name = session["name"]
+                # 旧连接可能还未被发现断开，恢复时总是取代它
+                takeover = True
+                wire = codec.WireCodec(session["fmt"], session["cmp"])
+            else:
+                session = None
+                wire = codec.negotiate(
+                    getattr(msg.data, "formats", None), getattr(msg.data, "compress", None)
+                )
+            if session is not None or token is not None or getattr(msg.data, "session", False) is True:
+                ws.sid = session["sid"] if session is not None else self.signer.new_sid()
+        if msg.code != MsgCode.OK or msg.type != MsgType.INIT or not isinstance(name, str):
+            await ws.send(MsgCode.ClientError, "错误的消息", id=msg.id)
             await ws.close()
+            return False
         try:
-            self.conn.accpect(msg.data, ws)
+            old = self.conn.accpect(name, ws, takeover)
         except NameError:
-            await ws.send(MsgCode.ClientError, "客户端名称已存在")
-        
-        await ws.send(MsgCode.OK, MsgType.RET, "done")
+            await ws.send(MsgCode.ClientError, "客户端名称已存在", id=msg.id)
+            await ws.close()
+            return False
+        if old is not None:
+            # 客户端重连时旧连接可能还未被发现断开，直接关闭它
+            asyncio.create_task(old.close(4001, "replaced by a new connection"))
+
+        ws.name = name
+        if wire is None:
+            await ws.send(MsgCode.OK, "done", id=msg.id)
+            return True
+        # 协商结果仍以 JSON 文本帧发送，之后的消息改用新编码
+        reply = wire.info()
+        if ws.sid is not None:
+            if session is not None:
+                self.resumed += 1
+                ws.account = session.get("account")
+                self.unpark(ws)
+                reply["uploads"] = [{"tid": tid, "seq": upload.seq} for tid, upload in ws.uploads.items()]
+                reply["account"] = ws.account
+            reply["resumed"] = session is not None
+            reply["token"] = self.issue_token(ws, wire)
+        await ws.send(MsgCode.OK, reply, id=msg.id)
+        ws.codec = wire
+        return True
+
+    def issue_token(self, ws: Connection, wire: Optional[codec.WireCodec] = None) -> str:
+        wire = wire or ws.codec
+        return self.signer.issue(ws.sid, ws.name, ws.account, wire.format, wire.compress)
+
+    async def park(self, ws: Connection):
+        """
+        连接断开时保留有会话编号的分块上传，RESUME_GRACE 秒内可凭令牌继续，否则放弃
+        """
+        uploads, ws.uploads = ws.uploads, {}
+        if ws.sid is None or not uploads:
+            await self._abort_all(uploads)
+            return
+        old = self.parked.pop(ws.sid, None)
+        if old is not None:
+            await self._abort_all(old[0])
+        self.parked[ws.sid] = (uploads, ws.last_tid, time.monotonic() + self.RESUME_GRACE)
+
+    def unpark(self, ws: Connection):
+        parked = self.parked.pop(ws.sid, None)
+        if parked is not None:
+            # 已过期但还未被清扫的也可以继续使用
+            ws.uploads, ws.last_tid = parked[0], parked[1]
+
+    async def _abort_all(self, uploads: dict):
+        for upload in uploads.values():
+            await asyncio.to_thread(upload.abort)
+
+    async def park_sweeper(self, interval: float = 30):
+        """
+        定期放弃过期的保留上传
+        """
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for sid in [sid for sid, parked in self.parked.items() if parked[2] <= now]:
+                await self._abort_all(self.parked.pop(sid)[0])
+
+    def admit(self, conn: ServerConnection, request):
+        """
+        握手前的准入检查（serve 的 process_request），拒绝时直接回复 HTTP 错误，不建立会话
+        """
+        if self.sessions >= self.MAX_SESSIONS:
+            self.rejected += 1
+            return conn.respond(HTTPStatus.SERVICE_UNAVAILABLE, "server is full\n")
+        if self.limits is not None:
+            reason = self.limits.admit(remote_ip(conn))
+            if reason is not None:
+                return conn.respond(HTTPStatus.TOO_MANY_REQUESTS, reason + "\n")
+        return None
+
+    async def accpect(self, conn: ServerConnection):
+        ws = wapper(conn)
+        ip = remote_ip(conn)
+        self.sessions += 1
+        if self.limits is not None:
+            ws.limiter = self.limits.join(ip)
+        try:
+            await self.session(ws)
+        finally:
+            self.sessions -= 1
+            if self.limits is not None:
+                self.limits.leave(ip)
+
+    async def session(self, ws: Connection):
+        try:
+            if not await self.init(ws):
+                return
+        except ConnectionClosed:
+            self.conn.release(ws.name, ws)
+            return
+
+        limit = asyncio.Semaphore(self.MAX_INFLIGHT)
+        tasks = set()
+        try:
+            while True:
+                msg = await ws.recv()
+                if msg is LIMITED:
+                    # 超出限流，消息未解码
+                    if ws.limited > self.MAX_VIOLATIONS:
+                        await ws.close(1008, "rate limit exceeded")
+                        break
+                    await ws.send(MsgCode.ServerError, "请求过于频繁")
+                    continue
+                entry = HANDLERS.get(msg.type)
+                if entry is None:
+                    await ws.send(MsgCode.ClientError, "未知的消息类型", id=msg.id)
+                    continue
+
+                func, slow = entry
+                if not slow:
+                    await self.dispatch(func, ws, msg)
+                    continue
+
+                if self.draining:
+                    await ws.send(MsgCode.ServerError, "服务器正在关闭", id=msg.id)
+                    continue
+                if self.inflight >= self.MAX_PENDING:
+                    # 整体过载时立即拒绝，不再排队
+                    self.overloaded += 1
+                    await ws.send(MsgCode.ServerError, "服务器繁忙", id=msg.id)
+                    continue
+                # 达到上限时暂停读取，由 websocket 的流控向客户端施加背压
+                await limit.acquire()
+                self.inflight += 1
+                task = asyncio.create_task(self.dispatch(func, ws, msg))
+                task.add_done_callback(self._handler_done(limit))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionClosed:
+            pass
+        finally:
+            # 等待进行中的写入完成
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            # 保留或放弃未完成的分块上传
+            await self.park(ws)
+            ws.stop()
+            self.conn.release(ws.name, ws)
+
+    async def drain(self, server, code: int = CloseCode.GOING_AWAY):
+        """
+        平滑关闭: 停止接受新连接，等待进行中的请求处理完毕（最多 DRAIN_TIMEOUT 秒）
+        并提交排队的写入，再以 code 关闭所有连接、放弃保留的分块上传
+
+        热重启时 code 为 1012（服务重启），客户端应立即凭令牌重连
+        """
+        self.draining = True
+        # 只关闭监听套接字，已建立的连接继续处理
+        server.server.close()
+        deadline = time.monotonic() + self.DRAIN_TIMEOUT
+        while self.inflight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.inflight:
+            logger.warning("平滑关闭超时，仍有 %d 个请求未完成", self.inflight)
+        if self.writes is not None:
+            await self.writes.flush()
+        # websockets 16 之前的 Server.close 不能指定关闭码，逐个关闭连接
+        closing = [conn.close(code, "server shutting down") for conn in server.connections]
+        await asyncio.gather(*closing, return_exceptions=True)
+        server.close()
+        await server.wait_closed()
+        for uploads, _, _ in self.parked.values():
+            await self._abort_all(uploads)
+        self.parked.clear()
+
+    def _handler_done(self, limit: asyncio.Semaphore):
+        def done(_):
+            self.inflight -= 1
+            limit.release()
+
+        return done
+
+    async def dispatch(self, func: Handler, ws: Connection, msg: Message):
+        start = time.perf_counter() if metrics.ENABLED else 0.0
+        try:
+            await self._dispatch(func, ws, msg)
+        finally:
+            if metrics.ENABLED:
+                HANDLER_SECONDS.labels(msg.type).observe(time.perf_counter() - start)
+
+    async def _dispatch(self, func: Handler, ws: Connection, msg: Message):
+        if msg.code != MsgCode.OK:
+            await ws.send(MsgCode.ClientError, "错误的消息", id=msg.id)
+            return
+        try:
+            code, data = await func(self, ws, msg)
+        except ConnectionClosed:
+            return
+        except Exception:
+            logger.exception("处理 %s 消息出错", msg.type)
+            code, data = MsgCode.ServerError, "服务器内部错误"
+        try:
+            await ws.send(code, data, id=msg.id, reply_to=msg.type)
+        except ConnectionClosed:
+            pass
+
+    async def store_save(self, account: str, raw: bytes, updated_at: int, ack: str) -> Reply:
+        """
+        写入完整存档
+
+        ack 为 enqueue 时加入队列后立即回复 {queued: true, updatedAt}，
+        为 commit 时等待提交后回复 {rev, updatedAt}
+        """
+        if self.writes is None:
+            record = await asyncio.to_thread(self.saves.put, account, raw, updated_at)
+            self.cache.invalidate(account)
+        elif ack == "enqueue":
+            self.writes.submit(account, raw, updated_at)
+            return MsgCode.OK, {"queued": True, "updatedAt": updated_at}
+        else:
+            record = await self.writes.commit_one(account, raw, updated_at)
+        return MsgCode.OK, {"rev": record.version, "updatedAt": record.updated_at}
+
+    async def settle(self, account: str):
+        """
+        等待账号排队中的写入提交，读取或修改存储前调用
+        """
+        if self.writes is not None and account in self.writes:
+            await self.writes.settle(account)
+
+    async def load_save(self, account: str) -> Optional[CacheEntry]:
+        """
+        读取存档的 DOWN_SAVE 回复，优先使用缓存，原始数据存档抛出 RawSave
+        """
+        entry = self.cache.get(account)
+        if entry is not None and self.cache.validate:
+            # 其他进程可能已写入新版本
+            head = await asyncio.to_thread(self.saves.head, account)
+            if head is not None and tuple(head) == (entry.version, entry.updated_at):
+                return entry
+            self.cache.invalidate(account)
+        elif entry is not None:
+            return entry
+
+        ticket = self.cache.begin()
+        try:
+            record = await asyncio.to_thread(self.saves.get, account)
+        except BaseException:
+            self.cache.end()
+            raise
+        if record is None or record.raw:
+            self.cache.end()
+            if record is not None:
+                raise RawSave(account)
+            return None
+        # 存储中已是 JSON，直接拼进回复
+        reply = b'{"rev":%d,"save":%b}' % (record.version, record.data)
+        self.cache.fill(account, ticket, record.version, record.updated_at, reply)
+        return CacheEntry(record.version, record.updated_at, reply)
+
+    def apply_delta(self, account: str, package: dict) -> Reply:
+        """
+        把增量补丁应用到已存储的存档上，版本不一致时返回冲突
+        """
+        base = package.get("base")
+        if not isinstance(base, int):
+            return MsgCode.ClientError, "错误的存档"
+        record = self.saves.get(account)
+        if record is None:
+            return MsgCode.ClientError, "存档不存在"
+        if record.raw:
+            return MsgCode.ClientError, "分块上传的存档不能增量更新"
+        if record.version != base:
+            return MsgCode.Conflict, {"rev": record.version, "updatedAt": record.updated_at}
+
+        try:
+            doc = apply_patch(codec.loads(record.data), package["patch"])
+        except PatchError as e:
+            return MsgCode.ClientError, f"补丁无效: {e}"
+        if not isinstance(doc, dict) or "data" not in doc:
+            return MsgCode.ClientError, "补丁无效: 缺少存档数据"
+        doc["updatedAt"] = package["updatedAt"]
+
+        new = self.saves.put(account, codec.dumps(doc), package["updatedAt"], expect_version=base)
+        if new is None:
+            # 读取之后被其他请求抢先写入
+            current = self.saves.get(account)
+            if current is None:
+                return MsgCode.ClientError, "存档不存在"
+            return MsgCode.Conflict, {"rev": current.version, "updatedAt": current.updated_at}
+        return MsgCode.OK, {"rev": new.version, "updatedAt": new.updated_at}
 
+    def hash_password(self, password: str, salt: bytes) -> bytes:
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, self.PBKDF2_ROUNDS)
 
-async def main(port):
-    handle = Server()
-    server = await serve(handle.accpect, "0.0.0.0", port, ping_interval=None)
-    await server.serve_forever()
+    def check_account(self, account: str, password: str) -> Optional[bool]:
+        """
+        账号不存在时注册，存在时校验密码
+
+        同时有其他请求注册了同一账号时返回 None
+        """
+        record = self.accounts.get(account)
+        if record is None:
+            salt = os.urandom(16)
+            digest = self.hash_password(password, salt)
+            if self.accounts.put(account, salt + digest, expect_version=0) is None:
+                return None
+            return True
+        salt, digest = record.data[:16], record.data[16:]
+        return hmac.compare_digest(digest, self.hash_password(password, salt))
+
+
+@route(MsgType.INIT)
+async def on_init(server: Server, ws: Connection, msg: Message) -> Reply:
+    return MsgCode.ClientError, "重复的初始化"
+
+
+@route(MsgType.REG, slow=True)
+async def on_reg(server: Server, ws: Connection, msg: Message) -> Reply:
+    account = getattr(msg.data, "account", None)
+    password = getattr(msg.data, "password", None)
+    if not isinstance(account, str) or not isinstance(password, str) or not account:
+        return MsgCode.ClientError, "错误的账号或密码"
+    ok = await asyncio.to_thread(server.check_account, account, password)
+    if ok is None:
+        return MsgCode.Conflict, "账号已被注册"
+    if not ok:
+        return MsgCode.ClientError, "错误的账号或密码"
+    ws.account = account
+    if ws.sid is not None:
+        # 令牌中带有账号，之后凭令牌重连不必再 REG
+        return MsgCode.OK, {"token": server.issue_token(ws)}
+    return MsgCode.OK, "done"
+
+
+@route(MsgType.UPLOAD_SAVE, slow=True)
+async def on_upload_save(server: Server, ws: Connection, msg: Message) -> Reply:
+    """
+    上传存档
+
+    data 为完整的存档包 {version, updatedAt, data, ack?}，ack 为 enqueue 时入队即回复，
+    默认 commit 等待写入存储后回复，
+    或增量补丁 {base, updatedAt, patch}，base 为客户端所知的服务器版本号（rev），
+    或分块上传请求 {stream: true, updatedAt, size, sha256}，之后用 UPLOAD_CHUNK 发送数据
+    分块上传的数据原样保存，不检查是否为 JSON，之后只能分块下载，也不能增量更新
+    """
+    if ws.account is None:
+        return MsgCode.ClientError, "未登录"
+    if isinstance(msg.data, EncodedSave):
+        # 大存档已在进程池中校验并编码
+        return await server.store_save(ws.account, msg.data.raw, msg.data.updated_at, msg.data.ack)
+    if not isinstance(msg.data, ToClass):
+        return MsgCode.ClientError, "错误的存档"
+    package = msg.data._conf_Dict
+    updated_at = package.get("updatedAt")
+    if not isinstance(updated_at, int):
+        return MsgCode.ClientError, "错误的存档"
+
+    if package.get("stream"):
+        await server.settle(ws.account)
+        return await start_upload(server, ws, package)
+
+    if "patch" in package:
+        await server.settle(ws.account)
+        reply = await asyncio.to_thread(server.apply_delta, ws.account, package)
+        if reply[0] == MsgCode.OK:
+            server.cache.invalidate(ws.account)
+        return reply
+
+    if "data" not in package:
+        return MsgCode.ClientError, "错误的存档"
+    ack = package.pop("ack", "commit")
+    return await server.store_save(ws.account, codec.dumps(package), updated_at, ack)
+
+
+async def start_upload(server: Server, ws: Connection, package: dict) -> Reply:
+    size, sha256 = package.get("size"), package.get("sha256")
+    if not isinstance(size, int) or not 0 < size <= MAX_SAVE_SIZE or not isinstance(sha256, str):
+        return MsgCode.ClientError, "错误的分块上传请求"
+    writer = await asyncio.to_thread(
+        server.saves.open_writer, ws.account, size, package["updatedAt"]
+    )
+    tid = ws.new_tid()
+    ws.uploads[tid] = Upload(tid, writer, sha256)
+    # window: 客户端最多可以同时发送而未确认的块数
+    return MsgCode.OK, {"tid": tid, "chunk": CHUNK_SIZE, "window": max(1, server.MAX_INFLIGHT // 2)}
+
+
+@route(MsgType.UPLOAD_CHUNK, slow=True)
+async def on_upload_chunk(server: Server, ws: Connection, msg: Message) -> Reply:
+    """
+    data: {tid, seq, data}，每块确认一次，最后一块的确认带上新的 rev
+    """
+    tid = getattr(msg.data, "tid", None)
+    seq = getattr(msg.data, "seq", None)
+    upload = ws.uploads.get(tid)
+    if upload is None:
+        return MsgCode.ClientError, "传输不存在"
+    try:
+        chunk = chunk_bytes(getattr(msg.data, "data", None))
+        async with upload.lock:
+            record = await asyncio.to_thread(upload.feed, seq, chunk)
+    except TransferError as e:
+        ws.uploads.pop(tid, None)
+        await asyncio.to_thread(upload.abort)
+        return MsgCode.ClientError, {"tid": tid, "seq": seq, "error": str(e)}
+
+    if record is None:
+        return MsgCode.OK, {"tid": tid, "seq": seq}
+    ws.uploads.pop(tid, None)
+    server.cache.invalidate(ws.account)
+    return MsgCode.OK, {"tid": tid, "seq": seq, "rev": record.version, "updatedAt": record.updated_at}
+
+
+@route(MsgType.DOWN_SAVE, slow=True)
+async def on_down_save(server: Server, ws: Connection, msg: Message) -> Reply:
+    """
+    下载存档，data 为 {stream: true} 时分块下发:
+    先回复 {tid, size, rev, updatedAt}，再推送若干 DOWN_CHUNK {tid, seq, data}，
+    最后回复 {tid, seq, sha256, done: true}
+
+    data 带有客户端已有的 rev 或 updatedAt 且与服务器一致时，
+    回复 NotModified {rev, updatedAt}，不再下发存档
+    """
+    if ws.account is None:
+        return MsgCode.ClientError, "未登录"
+    await server.settle(ws.account)
+    if getattr(msg.data, "stream", False):
+        return await stream_download(server, ws, msg)
+
+    known_rev = getattr(msg.data, "rev", None)
+    known_at = getattr(msg.data, "updatedAt", None)
+    if known_rev is not None or known_at is not None:
+        entry = server.cache.peek(ws.account)
+        if entry is not None and not server.cache.validate:
+            head = entry.version, entry.updated_at
+        else:
+            head = await asyncio.to_thread(server.saves.head, ws.account)
+        if head is not None and (known_rev == head[0] or known_at == head[1]):
+            server.cache.not_modified += 1
+            return MsgCode.NotModified, {"rev": head[0], "updatedAt": head[1]}
+
+    try:
+        entry = await server.load_save(ws.account)
+    except RawSave:
+        return MsgCode.ClientError, "分块上传的存档只能分块下载"
+    if entry is None:
+        return MsgCode.ClientError, "存档不存在"
+    return MsgCode.OK, entry.reply
+
+
+async def stream_download(server: Server, ws: Connection, msg: Message) -> Reply:
+    reader = await asyncio.to_thread(server.saves.open_reader, ws.account)
+    if reader is None:
+        return MsgCode.ClientError, "存档不存在"
+    down = Download(ws.new_tid(), reader)
+    try:
+        await ws.send(
+            MsgCode.OK,
+            {"tid": down.tid, "size": reader.size, "rev": reader.version, "updatedAt": reader.updated_at},
+            id=msg.id,
+            reply_to=MsgType.DOWN_SAVE,
+        )
+        while True:
+            try:
+                chunk = await asyncio.to_thread(down.next_chunk)
+            except StoreChanged:
+                return MsgCode.ClientError, {"tid": down.tid, "error": "存档已更新，请重新下载"}
+            if not chunk:
+                break
+            # send 会等待发送缓冲区排空，慢客户端自然形成背压
+            await ws.send(
+                MsgCode.OK,
+                {"tid": down.tid, "seq": down.seq, "data": chunk},
+                type=MsgType.DOWN_CHUNK,
+                id=msg.id,
+            )
+            down.seq += 1
+    finally:
+        await asyncio.to_thread(down.close)
+    return MsgCode.OK, {"tid": down.tid, "seq": down.seq, "sha256": down.hash.hexdigest(), "done": True}
+
+
+@route(MsgType.DEL_SAVE, slow=True)
+async def on_del_save(server: Server, ws: Connection, msg: Message) -> Reply:
+    if ws.account is None:
+        return MsgCode.ClientError, "未登录"
+    await server.settle(ws.account)
+    deleted = await asyncio.to_thread(server.saves.delete, ws.account)
+    server.cache.invalidate(ws.account)
+    if not deleted:
+        return MsgCode.ClientError, "存档不存在"
+    return MsgCode.OK, "done"
+
+
+async def main(
+    port,
+    store=DEFAULT_STORE,
+    worker=False,
+    metrics_port=None,
+    metrics_log=None,
+    metrics_interval=60,
+    max_sessions=None,
+    max_frame=None,
+    rate_limit=True,
+    session_key=None,
+    drain_timeout=None,
+    listen_fd=None,
+    ready=None,
+):
+    """
+    worker 为真时作为多进程模式下的工作进程运行:
+    与其他进程共用端口（SO_REUSEPORT）并通过共享登记表保证客户端名称唯一
+
+    给出 metrics_port 或 metrics_log 时启用指标，
+    分别在该端口的 /metrics 导出、每隔 metrics_interval 秒追加到日志文件
+
+    max_sessions、max_frame 覆盖 Server 的默认值，rate_limit 为假时不限流
+
+    session_key 为会话令牌的签名密钥文件，默认放在存储所在目录，多个工作进程共用
+
+    收到 SIGTERM/SIGINT 时平滑关闭（见 Server.drain）；非工作进程收到 SIGUSR2 时热重启（见 hot_restart），
+    Windows 上不支持这两者，Ctrl+C 时直接退出。
+    listen_fd 为热重启时从旧进程继承的监听套接字，ready 在开始接受连接后调用
+    """
+    if metrics_port or metrics_log:
+        metrics.enable()
+    registry = NameRegistry(store.partition(":")[2]) if worker else None
+    # 多进程共用存储，缓存命中后要核对版本
+    cache = SaveCache(validate=worker)
+    limits = RateLimiter() if rate_limit else None
+    scheme, _, path = store.partition(":")
+    if session_key is None:
+        session_key = os.path.join(path if scheme == "log" else os.path.dirname(path), "session.key")
+    signer = SessionSigner(load_key(session_key))
+    handle = Server(open_store(store), open_store(store, "accounts"), registry, cache, limits, signer)
+    if max_sessions:
+        handle.MAX_SESSIONS = max_sessions
+    if max_frame:
+        handle.MAX_FRAME = max_frame
+    if drain_timeout is not None:
+        handle.DRAIN_TIMEOUT = drain_timeout
+    if not worker and listen_fd is None:
+        # 多进程模式下由主进程在启动工作进程前清理；热重启时旧进程可能还在写入，不清理
+        handle.saves.cleanup()
+    offload.start()
+    background = [asyncio.create_task(handle.conn.sweeper()), asyncio.create_task(handle.park_sweeper())]
+    if limits is not None:
+        background.append(asyncio.create_task(limits.sweeper()))
+    runner = await metrics.serve(metrics_port) if metrics_port else None
+    if metrics_log:
+        background.append(asyncio.create_task(metrics.dump_periodically(metrics_log, metrics_interval)))
+    if listen_fd is not None:
+        address = {"sock": socket.socket(fileno=listen_fd)}
+    else:
+        address = {"host": "0.0.0.0", "port": port, "reuse_port": worker}
+    server = await serve(
+        handle.accpect,
+        **address,
+        ping_interval=None,
+        max_size=handle.MAX_FRAME,
+        process_request=handle.admit,
+    )
+    if ready is not None:
+        ready()
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    close_code = CloseCode.GOING_AWAY
+
+    async def restart():
+        nonlocal close_code
+        if not stop.is_set() and await hot_restart(server):
+            close_code = CloseCode.SERVICE_RESTART
+            stop.set()
+
+    if sys.platform != "win32":
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        if not worker:
+            loop.add_signal_handler(signal.SIGUSR2, lambda: background.append(asyncio.create_task(restart())))
+    # Windows 的事件循环不支持信号处理函数，Ctrl+C 时由 asyncio.run 取消，不做平滑关闭
+    try:
+        await stop.wait()
+        logger.info("正在平滑关闭")
+        await handle.drain(server, close_code)
+    finally:
+        for task in background:
+            task.cancel()
+        if runner is not None:
+            await runner.cleanup()
+        if handle.writes is not None:
+            await handle.writes.close()
+        offload.shutdown()
+
+
+HANDOFF_ARGS = ("--listen-fd", "--ready-fd")
+
+
+async def hot_restart(server, timeout: float = 30) -> bool:
+    """
+    热重启: 以相同的参数启动新进程，通过继承文件描述符把监听套接字交给它，
+    新进程开始接受连接后返回 True，当前进程随后平滑关闭；
+    新进程启动失败时返回 False，当前进程继续服务
+    """
+    fd = server.sockets[0].fileno()
+    r, w = os.pipe()
+    args = sys.argv[1:]
+    for flag in HANDOFF_ARGS:
+        while flag in args:
+            i = args.index(flag)
+            del args[i : i + 2]
+    argv = [sys.executable, os.path.abspath(__file__), *args, "--listen-fd", str(fd), "--ready-fd", str(w)]
+    proc = subprocess.Popen(argv, pass_fds=(fd, w))
+    os.close(w)
+
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    # 新进程就绪时写入一个字节，退出时读到 EOF
+    loop.add_reader(r, lambda: ready.done() or ready.set_result(os.read(r, 1)))
+    try:
+        ok = await asyncio.wait_for(ready, timeout) == b"1"
+    except asyncio.TimeoutError:
+        ok = False
+    finally:
+        loop.remove_reader(r)
+        os.close(r)
+    if not ok:
+        logger.error("新进程 %d 未能启动，继续服务", proc.pid)
+        proc.kill()
+        return False
+    logger.info("已把监听套接字交给新进程 %d", proc.pid)
+    return True
+
+
+def notify_ready(fd: int):
+    os.write(fd, b"1")
+    os.close(fd)
+
+
+def run_worker(port, store, options, ready=None):
+    # 从主进程继承的 SIGTERM 处理函数会抛出 SystemExit，main 中会重新设置
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logging.basicConfig(level=logging.INFO, format="[worker %(process)d] %(message)s")
+    try:
+        asyncio.run(main(port, store, True, **options, ready=ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(port, store, workers, **options):
+    """
+    启动 workers 个工作进程监听同一端口，由内核分配连接；
+    工作进程意外退出时释放它登记的名称并重新启动
+
+    options 传给每个工作进程的 main，
+    其中第 i 个工作进程的指标在 metrics_port + i 导出、写入 metrics_log.<i>
+
+    收到 SIGTERM 时让所有工作进程平滑关闭；收到 SIGUSR2 时逐个滚动重启工作进程:
+    新进程开始接受连接后旧进程再平滑关闭，端口始终有进程监听
+    """
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise SystemExit("当前系统不支持 SO_REUSEPORT，无法使用 --workers")
+    if not store.startswith("sqlite:"):
+        raise SystemExit("多进程模式只支持 sqlite 存储")
+
+    saves = open_store(store)
+    saves.cleanup()
+    saves.close()
+    registry = NameRegistry(store.partition(":")[2])
+    registry.clear()
+
+    def spawn(i):
+        worker_options = dict(options)
+        if options.get("metrics_port"):
+            worker_options["metrics_port"] = options["metrics_port"] + i
+        if options.get("metrics_log"):
+            worker_options["metrics_log"] = f"{options['metrics_log']}.{i}"
+        ready = multiprocessing.Event()
+        # 不能是守护进程，工作进程还要启动编解码进程池；退出时由下面的 finally 结束
+        p = multiprocessing.Process(target=run_worker, args=(port, store, worker_options, ready.set))
+        p.start()
+        return p, ready
+
+    def stop_worker(p):
+        p.terminate()
+        p.join(drain_timeout + 5)
+        if p.exitcode is None:
+            logger.warning("工作进程 %d 未能在时限内关闭", p.pid)
+            p.kill()
+            p.join()
+        registry.purge(p.pid)
+
+    def stop(*_):
+        raise SystemExit(0)
+
+    def restart(*_):
+        restarting.append(True)
+
+    drain_timeout = options.get("drain_timeout") or Server.DRAIN_TIMEOUT
+    restarting = []
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR2, restart)
+    procs = [spawn(i)[0] for i in range(workers)]
+    try:
+        while True:
+            # 带超时等待，以便及时处理 SIGUSR2
+            multiprocessing.connection.wait([p.sentinel for p in procs], timeout=1)
+            if restarting:
+                restarting.clear()
+                for i, old in enumerate(procs):
+                    new, ready = spawn(i)
+                    if not ready.wait(30):
+                        logger.error("新工作进程 %d 未能启动，停止滚动重启", new.pid)
+                        stop_worker(new)
+                        break
+                    procs[i] = new
+                    stop_worker(old)
+                logger.info("滚动重启完成")
+            for i, p in enumerate(procs):
+                if p.exitcode is None:
+                    continue
+                logger.warning("工作进程 %d 退出（%s），重新启动", p.pid, p.exitcode)
+                registry.purge(p.pid)
+                procs[i] = spawn(i)[0]
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.join(drain_timeout + 5)
+            if p.exitcode is None:
+                p.kill()
+                p.join()
+        registry.clear()
 
 
 if __name__ == "__main__":
-    port = 8001
-    asyncio.run(main(port))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument(
+        "--store", default=DEFAULT_STORE, help="存档存储，sqlite:<文件> 或 log:<目录>"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数")
+    parser.add_argument("--metrics-port", type=int, help="在该端口的 /metrics 导出 Prometheus 指标")
+    parser.add_argument("--metrics-log", help="定期把指标追加到该文件")
+    parser.add_argument("--metrics-interval", type=float, default=60, help="写入指标日志的间隔（秒）")
+    parser.add_argument("--max-sessions", type=int, help=f"同时在线的会话上限（默认 {Server.MAX_SESSIONS}）")
+    parser.add_argument("--max-frame", type=int, help=f"单个消息的字节数上限（默认 {Server.MAX_FRAME}）")
+    parser.add_argument("--no-rate-limit", action="store_true", help="关闭按连接和 IP 的限流（压测时使用）")
+    parser.add_argument("--session-key", help="会话令牌的签名密钥文件（默认在存储所在目录下的 session.key）")
+    parser.add_argument(
+        "--drain-timeout", type=float, help=f"平滑关闭时等待进行中请求的最长时间（默认 {Server.DRAIN_TIMEOUT} 秒）"
+    )
+    # 热重启时由旧进程传入
+    parser.add_argument("--listen-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    options = {
+        "metrics_port": args.metrics_port,
+        "metrics_log": args.metrics_log,
+        "metrics_interval": args.metrics_interval,
+        "max_sessions": args.max_sessions,
+        "max_frame": args.max_frame,
+        "rate_limit": not args.no_rate_limit,
+        "session_key": args.session_key,
+        "drain_timeout": args.drain_timeout,
+    }
+    if args.workers > 1:
+        run_workers(args.port, args.store, args.workers, **options)
+    else:
+        ready = (lambda: notify_ready(args.ready_fd)) if args.ready_fd is not None else None
+        try:
+            asyncio.run(main(args.port, args.store, **options, listen_fd=args.listen_fd, ready=ready))
+        except KeyboardInterrupt:
+            pass
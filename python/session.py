@@ -0,0 +1,116 @@
+"""
+会话恢复令牌
+
+INIT 之后签发，内容为会话编号、客户端名称、账号和协商的编码，用 HMAC-SHA256 签名。
+客户端重连时出示令牌即可恢复会话，服务器只校验签名，不查询数据库
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Optional
+
+import codec
+
+KEY_SIZE = 32
+
+
+def _read_key(path: str) -> Optional[bytes]:
+    """
+    读取密钥，文件不存在或长度不足（例如写入前崩溃留下的空文件）时返回 None
+    """
+    try:
+        with open(path, "rb") as f:
+            key = f.read()
+    except FileNotFoundError:
+        return None
+    return key if len(key) >= KEY_SIZE else None
+
+
+def load_key(path: str) -> bytes:
+    """
+    读取签名密钥，文件不存在或不完整时生成
+
+    多进程模式下各工作进程读取同一个文件，签发的令牌可以互相校验
+    """
+    key = _read_key(path)
+    if key is not None:
+        return key
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 先完整写入临时文件，再链接或改名到 path，其他进程不会读到写了一半的密钥
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(secrets.token_bytes(KEY_SIZE))
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        try:
+            # 多个进程同时启动时只有一个链接成功，其余读取它写入的密钥
+            os.link(tmp, path)
+        except FileExistsError:
+            if _read_key(path) is None:
+                os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    key = _read_key(path)
+    if key is None:
+        raise RuntimeError(f"无法生成会话密钥: {path}")
+    return key
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class SessionSigner:
+    """
+    Attributes:
+        key: HMAC 密钥
+        ttl: 令牌有效期（秒），每次恢复会话都会签发新令牌
+    """
+
+    def __init__(self, key: Optional[bytes] = None, ttl: float = 600):
+        if key is not None and len(key) < KEY_SIZE:
+            raise ValueError(f"会话密钥至少需要 {KEY_SIZE} 字节")
+        self.key = key if key is not None else secrets.token_bytes(KEY_SIZE)
+        self.ttl = ttl
+
+    def new_sid(self) -> str:
+        return secrets.token_hex(8)
+
+    def issue(self, sid: str, name: str, account: Optional[str], format: str, compress: Optional[str]) -> str:
+        payload = codec.dumps(
+            {"sid": sid, "name": name, "account": account, "fmt": format, "cmp": compress, "exp": int(time.time() + self.ttl)}
+        )
+        mac = hmac.new(self.key, payload, hashlib.sha256).digest()
+        return f"{_b64encode(payload)}.{_b64encode(mac)}"
+
+    def verify(self, token) -> Optional[dict]:
+        """
+        校验令牌，返回其中的会话信息，签名错误或已过期时返回 None
+        """
+        if not isinstance(token, str) or token.count(".") != 1:
+            return None
+        body, _, mac = token.partition(".")
+        try:
+            payload, mac = _b64decode(body), _b64decode(mac)
+        except ValueError:
+            return None
+        if not hmac.compare_digest(mac, hmac.new(self.key, payload, hashlib.sha256).digest()):
+            return None
+        try:
+            session = codec.loads(payload)
+        except codec.DecodeError:
+            return None
+        if not isinstance(session, dict) or session.get("exp", 0) < time.time():
+            return None
+        return session
@@ -0,0 +1,897 @@
+import os
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class SaveRecord:
+    """
+    一条存档记录
+
+    Attributes:
+        key (str): 账号
+        version (int): 服务器端版本号，每次写入加一
+        updated_at (int): 客户端存档时间戳（毫秒）
+        data (bytes): 编码后的存档内容
+        raw (bool): 分块上传的原始数据，不保证是 JSON，只能分块读取
+    """
+
+    key: str
+    version: int
+    updated_at: int
+    data: bytes
+    raw: bool = False
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    打开数据库，多个进程可以同时读写（WAL），写锁冲突时等待而不是立即报错
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+    db.execute("PRAGMA journal_mode=WAL")
+    return db
+
+
+class StoreChanged(Exception):
+    """
+    分块读取途中存档被替换或删除
+    """
+
+
+class RawSave(Exception):
+    """
+    存档是分块上传的原始数据，不能整体读取为 JSON
+    """
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class SaveStore:
+    """
+    存档存储基类
+
+    以账号为键，读写单个存档的开销与存档总数无关
+    """
+
+    def get(self, key: str) -> Optional[SaveRecord]:
+        raise NotImplementedError
+
+    def head(self, key: str) -> Optional[tuple[int, int]]:
+        """
+        只读取 (version, updated_at)，存档不存在时返回 None
+        """
+        record = self.get(key)
+        if record is None:
+            return None
+        return record.version, record.updated_at
+
+    def put(
+        self,
+        key: str,
+        data: bytes,
+        updated_at: Optional[int] = None,
+        expect_version: Optional[int] = None,
+        raw: bool = False,
+    ) -> Optional[SaveRecord]:
+        """
+        写入存档
+
+        给出 expect_version 时只有当前版本与之相同才写入，否则返回 None，
+        expect_version 为 0 表示只在存档不存在时写入，
+        raw 标记分块上传的原始数据
+        """
+        raise NotImplementedError
+
+    def put_many(self, items: list[tuple[str, bytes, int]]) -> list[SaveRecord]:
+        """
+        批量写入 (key, data, updated_at)，键不重复
+
+        子类应在一次提交（一次 fsync）中完成
+        """
+        return [self.put(key, data, updated_at) for key, data, updated_at in items]
+
+    def delete(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def open_writer(self, key: str, size: int, updated_at: int) -> "SaveWriter":
+        """
+        分块写入一个大小已知的存档，commit 之前对读取者不可见，写入的记录标记为 raw
+        """
+        return BufferedWriter(self, key, size, updated_at)
+
+    def open_reader(self, key: str) -> Optional["SaveReader"]:
+        """
+        分块读取存档，存档不存在时返回 None
+        """
+        record = self.get(key)
+        if record is None:
+            return None
+        return BufferedReader(record)
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def cleanup(self):
+        """
+        清理中断的写入留下的数据，启动时调用
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class SaveWriter:
+    """
+    分块写入器，写满 size 个字节后调用 commit
+    """
+
+    def __init__(self, key: str, size: int, updated_at: int):
+        self.key = key
+        self.size = size
+        self.updated_at = updated_at
+        self.written = 0
+
+    def write(self, chunk: bytes):
+        if self.written + len(chunk) > self.size:
+            raise ValueError("写入的数据超过声明的大小")
+        self._write(chunk)
+        self.written += len(chunk)
+
+    def commit(self) -> SaveRecord:
+        """
+        返回的记录中 data 为空，避免把整个存档读回内存
+        """
+        if self.written != self.size:
+            raise ValueError("写入的数据少于声明的大小")
+        return self._commit()
+
+    def _write(self, chunk: bytes):
+        raise NotImplementedError
+
+    def _commit(self) -> SaveRecord:
+        raise NotImplementedError
+
+    def abort(self):
+        pass
+
+
+class SaveReader:
+    """
+    分块读取器
+    """
+
+    def __init__(self, key: str, version: int, updated_at: int, size: int):
+        self.key = key
+        self.version = version
+        self.updated_at = updated_at
+        self.size = size
+        self.offset = 0
+
+    def read(self, n: int) -> bytes:
+        """
+        读取至多 n 个字节，读完后返回空字节串
+        """
+        n = min(n, self.size - self.offset)
+        if n <= 0:
+            return b""
+        chunk = self._read(n)
+        self.offset += len(chunk)
+        return chunk
+
+    def _read(self, n: int) -> bytes:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class BufferedWriter(SaveWriter):
+    # 不支持分块写入的存储，先在内存中拼接
+    def __init__(self, store: SaveStore, key: str, size: int, updated_at: int):
+        super().__init__(key, size, updated_at)
+        self.store = store
+        self.buffer = bytearray()
+
+    def _write(self, chunk: bytes):
+        self.buffer += chunk
+
+    def _commit(self) -> SaveRecord:
+        record = self.store.put(self.key, bytes(self.buffer), self.updated_at, raw=True)
+        self.buffer = bytearray()
+        return SaveRecord(record.key, record.version, record.updated_at, b"", True)
+
+    def abort(self):
+        self.buffer = bytearray()
+
+
+class BufferedReader(SaveReader):
+    def __init__(self, record: SaveRecord):
+        super().__init__(record.key, record.version, record.updated_at, len(record.data))
+        self.data = memoryview(record.data)
+
+    def _read(self, n: int) -> bytes:
+        return bytes(self.data[self.offset : self.offset + n])
+
+
+class SQLiteStore(SaveStore):
+    """
+    SQLite 存储（WAL 模式）
+
+    以账号为主键建立索引，一个数据库文件可以放多张表。
+    存档内容单独放在 <table>_data 表中，按 (blob, seq) 分块存放，
+    元数据只记录 blob 编号，分块写入的新存档写完后整体切换
+    """
+
+    def __init__(self, path: str, table: str = "saves", fsync: bool = False):
+        if not table.isidentifier():
+            raise ValueError(f"非法的表名: {table}")
+        self.path = path
+        self.table = table
+        self.data_table = f"{table}_data"
+        self.lock = threading.Lock()
+        self.db = connect_sqlite(path)
+        self.db.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, "
+            "version INTEGER NOT NULL, "
+            "updated_at INTEGER NOT NULL, "
+            "blob INTEGER NOT NULL, "
+            "raw INTEGER NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self.db.execute(f"PRAGMA table_info({table})")}
+        if "raw" not in columns:
+            # 旧版本创建的表
+            self.db.execute(f"ALTER TABLE {table} ADD COLUMN raw INTEGER NOT NULL DEFAULT 0")
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.data_table} ("
+            "blob INTEGER NOT NULL, "
+            "seq INTEGER NOT NULL, "
+            "data BLOB NOT NULL, "
+            "UNIQUE (blob, seq))"
+        )
+
+    @staticmethod
+    def new_blob() -> int:
+        # 随机编号，多个进程同时写入也不会冲突
+        return secrets.randbits(62) + 1
+
+    def cleanup(self):
+        """
+        删除没有被引用的数据（中断的分块写入）
+        """
+        with self.lock:
+            self.db.execute(
+                f"DELETE FROM {self.data_table} WHERE blob NOT IN (SELECT blob FROM {self.table})"
+            )
+
+    def get(self, key: str) -> Optional[SaveRecord]:
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT version, updated_at, blob, raw FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            chunks = self.db.execute(
+                f"SELECT data FROM {self.data_table} WHERE blob = ? ORDER BY seq", (row[2],)
+            ).fetchall()
+        data = chunks[0][0] if len(chunks) == 1 else b"".join(c[0] for c in chunks)
+        return SaveRecord(key, row[0], row[1], bytes(data), bool(row[3]))
+
+    def head(self, key: str) -> Optional[tuple[int, int]]:
+        with self.lock:
+            return self.db.execute(
+                f"SELECT version, updated_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+    def _link(
+        self, key: str, blob: int, updated_at: int, expect_version: Optional[int], raw: bool = False
+    ) -> Optional[int]:
+        """
+        让账号指向新的数据并删除旧数据，需持有锁，返回新版本号
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            version = self._swap(key, blob, updated_at, expect_version, raw)
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return version
+
+    def _swap(
+        self, key: str, blob: int, updated_at: int, expect_version: Optional[int], raw: bool = False
+    ) -> Optional[int]:
+        # 需在事务中调用
+        old = self.db.execute(
+            f"SELECT version, blob FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if expect_version is not None and (old[0] if old else 0) != expect_version:
+            self.db.execute(f"DELETE FROM {self.data_table} WHERE blob = ?", (blob,))
+            return None
+        if old is None:
+            self.db.execute(
+                f"INSERT INTO {self.table} (key, version, updated_at, blob, raw) VALUES (?, 1, ?, ?, ?)",
+                (key, updated_at, blob, raw),
+            )
+            return 1
+        self.db.execute(
+            f"UPDATE {self.table} SET version = ?, updated_at = ?, blob = ?, raw = ? WHERE key = ?",
+            (old[0] + 1, updated_at, blob, raw, key),
+        )
+        self.db.execute(f"DELETE FROM {self.data_table} WHERE blob = ?", (old[1],))
+        return old[0] + 1
+
+    def put(
+        self,
+        key: str,
+        data: bytes,
+        updated_at: Optional[int] = None,
+        expect_version: Optional[int] = None,
+        raw: bool = False,
+    ) -> Optional[SaveRecord]:
+        if updated_at is None:
+            updated_at = now_ms()
+        blob = self.new_blob()
+        with self.lock:
+            self.db.execute(
+                f"INSERT INTO {self.data_table} (blob, seq, data) VALUES (?, 0, ?)", (blob, data)
+            )
+            version = self._link(key, blob, updated_at, expect_version, raw)
+        if version is None:
+            return None
+        return SaveRecord(key, version, updated_at, data, raw)
+
+    def put_many(self, items: list[tuple[str, bytes, int]]) -> list[SaveRecord]:
+        records = []
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for key, data, updated_at in items:
+                    blob = self.new_blob()
+                    self.db.execute(
+                        f"INSERT INTO {self.data_table} (blob, seq, data) VALUES (?, 0, ?)",
+                        (blob, data),
+                    )
+                    version = self._swap(key, blob, updated_at, None)
+                    records.append(SaveRecord(key, version, updated_at, data))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return records
+
+    def delete(self, key: str) -> bool:
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    f"DELETE FROM {self.table} WHERE key = ? RETURNING blob", (key,)
+                ).fetchone()
+                if row is not None:
+                    self.db.execute(f"DELETE FROM {self.data_table} WHERE blob = ?", (row[0],))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    def open_writer(self, key: str, size: int, updated_at: int) -> SaveWriter:
+        return SQLiteWriter(self, key, size, updated_at)
+
+    def open_reader(self, key: str) -> Optional[SaveReader]:
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT s.version, s.updated_at, s.blob, SUM(length(d.data)) FROM {self.table} s "
+                f"JOIN {self.data_table} d ON d.blob = s.blob WHERE s.key = ? GROUP BY s.blob",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return SQLiteReader(self, key, row[0], row[1], row[3], row[2])
+
+    def __len__(self) -> int:
+        with self.lock:
+            (n,) = self.db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return n
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class SQLiteWriter(SaveWriter):
+    """
+    每块作为一行单独写入（各自一个短事务），提交时切换账号指向
+    """
+
+    def __init__(self, store: SQLiteStore, key: str, size: int, updated_at: int):
+        super().__init__(key, size, updated_at)
+        self.store = store
+        self.blob = store.new_blob()
+        self.seq = 0
+
+    def _write(self, chunk: bytes):
+        with self.store.lock:
+            self.store.db.execute(
+                f"INSERT INTO {self.store.data_table} (blob, seq, data) VALUES (?, ?, ?)",
+                (self.blob, self.seq, chunk),
+            )
+        self.seq += 1
+
+    def _commit(self) -> SaveRecord:
+        with self.store.lock:
+            version = self.store._link(self.key, self.blob, self.updated_at, None, True)
+        self.blob = None
+        return SaveRecord(self.key, version, self.updated_at, b"", True)
+
+    def abort(self):
+        if self.blob is None:
+            return
+        with self.store.lock:
+            self.store.db.execute(f"DELETE FROM {self.store.data_table} WHERE blob = ?", (self.blob,))
+        self.blob = None
+
+
+class SQLiteReader(SaveReader):
+    def __init__(self, store: SQLiteStore, key: str, version: int, updated_at: int, size: int, blob: int):
+        super().__init__(key, version, updated_at, size)
+        self.store = store
+        self.blob = blob
+        self.seq = 0
+        self.buffer = memoryview(b"")
+
+    def _read(self, n: int) -> bytes:
+        if not self.buffer:
+            with self.store.lock:
+                row = self.store.db.execute(
+                    f"SELECT data FROM {self.store.data_table} WHERE blob = ? AND seq = ?",
+                    (self.blob, self.seq),
+                ).fetchone()
+            if row is None:
+                # 读取途中存档被替换，旧数据已被删除
+                raise StoreChanged(self.key)
+            self.buffer = memoryview(row[0])
+            self.seq += 1
+        chunk, self.buffer = self.buffer[:n], self.buffer[n:]
+        return bytes(chunk)
+
+
+class LogStore(SaveStore):
+    """
+    追加写日志存储
+
+    每次写入都追加到文件末尾，内存中保存 账号 -> 文件偏移 的索引，
+    读取时直接按偏移读出，启动时扫描日志重建索引
+
+    记录格式: 头部 | 账号 | 数据，头部包含操作类型、长度、版本、时间戳和 CRC32，
+    分块上传的原始数据以 OP_RAW 记录
+
+    auto_compact 为真时，写入后失效的字节数超过 COMPACT_MIN 且多于有效字节数就压缩日志
+    """
+
+    HEADER = struct.Struct("<BHIqqI")  # op, key_len, data_len, version, updated_at, crc
+    OP_PUT = 1
+    OP_DEL = 2
+    OP_RAW = 3
+    COPY_CHUNK = 1024 * 1024
+    IOV_MAX = os.sysconf("SC_IOV_MAX") if "SC_IOV_MAX" in os.sysconf_names else 1024
+    COMPACT_MIN = 64 * 1024 * 1024
+
+    def __init__(self, path: str, fsync: bool = False, auto_compact: bool = True):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self.auto_compact = auto_compact
+        self.lock = threading.Lock()
+        # 账号 -> (数据偏移, 数据长度, 版本, 时间戳, 是否为原始数据)
+        self.index: dict[str, tuple[int, int, int, int, bool]] = {}
+        self.garbage = 0  # 已失效的字节数
+        self.writers = 0  # 进行中的分块写入
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._load()
+
+    def _crc(self, offset: int, length: int) -> int:
+        crc = 0
+        end = offset + length
+        while offset < end:
+            chunk = os.pread(self.fd, min(self.COPY_CHUNK, end - offset), offset)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            offset += len(chunk)
+        return crc
+
+    def _load(self):
+        """
+        扫描日志重建索引，截掉末尾不完整的记录
+
+        校验失败但长度完整的记录（中断的分块写入）直接跳过
+        """
+        size = os.fstat(self.fd).st_size
+        offset = 0
+        header_size = self.HEADER.size
+        while offset + header_size <= size:
+            header = os.pread(self.fd, header_size, offset)
+            op, key_len, data_len, version, updated_at, crc = self.HEADER.unpack(header)
+            end = offset + header_size + key_len + data_len
+            if op not in (self.OP_PUT, self.OP_DEL, self.OP_RAW) or end > size:
+                break
+            if self._crc(offset + header_size, key_len + data_len) != crc:
+                self.garbage += end - offset
+                offset = end
+                continue
+            key = os.pread(self.fd, key_len, offset + header_size).decode("utf-8")
+            old = self.index.pop(key, None)
+            if old is not None:
+                self.garbage += self.HEADER.size + len(key.encode("utf-8")) + old[1]
+            if op != self.OP_DEL:
+                self.index[key] = (
+                    offset + header_size + key_len, data_len, version, updated_at, op == self.OP_RAW
+                )
+            else:
+                self.garbage += end - offset
+            offset = end
+
+        if offset != size:
+            # 上次写入时崩溃留下的残缺记录
+            os.ftruncate(self.fd, offset)
+        self.tail = offset
+
+    def _append(self, op: int, key: bytes, data: bytes, version: int, updated_at: int) -> int:
+        body = key + data
+        header = self.HEADER.pack(op, len(key), len(data), version, updated_at, zlib.crc32(body))
+        offset = self.tail
+        os.pwrite(self.fd, header + body, offset)
+        if self.fsync:
+            os.fsync(self.fd)
+        self.tail = offset + len(header) + len(body)
+        return offset + len(header) + len(key)
+
+    def _replace(
+        self, key: str, offset: int, length: int, version: int, updated_at: int, raw: bool = False
+    ):
+        # 需持有锁
+        old = self.index.get(key)
+        if old is not None:
+            self.garbage += self.HEADER.size + len(key.encode("utf-8")) + old[1]
+        self.index[key] = (offset, length, version, updated_at, raw)
+
+    def get(self, key: str) -> Optional[SaveRecord]:
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            offset, length, version, updated_at, raw = entry
+            data = os.pread(self.fd, length, offset)
+        return SaveRecord(key, version, updated_at, data, raw)
+
+    def head(self, key: str) -> Optional[tuple[int, int]]:
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        return entry[2], entry[3]
+
+    def put(
+        self,
+        key: str,
+        data: bytes,
+        updated_at: Optional[int] = None,
+        expect_version: Optional[int] = None,
+        raw: bool = False,
+    ) -> Optional[SaveRecord]:
+        if updated_at is None:
+            updated_at = now_ms()
+        raw_key = key.encode("utf-8")
+        with self.lock:
+            old = self.index.get(key)
+            if expect_version is not None and (old[2] if old else 0) != expect_version:
+                return None
+            version = old[2] + 1 if old else 1
+            op = self.OP_RAW if raw else self.OP_PUT
+            offset = self._append(op, raw_key, data, version, updated_at)
+            self._replace(key, offset, len(data), version, updated_at, raw)
+            self._maybe_compact()
+        return SaveRecord(key, version, updated_at, data, raw)
+
+    def put_many(self, items: list[tuple[str, bytes, int]]) -> list[SaveRecord]:
+        records, buffers, entries = [], [], []
+        with self.lock:
+            offset = self.tail
+            for key, data, updated_at in items:
+                raw_key = key.encode("utf-8")
+                old = self.index.get(key)
+                version = old[2] + 1 if old else 1
+                header = self.HEADER.pack(
+                    self.OP_PUT, len(raw_key), len(data), version, updated_at,
+                    zlib.crc32(data, zlib.crc32(raw_key)),
+                )
+                buffers += (header, raw_key, data)
+                offset += len(header) + len(raw_key)
+                records.append(SaveRecord(key, version, updated_at, data))
+                entries.append((key, offset, len(data), version, updated_at))
+                offset += len(data)
+            # 整批写入、一次 fsync，写入成功后才更新索引
+            self._writev(buffers, self.tail)
+            if self.fsync:
+                os.fsync(self.fd)
+            self.tail = offset
+            for entry in entries:
+                self._replace(*entry)
+            self._maybe_compact()
+        return records
+
+    def _writev(self, buffers: list[bytes], offset: int):
+        """
+        按 IOV_MAX 分段调用 pwritev，处理部分写入
+        """
+        views = [memoryview(b) for b in buffers if b]
+        i = 0
+        while i < len(views):
+            written = os.pwritev(self.fd, views[i : i + self.IOV_MAX], offset)
+            if written <= 0:
+                raise OSError("pwritev 未写入任何数据")
+            offset += written
+            while written:
+                if written >= len(views[i]):
+                    written -= len(views[i])
+                    i += 1
+                else:
+                    views[i] = views[i][written:]
+                    written = 0
+
+    def delete(self, key: str) -> bool:
+        raw_key = key.encode("utf-8")
+        with self.lock:
+            old = self.index.pop(key, None)
+            if old is None:
+                return False
+            self._append(self.OP_DEL, raw_key, b"", old[2], now_ms())
+            self.garbage += 2 * self.HEADER.size + 2 * len(raw_key) + old[1]
+            self._maybe_compact()
+        return True
+
+    def open_writer(self, key: str, size: int, updated_at: int) -> SaveWriter:
+        return LogWriter(self, key, size, updated_at)
+
+    def open_reader(self, key: str) -> Optional[SaveReader]:
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            # 复制文件描述符，压缩替换日志文件后仍能读到旧文件
+            fd = os.dup(self.fd)
+        offset, length, version, updated_at, _ = entry
+        return LogReader(fd, offset, key, version, updated_at, length)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def compact(self):
+        """
+        只保留每个账号的最新记录，重写日志文件
+        """
+        with self.lock:
+            if self.writers:
+                raise RuntimeError("有进行中的分块写入，无法压缩")
+            self._compact()
+
+    def _maybe_compact(self):
+        # 需持有锁
+        if (
+            self.auto_compact
+            and not self.writers
+            and self.garbage >= self.COMPACT_MIN
+            and self.garbage > self.tail - self.garbage
+        ):
+            self._compact()
+
+    def _compact(self):
+        # 需持有锁
+        tmp_path = self.path + ".compact"
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        index = {}
+        tail = 0
+        try:
+            for key, (offset, length, version, updated_at, raw) in self.index.items():
+                # 原样复制 头部 + 账号 + 数据，CRC 不变
+                prefix = self.HEADER.size + len(key.encode("utf-8"))
+                src, end = offset - prefix, offset + length
+                index[key] = (tail + prefix, length, version, updated_at, raw)
+                while src < end:
+                    chunk = os.pread(self.fd, min(self.COPY_CHUNK, end - src), src)
+                    os.pwrite(fd, chunk, tail)
+                    src += len(chunk)
+                    tail += len(chunk)
+            os.fsync(fd)
+        except BaseException:
+            os.close(fd)
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, self.path)
+        os.close(self.fd)
+        self.fd = fd
+        self.index = index
+        self.tail = tail
+        self.garbage = 0
+
+    def close(self):
+        with self.lock:
+            os.close(self.fd)
+
+
+class LogWriter(SaveWriter):
+    """
+    在日志末尾预留整条记录的空间，数据直接写入预留区域，
+    写完后补写带 CRC 的头部。中断的写入在重启扫描时因校验失败被跳过
+    """
+
+    def __init__(self, store: LogStore, key: str, size: int, updated_at: int):
+        super().__init__(key, size, updated_at)
+        self.store = store
+        self.raw_key = key.encode("utf-8")
+        self.crc = zlib.crc32(self.raw_key)
+        with store.lock:
+            self.offset = store.tail
+            store.tail += store.HEADER.size + len(self.raw_key) + size
+            store.writers += 1
+            # 头部 CRC 先写 0，保证未完成的记录无法通过校验
+            header = store.HEADER.pack(store.OP_PUT, len(self.raw_key), size, 0, updated_at, 0)
+            os.pwrite(store.fd, header + self.raw_key, self.offset)
+        self.data_offset = self.offset + store.HEADER.size + len(self.raw_key)
+        self.done = False
+
+    def _write(self, chunk: bytes):
+        os.pwrite(self.store.fd, chunk, self.data_offset + self.written)
+        self.crc = zlib.crc32(chunk, self.crc)
+
+    def _commit(self) -> SaveRecord:
+        store = self.store
+        with store.lock:
+            old = store.index.get(self.key)
+            version = old[2] + 1 if old else 1
+            header = store.HEADER.pack(
+                store.OP_RAW, len(self.raw_key), self.size, version, self.updated_at, self.crc
+            )
+            if store.fsync:
+                os.fsync(store.fd)
+            os.pwrite(store.fd, header, self.offset)
+            if store.fsync:
+                os.fsync(store.fd)
+            store._replace(self.key, self.data_offset, self.size, version, self.updated_at, True)
+            store.writers -= 1
+            store._maybe_compact()
+        self.done = True
+        return SaveRecord(self.key, version, self.updated_at, b"", True)
+
+    def abort(self):
+        if self.done:
+            return
+        with self.store.lock:
+            # 预留区域成为垃圾，留给 compact 回收
+            self.store.garbage += self.store.HEADER.size + len(self.raw_key) + self.size
+            self.store.writers -= 1
+            self.store._maybe_compact()
+        self.done = True
+
+
+class LogReader(SaveReader):
+    def __init__(self, fd: int, data_offset: int, key: str, version: int, updated_at: int, size: int):
+        super().__init__(key, version, updated_at, size)
+        self.fd = fd
+        self.data_offset = data_offset
+
+    def _read(self, n: int) -> bytes:
+        return os.pread(self.fd, n, self.data_offset + self.offset)
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class NameRegistry:
+    """
+    多进程共享的客户端名称登记表
+
+    多进程模式下每个进程各有一个 ConnectionManager，名称唯一性由这张表保证，
+    表中记录持有名称的进程号，进程退出后其登记的名称可以被重新占用
+    """
+
+    def __init__(self, path: str, table: str = "sessions"):
+        if not table.isidentifier():
+            raise ValueError(f"非法的表名: {table}")
+        self.table = table
+        self.lock = threading.Lock()
+        self.db = connect_sqlite(path)
+        self.db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (name TEXT PRIMARY KEY, pid INTEGER NOT NULL)"
+        )
+
+    def claim(self, name: str, pid: int, takeover: bool = False) -> bool:
+        """
+        为进程 pid 登记名称，已被其他存活的进程持有且不取代时返回 False
+        """
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    f"SELECT pid FROM {self.table} WHERE name = ?", (name,)
+                ).fetchone()
+                ok = row is None or row[0] == pid or takeover or not pid_alive(row[0])
+                if ok:
+                    self.db.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (name, pid) VALUES (?, ?)", (name, pid)
+                    )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        return ok
+
+    def release(self, name: str, pid: int):
+        with self.lock:
+            self.db.execute(f"DELETE FROM {self.table} WHERE name = ? AND pid = ?", (name, pid))
+
+    def owned(self, pid: int) -> set[str]:
+        with self.lock:
+            rows = self.db.execute(f"SELECT name FROM {self.table} WHERE pid = ?", (pid,)).fetchall()
+        return {r[0] for r in rows}
+
+    def purge(self, pid: int):
+        """
+        删除某个进程登记的全部名称（进程退出后调用）
+        """
+        with self.lock:
+            self.db.execute(f"DELETE FROM {self.table} WHERE pid = ?", (pid,))
+
+    def clear(self):
+        with self.lock:
+            self.db.execute(f"DELETE FROM {self.table}")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def open_store(url: str, table: str = "saves") -> SaveStore:
+    """
+    根据地址打开存储
+
+    - sqlite:<文件>  SQLite 数据库，table 作为表名
+    - log:<目录>     追加写日志，table 作为日志文件名
+    """
+    scheme, _, path = url.partition(":")
+    if scheme == "sqlite":
+        return SQLiteStore(path, table)
+    if scheme == "log":
+        return LogStore(os.path.join(path, f"{table}.log"))
+    raise ValueError(f"未知的存储类型: {url}")
@@ -0,0 +1,98 @@
+"""
+存档分块传输
+
+大存档按块上传和下载，边接收边校验边写入存储，
+单次传输占用的内存只与块大小有关
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+from typing import Optional
+
+from storage import SaveRecord, SaveReader, SaveWriter
+
+CHUNK_SIZE = 64 * 1024  # 每块最大字节数
+MAX_SAVE_SIZE = 256 * 1024 * 1024
+
+
+class TransferError(ValueError):
+    pass
+
+
+def chunk_bytes(value) -> bytes:
+    """
+    取出块数据，JSON 编码下为 base64 字符串，二进制编码下为 bytes
+    """
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        try:
+            return base64.b64decode(value, validate=True)
+        except binascii.Error as e:
+            raise TransferError("块数据不是合法的 base64") from e
+    raise TransferError("缺少块数据")
+
+
+class Upload:
+    """
+    一次分块上传
+
+    块必须按序号依次到达，全部写完且 SHA-256 一致后提交
+    """
+
+    def __init__(self, tid: int, writer: SaveWriter, sha256: str):
+        self.tid = tid
+        self.writer = writer
+        self.expect = sha256.lower()
+        self.hash = hashlib.sha256()
+        self.seq = 0
+        # 同一传输的块在各自的任务中处理，用锁保证按到达顺序写入
+        self.lock = asyncio.Lock()
+
+    def feed(self, seq: int, chunk: bytes) -> Optional[SaveRecord]:
+        """
+        写入一块，最后一块写完后提交并返回记录；在线程中调用
+        """
+        if seq != self.seq:
+            raise TransferError(f"块序号错误，期望 {self.seq}")
+        if len(chunk) > CHUNK_SIZE:
+            raise TransferError("块过大")
+        try:
+            self.writer.write(chunk)
+        except ValueError as e:
+            raise TransferError(str(e)) from e
+        self.hash.update(chunk)
+        self.seq += 1
+
+        if self.writer.written < self.writer.size:
+            return None
+        if self.hash.hexdigest() != self.expect:
+            raise TransferError("校验失败")
+        return self.writer.commit()
+
+    def abort(self):
+        self.writer.abort()
+
+
+class Download:
+    """
+    一次分块下载，边读边计算 SHA-256
+    """
+
+    def __init__(self, tid: int, reader: SaveReader):
+        self.tid = tid
+        self.reader = reader
+        self.hash = hashlib.sha256()
+        self.seq = 0
+
+    def next_chunk(self) -> bytes:
+        """
+        读取下一块，读完返回空字节串；在线程中调用
+        """
+        chunk = self.reader.read(CHUNK_SIZE)
+        self.hash.update(chunk)
+        return chunk
+
+    def close(self):
+        self.reader.close()
@@ -0,0 +1,152 @@
+"""
+存档延迟写入
+
+上传的完整存档先放入内存队列，在一个短窗口内合并同一账号的多次上传（只保留最后一次），
+再整批调用 SaveStore.put_many 一次提交，减少事务与 fsync 次数
+"""
+import asyncio
+import logging
+from typing import Callable, Optional
+
+from storage import SaveRecord, SaveStore
+
+logger = logging.getLogger("writebehind")
+
+
+def _consume(fut: asyncio.Future):
+    # 只入队不等待的写入失败时已记录日志，这里避免“异常未被获取”的警告
+    if not fut.cancelled():
+        fut.exception()
+
+
+class WriteBehind:
+    """
+    Attributes:
+        window: 收到第一个写入后等待合并的时间（秒）
+        max_batch: 单次提交的最大账号数，达到后立即提交
+        on_commit: 每个账号提交成功后调用，用于使缓存失效
+    """
+
+    def __init__(
+        self,
+        store: SaveStore,
+        window: float = 0.005,
+        max_batch: int = 512,
+        on_commit: Optional[Callable[[SaveRecord], None]] = None,
+    ):
+        self.store = store
+        self.window = window
+        self.max_batch = max_batch
+        self.on_commit = on_commit
+        self.pending: dict[str, tuple[bytes, int]] = {}  # 账号 -> (数据, 时间戳)
+        self.committing: dict[str, tuple[bytes, int]] = {}  # 正在提交的批次
+        # 批次提交后得到 账号 -> SaveRecord
+        self.pending_done: Optional[asyncio.Future] = None
+        self.committing_done: Optional[asyncio.Future] = None
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task: Optional[asyncio.Task] = None
+        self.commits = 0  # 提交的批次数
+        self.written = 0  # 实际写入的存档数
+        self.coalesced = 0  # 被合并掉的上传数
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def submit(self, key: str, data: bytes, updated_at: int) -> asyncio.Future:
+        """
+        加入队列，返回所在批次的 Future，提交后得到 账号 -> SaveRecord
+
+        同一账号在提交前的多次上传会合并，只写入最后一次
+        """
+        self.start()
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = (data, updated_at)
+        if self.pending_done is None:
+            self.pending_done = asyncio.get_running_loop().create_future()
+            self.pending_done.add_done_callback(_consume)
+        self.idle.clear()
+        self.wakeup.set()
+        if len(self.pending) >= self.max_batch:
+            self.full.set()
+        return self.pending_done
+
+    async def commit_one(self, key: str, data: bytes, updated_at: int) -> SaveRecord:
+        """
+        加入队列并等待提交
+        """
+        return (await self.submit(key, data, updated_at))[key]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.pending or key in self.committing
+
+    async def settle(self, key: str):
+        """
+        等待账号尚未提交的写入落盘，之后读取存储即可得到最新存档
+        """
+        for batch, done in ((self.committing, self.committing_done), (self.pending, self.pending_done)):
+            if key in batch and done is not None:
+                await asyncio.wait([done])
+
+    async def flush(self):
+        """
+        等待队列中的所有写入提交
+        """
+        if self.pending:
+            self.full.set()
+        await self.idle.wait()
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            if not self.full.is_set():
+                try:
+                    await asyncio.wait_for(self.full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            self.full.clear()
+            await self.commit()
+            if self.pending:
+                self.wakeup.set()
+            else:
+                self.idle.set()
+
+    async def commit(self):
+        if not self.pending:
+            return
+        self.committing, self.pending = self.pending, {}
+        self.committing_done, self.pending_done = self.pending_done, None
+        items = [(key, data, updated_at) for key, (data, updated_at) in self.committing.items()]
+        try:
+            records = await asyncio.to_thread(self.store.put_many, items)
+        except Exception as e:
+            logger.exception("批量写入 %d 个存档失败", len(items))
+            self.committing_done.set_exception(e)
+            return
+        finally:
+            self.committing = {}
+        self.commits += 1
+        self.written += len(records)
+        if self.on_commit is not None:
+            for record in records:
+                self.on_commit(record)
+        self.committing_done.set_result({record.key: record for record in records})
+
+    async def close(self):
+        await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.pending),
+            "commits": self.commits,
+            "written": self.written,
+            "coalesced": self.coalesced,
+        }